@@ -6,7 +6,15 @@ import random
 import math
 import json
 import os
-from typing import List, Dict, Optional, Tuple, Union, Set, Any
+import time
+from collections.abc import Sequence, Set as AbstractSet, Mapping
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import List, Dict, Optional, Tuple, Union, Set, Any, Callable, NamedTuple
+
+from story_graph import StoryGraph, Node, Choice, Cursor, StateView, open_story, DEFAULT_STATS, STAT_MIN, STAT_MAX
+from story_engine import StoryEngine, DialogBacklog, BACKLOG_SIZE, READ_FLUSH_BATCH
+from story_reload import HotReloader, StoryReload, LocaleReload
 
 # Размеры окна
 SCREEN_WIDTH = 800
@@ -35,6 +43,309 @@ UI_CHOICE_BG = (30, 30, 70, 240)  # Полупрозрачный фон выбо
 UI_BUTTON_COLOR = BLUE_BUTTON
 UI_BUTTON_HOVER = BLUE_BUTTON_HOVER
 
+# Отладка: подсчёт выделений Surface/шрифтов по кадрам (ROY_DEBUG_ALLOC=1)
+DEBUG_ALLOCATIONS = os.environ.get("ROY_DEBUG_ALLOC", "") not in ("", "0")
+ALLOC_REPORT_INTERVAL = 1.0  # секунд между отчётами
+ALLOC_STEADY_FRAMES = 30  # кадров подряд, после которых место считается "постоянным"
+
+
+class AllocationTracker:
+    """
+    Отладочный счётчик создания Surface и шрифтов.
+
+    Подменяет конструкторы pygame (Surface, Font, SysFont, Font.render,
+    transform.*) и привязывает каждое выделение к месту вызова (файл:строка).
+    Границей кадра считается pygame.display.flip()/update(), поэтому
+    трекер работает с любым игровым циклом без его изменения.
+    """
+
+    TRANSFORM_FUNCS = ("scale", "smoothscale", "rotate", "rotozoom", "flip")
+
+    def __init__(self, report_interval: float = ALLOC_REPORT_INTERVAL,
+                 steady_frames: int = ALLOC_STEADY_FRAMES):
+        self.report_interval = report_interval
+        self.steady_frames = steady_frames
+        self.enabled = False
+
+        self.frame_count = 0
+        self.frame_sites: Dict[Tuple[str, int, str, str], int] = {}  # Выделения текущего кадра
+        self.sites: Dict[Tuple[str, int, str, str], Dict[str, int]] = {}  # Накопленная статистика
+        self.steady_sites: Set[Tuple[str, int, str, str]] = set()
+
+        self._report_frames = 0
+        self._report_allocs = 0
+        self._report_bytes = 0
+        self._last_report = time.perf_counter()
+        self._originals: Dict[Tuple[Any, str], Any] = {}
+        self._in_sysfont = False
+
+    def enable(self) -> None:
+        """Включает подмену конструкторов pygame"""
+        if self.enabled:
+            return
+        tracker = self
+
+        class TrackedSurface(pygame.Surface):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                tracker._record("Surface", self.get_width() * self.get_height() * self.get_bytesize())
+
+        class TrackedFont(pygame.font.Font):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                if not tracker._in_sysfont:  # SysFont учитывается своей обёрткой
+                    tracker._record("Font", 0)
+
+            def render(self, *args, **kwargs):
+                result = super().render(*args, **kwargs)
+                tracker._record("Font.render", tracker._surface_bytes(result))
+                return result
+
+        original_sysfont = pygame.font.SysFont
+
+        def tracked_sysfont(name, size, bold=False, italic=False, constructor=None):
+            def construct(fontpath, font_size, font_bold, font_italic):
+                font = TrackedFont(fontpath, font_size)
+                if font_bold:
+                    font.set_bold(True)
+                if font_italic:
+                    font.set_italic(True)
+                return font
+
+            tracker._in_sysfont = True
+            try:
+                font = original_sysfont(name, size, bold, italic, constructor or construct)
+            finally:
+                tracker._in_sysfont = False
+            tracker._record("SysFont", 0)
+            return font
+
+        self._patch(pygame, "Surface", TrackedSurface)
+        self._patch(pygame.font, "Font", TrackedFont)
+        self._patch(pygame.font, "SysFont", tracked_sysfont)
+
+        for func_name in self.TRANSFORM_FUNCS:
+            self._patch(pygame.transform, func_name,
+                        self._wrap_allocator(getattr(pygame.transform, func_name), f"transform.{func_name}"))
+
+        for func_name in ("flip", "update"):
+            self._patch(pygame.display, func_name, self._wrap_present(getattr(pygame.display, func_name)))
+
+        self.enabled = True
+        print("Отслеживание выделений Surface/шрифтов включено")
+
+    def disable(self) -> None:
+        """Восстанавливает оригинальные функции pygame"""
+        for (module, name), original in self._originals.items():
+            setattr(module, name, original)
+        self._originals.clear()
+        self.enabled = False
+
+    def _patch(self, module: Any, name: str, replacement: Any) -> None:
+        """Подменяет атрибут модуля, запоминая оригинал"""
+        self._originals[(module, name)] = getattr(module, name)
+        setattr(module, name, replacement)
+
+    def _wrap_allocator(self, func, kind: str):
+        """Оборачивает функцию, возвращающую новую Surface"""
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            # Вывод в готовую поверхность (dest_surface) выделением не считается
+            if not any(result is arg for arg in args) and not any(result is arg for arg in kwargs.values()):
+                self._record(kind, self._surface_bytes(result))
+            return result
+        return wrapper
+
+    def _wrap_present(self, func):
+        """Оборачивает вывод кадра на экран: после него кадр считается завершённым"""
+        def wrapper(*args, **kwargs):
+            result = func(*args, **kwargs)
+            self.end_frame()
+            return result
+        return wrapper
+
+    @staticmethod
+    def _surface_bytes(surface: Any) -> int:
+        """Размер пиксельных данных поверхности в байтах"""
+        try:
+            return surface.get_width() * surface.get_height() * surface.get_bytesize()
+        except (AttributeError, pygame.error):
+            return 0
+
+    def _record(self, kind: str, nbytes: int) -> None:
+        """Записывает выделение; место вызова - второй кадр стека над _record"""
+        caller = sys._getframe(2)
+        site = (os.path.basename(caller.f_code.co_filename), caller.f_lineno, caller.f_code.co_name, kind)
+
+        self.frame_sites[site] = self.frame_sites.get(site, 0) + 1
+        stats = self.sites.get(site)
+        if stats is None:
+            stats = self.sites[site] = {"count": 0, "bytes": 0, "streak": 0,
+                                        "window_count": 0, "window_bytes": 0}
+        stats["count"] += 1
+        stats["bytes"] += nbytes
+        stats["window_count"] += 1
+        stats["window_bytes"] += nbytes
+
+        self._report_allocs += 1
+        self._report_bytes += nbytes
+
+    def end_frame(self) -> None:
+        """Закрывает кадр: обновляет серии выделений и при необходимости печатает отчёт"""
+        self.frame_count += 1
+        self._report_frames += 1
+
+        for site, stats in self.sites.items():
+            if site in self.frame_sites:
+                stats["streak"] += 1
+                if stats["streak"] >= self.steady_frames and site not in self.steady_sites:
+                    self.steady_sites.add(site)
+                    print(f"[alloc] постоянное выделение каждый кадр: {self._format_site(site)}")
+            else:
+                stats["streak"] = 0
+                self.steady_sites.discard(site)
+        self.frame_sites.clear()
+
+        now = time.perf_counter()
+        elapsed = now - self._last_report
+        if elapsed >= self.report_interval:
+            self.report(elapsed)
+            self._last_report = now
+
+    def report(self, elapsed: float, top: int = 8) -> None:
+        """Печатает сводку за последний интервал"""
+        frames = max(1, self._report_frames)
+        print(f"[alloc] кадров: {self._report_frames}, "
+              f"выделений/кадр: {self._report_allocs / frames:.1f}, "
+              f"{self._report_bytes / 1024 / elapsed:.1f} КБ/с")
+
+        active = [(site, stats) for site, stats in self.sites.items() if stats["window_count"]]
+        active.sort(key=lambda item: (item[1]["window_bytes"], item[1]["window_count"]), reverse=True)
+        for site, stats in active[:top]:
+            marker = " [steady]" if site in self.steady_sites else ""
+            print(f"    {self._format_site(site):<50} "
+                  f"{stats['window_count'] / elapsed:7.1f}/с "
+                  f"{stats['window_bytes'] / 1024 / elapsed:9.1f} КБ/с{marker}")
+
+        for stats in self.sites.values():
+            stats["window_count"] = 0
+            stats["window_bytes"] = 0
+        self._report_frames = 0
+        self._report_allocs = 0
+        self._report_bytes = 0
+
+    @staticmethod
+    def _format_site(site: Tuple[str, int, str, str]) -> str:
+        filename, lineno, func, kind = site
+        return f"{filename}:{lineno} {func}() {kind}"
+
+
+alloc_tracker = AllocationTracker()
+if DEBUG_ALLOCATIONS:
+    alloc_tracker.enable()
+
+# Отладка: профиль кадров и загрузки CPU (ROY_DEBUG_PROFILE=1)
+DEBUG_PROFILE = os.environ.get("ROY_DEBUG_PROFILE", "") not in ("", "0")
+PROFILE_REPORT_INTERVAL = 5.0  # секунд между отчётами
+
+
+class FrameProfiler:
+    """
+    Профиль частоты кадров и процессорного времени.
+
+    Время раздельно учитывается для активного окна и для фона (окно
+    без фокуса, свёрнуто или на паузе), чтобы в отчёте была видна
+    экономия CPU от фонового режима.
+    """
+
+    MODES = ("foreground", "background")
+
+    def __init__(self, enabled: bool = DEBUG_PROFILE, report_interval: float = PROFILE_REPORT_INTERVAL):
+        self.enabled = enabled
+        self.report_interval = report_interval
+        self.totals = {mode: {"frames": 0, "wall": 0.0, "cpu": 0.0} for mode in self.MODES}
+        self.window = {mode: {"frames": 0, "wall": 0.0, "cpu": 0.0} for mode in self.MODES}
+        self._last_wall = time.perf_counter()
+        self._last_cpu = time.process_time()
+        self._last_report = self._last_wall
+        self._mode = "foreground"
+
+    def sample(self, background: bool, rendered: bool = True) -> None:
+        """Отмечает итерацию цикла; прошедшее время относится к предыдущему режиму"""
+        if not self.enabled:
+            return
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        for stats in (self.totals[self._mode], self.window[self._mode]):
+            stats["wall"] += wall - self._last_wall
+            stats["cpu"] += cpu - self._last_cpu
+            stats["frames"] += int(rendered)
+        self._last_wall = wall
+        self._last_cpu = cpu
+        self._mode = "background" if background else "foreground"
+
+        if wall - self._last_report >= self.report_interval:
+            self.report()
+            self._last_report = wall
+
+    @staticmethod
+    def _rates(stats: Dict[str, float]) -> Tuple[float, float]:
+        """Кадров в секунду и доля CPU в процентах"""
+        if stats["wall"] <= 0:
+            return 0.0, 0.0
+        return stats["frames"] / stats["wall"], 100 * stats["cpu"] / stats["wall"]
+
+    def report(self) -> None:
+        """Печатает сводку за интервал и оценку экономии CPU в фоне"""
+        parts = []
+        for mode in self.MODES:
+            if self.window[mode]["wall"] > 0:
+                fps, cpu = self._rates(self.window[mode])
+                parts.append(f"{mode}: {fps:.1f} кадров/с, CPU {cpu:.1f}%")
+        print("[profile] " + "; ".join(parts))
+
+        _, fg_cpu = self._rates(self.totals["foreground"])
+        _, bg_cpu = self._rates(self.totals["background"])
+        if self.totals["foreground"]["wall"] > 0 and self.totals["background"]["wall"] > 0:
+            print(f"[profile] экономия в фоне: {fg_cpu - bg_cpu:.1f}% CPU "
+                  f"({self.totals['background']['wall']:.0f} с в фоне)")
+
+        for stats in self.window.values():
+            stats.update(frames=0, wall=0.0, cpu=0.0)
+
+
+class GameClock:
+    """Игровое время: тики pygame без учёта пауз (например, свёрнутого окна)"""
+
+    def __init__(self):
+        self.paused_total = 0  # Суммарная длительность пауз, мс
+        self.paused_at: Optional[int] = None
+
+    @property
+    def paused(self) -> bool:
+        return self.paused_at is not None
+
+    def pause(self) -> None:
+        """Останавливает игровое время"""
+        if self.paused_at is None:
+            self.paused_at = pygame.time.get_ticks()
+
+    def resume(self) -> None:
+        """Продолжает игровое время с момента паузы"""
+        if self.paused_at is not None:
+            self.paused_total += pygame.time.get_ticks() - self.paused_at
+            self.paused_at = None
+
+    def get_ticks(self) -> int:
+        """Миллисекунды игрового времени"""
+        now = self.paused_at if self.paused_at is not None else pygame.time.get_ticks()
+        return now - self.paused_total
+
+
+game_clock = GameClock()
+
+pygame.init()
+
 # Настройки шрифтов
 FONT_LARGE = pygame.font.SysFont("Courier New", 36, bold=True)
 FONT_MEDIUM = pygame.font.SysFont("Courier New", 24, bold=True)
@@ -46,12 +357,23 @@ MAX_ZOOM = 20.0
 ZOOM_SPEED = 0.1
 STAR_COUNT = 200
 PARTICLE_COUNT = 20
+FPS = 60
+IDLE_MAX_WAIT = 1000  # мс: максимальное ожидание событий в режиме простоя
+SKIP_SPEED = 400  # Реплик в секунду при промотке прочитанного
+RESOLUTIONS = ("800x600", "1200x900", "1600x1200")  # Размеры окна в настройках (холст масштабируется)
+TITLE_BLINK_PERIOD = 500  # мс
 
 # Пути к файлам
 MUSIC_FOLDER = "music"
 SAVE_FILE = "game_save.json"
 SETTINGS_FILE = "game_settings.json"
 STORY_FILE = "story.json"
+STORY_PACK_FILE = "story.pack"  # Контейнер сцен, пересобирается из STORY_FILE
+READ_FILE = "read_lines.json"  # Реплики, прочитанные во всех прохождениях
+
+# Разработка: перечитывать story.json и locales.json во время игры (ROY_HOT_RELOAD=1)
+HOT_RELOAD = os.environ.get("ROY_HOT_RELOAD", "") not in ("", "0")
+HOT_RELOAD_EVENT = pygame.event.custom_type()  # Будит главный цикл, когда перезагрузка готова
 IMAGE_PATTERN = "pics/image{}.jpg"
 
 # Состояния игры
@@ -80,6 +402,7 @@ class Locale:
     def __init__(self, file_path: str = 'locales.json'):
         self.translations: Dict[str, Any] = {}
         self.default_lang = "ru"
+        self.revision = 0  # Растёт при смене языка и правке переводов (ключ кэшей отрисовки)
         self.load_translations(Path(__file__).parent / file_path)
 
     def load_translations(self, file_path: Path) -> None:
@@ -122,6 +445,20 @@ class Locale:
         """Устанавливает язык по умолчанию"""
         if lang in self.translations:
             self.default_lang = lang
+            self.revision += 1
+
+    def patch(self, sections: Mapping[Tuple[str, str], Any]) -> None:
+        """
+        Подменяет разделы переводов, не перечитывая файл.
+
+        :param sections: (язык, раздел) -> новое содержимое; None удаляет раздел
+        """
+        for (lang, section), value in sections.items():
+            if value is None:
+                self.translations.get(lang, {}).pop(section, None)
+            else:
+                self.translations.setdefault(lang, {})[section] = value
+        self.revision += 1
 
 class MusicPlayer:
     def __init__(self, music_folder="music", volume=0.5):
@@ -129,6 +466,7 @@ class MusicPlayer:
         self.playlist = []
         self.current_track_index = 0
         self.volume = volume
+        self.duck_factor = 1.0  # Множитель громкости при приглушении (окно без фокуса)
         self._original_playlist = []  # Для сохранения оригинального порядка
 
         # Инициализация микшера pygame с оптимальными параметрами
@@ -188,7 +526,7 @@ class MusicPlayer:
 
         try:
             pygame.mixer.music.load(str(self.playlist[self.current_track_index]))
-            pygame.mixer.music.set_volume(self.volume)
+            pygame.mixer.music.set_volume(self.volume * self.duck_factor)
             pygame.mixer.music.play()
             pygame.mixer.music.set_endevent(pygame.USEREVENT)
             print(f"Сейчас играет: {self.playlist[self.current_track_index].stem}")
@@ -214,7 +552,16 @@ class MusicPlayer:
     def set_volume(self, volume):
         """Устанавливает громкость (0.0 - 1.0)"""
         self.volume = max(0.0, min(1.0, volume))
-        pygame.mixer.music.set_volume(self.volume)
+        pygame.mixer.music.set_volume(self.volume * self.duck_factor)
+
+    def duck(self, factor):
+        """Приглушает музыку, не меняя заданную громкость"""
+        self.duck_factor = max(0.0, min(1.0, factor))
+        pygame.mixer.music.set_volume(self.volume * self.duck_factor)
+
+    def unduck(self):
+        """Возвращает громкость после приглушения"""
+        self.duck(1.0)
 
     def stop(self):
         """Останавливает воспроизведение"""
@@ -245,7 +592,12 @@ class SettingsConfig:
             "fullscreen": False,
             "language": "ru",
             "resolution": "800x600",
-            "text_speed": 1.0
+            "text_speed": 1.0,
+            "background_fps": 5,  # Частота кадров без фокуса
+            "background_pause": False,  # Полностью останавливать отрисовку без фокуса
+            "background_duck": True,  # Приглушать музыку без фокуса
+            "background_duck_volume": 0.3,  # Множитель громкости при приглушении
+            "backlog_size": BACKLOG_SIZE  # Размер истории диалога
         }
         self._localized_settings: Dict[str, Dict[str, str]] = {}
         self._load_localization()
@@ -271,6 +623,10 @@ class SettingsConfig:
             if key == "language":
                 self._load_localization()  # Перезагружаем локализацию при смене языка
 
+    def get_all(self) -> Dict[str, Any]:
+        """Получить копию всех настроек"""
+        return self._settings.copy()
+
 class SettingsManager:
     """Класс для работы с настройками игры с поддержкой локализации"""
 
@@ -332,6 +688,128 @@ class SettingsManager:
         self.config._settings = SettingsConfig()._settings
         print(self.get_localized_message("reset_success", "Настройки сброшены к значениям по умолчанию"))
 
+class PanelCache:
+    """
+    Кэш скруглённых панелей (nine-slice).
+
+    Растеризация pygame.draw.rect с border_radius дорогая, поэтому каждый
+    стиль (фон, рамка, радиус, толщина рамки) рисуется один раз в маленький
+    квадрат, который режется на углы, края и центр. Панель любого размера
+    собирается из этих кусков и кэшируется целиком для своего размера.
+    """
+
+    MAX_PANELS = 128  # Сколько готовых панелей разных размеров хранить
+    COLORKEY = (255, 0, 255)  # Прозрачный цвет для непрозрачных панелей
+
+    def __init__(self, max_panels: int = MAX_PANELS):
+        self.max_panels = max_panels
+        self._slices: Dict[Tuple, pygame.Surface] = {}  # Стиль -> исходный квадрат
+        self._panels: Dict[Tuple, pygame.Surface] = {}  # (стиль, размер) -> готовая панель
+
+    def draw(self, surface: pygame.Surface, rect, bg: Optional[Tuple[int, ...]],
+             border: Optional[Tuple[int, ...]] = None, radius: int = 0, border_width: int = 1) -> None:
+        """Рисует панель: заливка bg (None - без заливки) и рамка border (None - без рамки)"""
+        rect = pygame.Rect(rect)
+        if rect.width <= 0 or rect.height <= 0:
+            return
+
+        style = (tuple(bg) if bg else None, tuple(border) if border else None, radius, border_width)
+        key = (style, rect.size)
+        panel = self._panels.pop(key, None)
+        if panel is None:
+            panel = self._finalize(style, self._assemble(style, rect.size))
+            if len(self._panels) >= self.max_panels:
+                del self._panels[next(iter(self._panels))]  # Вытесняем самую давнюю
+        self._panels[key] = panel  # Перемещаем в конец как недавно использованную
+
+        surface.blit(panel, rect)
+
+    @staticmethod
+    def _corner(style: Tuple) -> int:
+        _, border, radius, border_width = style
+        return max(radius, border_width if border else 0, 1)
+
+    def _get_slices(self, style: Tuple) -> pygame.Surface:
+        """Квадрат 2c+1, из которого вырезаются углы, края и центр"""
+        source = self._slices.get(style)
+        if source is None:
+            corner = self._corner(style)
+            size = 2 * corner + 1
+            source = self._render(style, (size, size))
+            self._slices[style] = source
+        return source
+
+    @staticmethod
+    def _render(style: Tuple, size: Tuple[int, int]) -> pygame.Surface:
+        """Прямая растеризация панели заданного размера"""
+        bg, border, radius, border_width = style
+        result = pygame.Surface(size, pygame.SRCALPHA)
+        rect = result.get_rect()
+        if bg:
+            pygame.draw.rect(result, bg, rect, border_radius=radius)
+        if border:
+            pygame.draw.rect(result, border, rect, border_width, border_radius=radius)
+        return result
+
+    def _assemble(self, style: Tuple, size: Tuple[int, int]) -> pygame.Surface:
+        """Собирает панель нужного размера из кэшированных кусков"""
+        corner = self._corner(style)
+        width, height = size
+        if width < 2 * corner or height < 2 * corner:
+            # Панель меньше углов - проще нарисовать напрямую
+            return self._render(style, size)
+
+        source = self._get_slices(style)
+        c = corner
+        mid_w, mid_h = width - 2 * c, height - 2 * c
+        panel = pygame.Surface(size, pygame.SRCALPHA)
+
+        # Углы
+        panel.blit(source, (0, 0), (0, 0, c, c))
+        panel.blit(source, (width - c, 0), (c + 1, 0, c, c))
+        panel.blit(source, (0, height - c), (0, c + 1, c, c))
+        panel.blit(source, (width - c, height - c), (c + 1, c + 1, c, c))
+
+        # Края растягиваются из полосок шириной в один пиксель
+        if mid_w > 0:
+            panel.blit(pygame.transform.scale(source.subsurface((c, 0, 1, c)), (mid_w, c)), (c, 0))
+            panel.blit(pygame.transform.scale(source.subsurface((c, c + 1, 1, c)), (mid_w, c)), (c, height - c))
+        if mid_h > 0:
+            panel.blit(pygame.transform.scale(source.subsurface((0, c, c, 1)), (c, mid_h)), (0, c))
+            panel.blit(pygame.transform.scale(source.subsurface((c + 1, c, c, 1)), (c, mid_h)), (width - c, c))
+
+        # Центр - цвет центрального пикселя исходника
+        if mid_w > 0 and mid_h > 0:
+            panel.fill(source.get_at((c, c)), (c, c, mid_w, mid_h))
+
+        return panel
+
+    def _finalize(self, style: Tuple, panel: pygame.Surface) -> pygame.Surface:
+        """
+        Панели без полупрозрачных цветов переводятся в формат экрана с
+        colorkey и RLE: такой blit заметно быстрее попиксельной альфы
+        """
+        bg, border, _, _ = style
+        if any(color and len(color) > 3 and color[3] < 255 for color in (bg, border)):
+            return panel
+        if pygame.display.get_surface() is None:
+            return panel
+
+        opaque = pygame.Surface(panel.get_size()).convert()
+        opaque.fill(self.COLORKEY)
+        opaque.blit(panel, (0, 0))
+        opaque.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return opaque
+
+    def clear(self) -> None:
+        """Очищает кэш (например, после смены палитры)"""
+        self._slices.clear()
+        self._panels.clear()
+
+
+panel_cache = PanelCache()
+
+
 class SettingsUI:
     """Полноценный класс для отрисовки и взаимодействия с интерфейсом настроек"""
 
@@ -345,6 +823,8 @@ class SettingsUI:
         self.config = config
         self.manager = manager
         self.language = language
+        self.locale = Locale()
+        self.locale.set_default_language(language)
 
         # Основные параметры окна
         self.window_width = 500
@@ -353,9 +833,11 @@ class SettingsUI:
         self.button_height = 40
 
         # Состояния элементов
-        self.hovered_item = None
+        self.hovered_item = None  # Кнопка под курсором (наведение сообщает InputRouter)
         self.scroll_offset = 0
+        self.total_height = self.window_height
         self.music_track_scroll = 0
+        self.track_name = "Current Track Name"  # Здесь нужно получить реальное название
 
         # Инициализация элементов управления
         self._init_ui_elements()
@@ -406,11 +888,29 @@ class SettingsUI:
             'language': {
                 'rect': pygame.Rect(0, 0, 100, self.button_height),
                 'state': self.config.get('language')
+            },
+            'resolution': {
+                'rect': pygame.Rect(0, 0, 200, self.button_height),
+                'state': self.config.get('resolution')
             }
         }
 
         # Кнопка сохранения
         self.save_btn = pygame.Rect(0, 0, 150, self.button_height)
+        self._update_positions()
+
+    def register_inputs(self, router: 'InputRouter', z: int, active: Callable[[], bool]) -> None:
+        """Регистрирует кнопки окна для наведения; клики и ползунок по-прежнему получает handle_event"""
+        controls = [('close', self.close_btn), ('save', self.save_btn), *self.player_buttons.items(),
+                    *((key, data['rect']) for key, data in self.toggle_buttons.items())]
+        for name, rect in controls:
+            router.register(rect, z=z, on_hover=lambda pos, n=name: self.set_hover(n, pos), active=active)
+
+    def set_hover(self, name: str, pos: Optional[Tuple[int, int]]) -> None:
+        if pos is not None:
+            self.hovered_item = name
+        elif self.hovered_item == name:
+            self.hovered_item = None
 
     def _update_positions(self):
         """Обновление позиций элементов при изменении размера окна"""
@@ -448,6 +948,15 @@ class SettingsUI:
             100,
             self.button_height
         )
+        y_offset += 50
+
+        # Размер окна
+        self.toggle_buttons['resolution']['rect'].update(
+            self.window_rect.x + self.window_width - 250,
+            y_offset,
+            200,
+            self.button_height
+        )
         y_offset += 80
 
         # Кнопка сохранения
@@ -478,8 +987,7 @@ class SettingsUI:
         surface.blit(overlay, (0, 0))
 
         # Основное окно
-        pygame.draw.rect(surface, UI_PANEL_BG, self.window_rect, border_radius=15)
-        pygame.draw.rect(surface, UI_BORDER, self.window_rect, 2, border_radius=15)
+        panel_cache.draw(surface, self.window_rect, UI_PANEL_BG, UI_BORDER, 15, 2)
 
         # Заголовок
         title = FONT_LARGE.render(self.locale.get('ui.settings_title'), True, WHITE)
@@ -496,11 +1004,10 @@ class SettingsUI:
 
     def _draw_close_button(self, surface: pygame.Surface) -> None:
         """Отрисовка кнопки закрытия"""
-        is_hovered = self.close_btn.collidepoint(pygame.mouse.get_pos())
+        is_hovered = self.hovered_item == 'close'
         color = RED_HOVER if is_hovered else RED
 
-        pygame.draw.rect(surface, color, self.close_btn, border_radius=15)
-        pygame.draw.rect(surface, WHITE, self.close_btn, 1, border_radius=15)
+        panel_cache.draw(surface, self.close_btn, color, WHITE, 15, 1)
 
         # Текст "X"
         text = FONT_MEDIUM.render("×", True, WHITE)
@@ -520,13 +1027,11 @@ class SettingsUI:
 
         # Ползунок
         slider = self.volume_slider['rect']
-        pygame.draw.rect(surface, (50, 50, 80), slider, border_radius=10)
-        pygame.draw.rect(surface, WHITE, slider, 1, border_radius=10)
+        panel_cache.draw(surface, slider, (50, 50, 80), WHITE, 10, 1)
 
         # Бегунок
         handle = self.volume_slider['handle_rect']
-        pygame.draw.rect(surface, BLUE_BUTTON_HOVER, handle, border_radius=5)
-        pygame.draw.rect(surface, WHITE, handle, 1, border_radius=5)
+        panel_cache.draw(surface, handle, BLUE_BUTTON_HOVER, WHITE, 5, 1)
 
     def _draw_music_player(self, surface: pygame.Surface) -> None:
         """Отрисовка элементов управления музыкой"""
@@ -534,11 +1039,10 @@ class SettingsUI:
 
         # Кнопки управления
         for btn_type, btn_rect in self.player_buttons.items():
-            is_hovered = btn_rect.collidepoint(pygame.mouse.get_pos())
+            is_hovered = self.hovered_item == btn_type
             color = BLUE_BUTTON_HOVER if is_hovered else BLUE_BUTTON
 
-            pygame.draw.rect(surface, color, btn_rect, border_radius=5)
-            pygame.draw.rect(surface, WHITE, btn_rect, 1, border_radius=5)
+            panel_cache.draw(surface, btn_rect, color, WHITE, 5, 1)
 
             # Иконки кнопок
             self._draw_player_icon(surface, btn_type, btn_rect)
@@ -549,17 +1053,22 @@ class SettingsUI:
     def _draw_toggle_buttons(self, surface: pygame.Surface) -> None:
         """Отрисовка переключателей (полноэкранный режим, язык)"""
         for key, data in self.toggle_buttons.items():
-            is_hovered = data['rect'].collidepoint(pygame.mouse.get_pos())
+            is_hovered = self.hovered_item == key
             color = BLUE_BUTTON_HOVER if is_hovered else BLUE_BUTTON
 
             # Рисуем кнопку
-            pygame.draw.rect(surface, color, data['rect'], border_radius=5)
-            pygame.draw.rect(surface, WHITE, data['rect'], 1, border_radius=5)
+            panel_cache.draw(surface, data['rect'], color, WHITE, 5, 1)
 
             # Текст и состояние
             text_key = f"settings.{key}"
+            if key == 'language':
+                state = data['state'].upper()
+            elif key == 'resolution':
+                state = data['state']
+            else:
+                state = 'ON' if data['state'] else 'OFF'
             text = FONT_SMALL.render(
-                f"{self.locale.get(text_key, key)}: {'ON' if data['state'] else 'OFF'}",
+                f"{self.locale.get(text_key, key)}: {state}",
                 True,
                 WHITE
             )
@@ -654,14 +1163,20 @@ class SettingsUI:
             ])
 
         # Добавляем эффект свечения при наведении
-        if self.player_buttons[btn_type].collidepoint(pygame.mouse.get_pos()):
-            glow = pygame.Surface((rect.width, rect.height), pygame.SRCALPHA)
-            pygame.draw.rect(glow, (*icon_color, 30), glow.get_rect(), border_radius=5)
-            surface.blit(glow, rect)
+        if self.hovered_item == btn_type:
+            panel_cache.draw(surface, rect, (*icon_color, 30), radius=5)
+
+    def is_animating(self) -> bool:
+        """Бегущая строка с названием трека меняется каждый кадр"""
+        return FONT_SMALL.size(self.track_name)[0] > self.window_width - 40
+
+    def next_deadline(self) -> Optional[int]:
+        """Отложенных по времени изменений нет"""
+        return None
 
     def _draw_track_name(self, surface: pygame.Surface, y_pos: int) -> None:
         """Отрисовка названия текущего трека с эффектом прокрутки"""
-        track_name = "Current Track Name"  # Здесь нужно получить реальное название
+        track_name = self.track_name
         text_width = FONT_SMALL.size(track_name)[0]
         max_width = self.window_width - 40
 
@@ -766,19 +1281,16 @@ class SettingsUI:
             ])
 
         # Добавляем эффект свечения при наведении
-        if self.player_buttons[btn_type].collidepoint(pygame.mouse.get_pos()):
-            glow = pygame.Surface((rect.width, rect.height), pygame.SRCALPHA)
-            pygame.draw.rect(glow, (*icon_color, 30), glow.get_rect(), border_radius=5)
-            surface.blit(glow, rect)
+        if self.hovered_item == btn_type:
+            panel_cache.draw(surface, rect, (*icon_color, 30), radius=5)
 
     def _draw_save_button(self, surface: pygame.Surface) -> None:
         """Отрисовка кнопки сохранения"""
-        is_hovered = self.save_btn.collidepoint(pygame.mouse.get_pos())
+        is_hovered = self.hovered_item == 'save'
         color = GREEN if not is_hovered else GREEN_HOVER  # Используем глобальные цветовые константы
 
         # Рисуем кнопку с закругленными углами
-        pygame.draw.rect(surface, color, self.save_btn, border_radius=5)
-        pygame.draw.rect(surface, WHITE, self.save_btn, 1, border_radius=5)  # Рамка
+        panel_cache.draw(surface, self.save_btn, color, WHITE, 5, 1)
 
         # Получаем локализованный текст для кнопки
         save_text = self.locale.get('ui.save')
@@ -843,7 +1355,16 @@ class SettingsUI:
         # Переключатели
         for key, data in self.toggle_buttons.items():
             if data['rect'].collidepoint(pos):
-                self.toggle_buttons[key]['state'] = not data['state']
+                if key == 'language':
+                    # Язык перебирается по кругу среди языков интерфейса
+                    languages = list(self.locale.translations) or [data['state']]
+                    position = languages.index(data['state']) if data['state'] in languages else -1
+                    data['state'] = languages[(position + 1) % len(languages)]
+                elif key == 'resolution':
+                    position = RESOLUTIONS.index(data['state']) if data['state'] in RESOLUTIONS else -1
+                    data['state'] = RESOLUTIONS[(position + 1) % len(RESOLUTIONS)]
+                else:
+                    data['state'] = not data['state']
                 return f"toggle_{key}"
 
         # Кнопка сохранения
@@ -868,6 +1389,7 @@ class SettingsUI:
     def set_language(self, language: str) -> None:
         """Установка языка интерфейса"""
         self.language = language
+        self.locale.set_default_language(language)
 
 class ParticleSystem:
     def __init__(self):
@@ -900,6 +1422,13 @@ class ParticleSystem:
         for p in self.particles:
             pygame.draw.circle(surface, color, (int(p[0]), int(p[1])), p[4])
 
+    def is_animating(self) -> bool:
+        """Частицы движутся каждый кадр, пока живы"""
+        return bool(self.particles)
+
+    def next_deadline(self) -> Optional[int]:
+        return None
+
 class ShakeEffect:
     def __init__(self):
         self.offset = [0, 0]
@@ -924,6 +1453,57 @@ class ShakeEffect:
         """Применяет смещение к позиции"""
         return (pos[0] + self.offset[0], pos[1] + self.offset[1])
 
+    def is_animating(self) -> bool:
+        """Дрожание активно, пока не истекла длительность и смещение не сброшено"""
+        return self.duration > 0 or self.offset != [0, 0]
+
+    def next_deadline(self) -> Optional[int]:
+        return None
+
+class Starfield:
+    """Звёздное поле на фоне меню и перехода"""
+
+    def __init__(self, width, height, star_count=STAR_COUNT):
+        self.width = width
+        self.height = height
+        self.stars = []
+
+        for _ in range(star_count):
+            x = random.randint(0, width)
+            y = random.randint(0, height)
+            size = random.randint(1, 3)
+            speed = random.uniform(0.1, 0.5)
+            self.stars.append([x, y, size, speed])
+
+    def update(self, zoom_factor=1.0):
+        """Обновление позиций звёзд"""
+        for star in self.stars:
+            star[1] += star[3] * (zoom_factor ** 0.5)
+            if star[1] > self.height:
+                star[1] = 0
+                star[0] = random.randint(0, self.width)
+
+    def draw(self, surface, current_state, zoom_factor=1.0, target_star=None):
+        """Отрисовка звёздного поля"""
+        if current_state == GameState.ZOOM and target_star:
+            for star in self.stars:
+                x = (star[0] - target_star[0]) * zoom_factor + target_star[0]
+                y = (star[1] - target_star[1]) * zoom_factor + target_star[1]
+                size = star[2] * zoom_factor
+
+                if -size < x < self.width + size and -size < y < self.height + size:
+                    pygame.draw.circle(surface, WHITE, (int(x), int(y)), int(size))
+        else:
+            for star in self.stars:
+                pygame.draw.circle(surface, WHITE, (int(star[0]), int(star[1])), star[2])
+
+    def is_animating(self) -> bool:
+        """Звёзды движутся непрерывно (в режиме игры поле не обновляется)"""
+        return True
+
+    def next_deadline(self) -> Optional[int]:
+        return None
+
 class Button:
     def __init__(self, x: int, y: int, width: int, height: int, text_key: str,
                  action: Optional[callable] = None, locale: Optional[Locale] = None):
@@ -1008,17 +1588,14 @@ class Button:
             color = self.colors['normal']
 
         # Рисуем основной прямоугольник
-        pygame.draw.rect(surface, color, self.rect, border_radius=10)
+        panel_cache.draw(surface, self.rect, color, radius=10)
 
         # Рисуем свечение при наведении
-        if self.glow_alpha > 0:
-            glow = pygame.Surface((self.rect.width, self.rect.height), pygame.SRCALPHA)
-            pygame.draw.rect(glow, (*WHITE, int(self.glow_alpha)),
-                             glow.get_rect(), border_radius=10)
-            surface.blit(glow, self.rect)
+        if int(self.glow_alpha) > 0:
+            panel_cache.draw(surface, self.rect, (*WHITE, int(self.glow_alpha)), radius=10)
 
         # Рисуем обводку
-        pygame.draw.rect(surface, self.colors['border'], self.rect, 2, border_radius=10)
+        panel_cache.draw(surface, self.rect, None, self.colors['border'], 10, 2)
 
         # Получаем локализованный текст
         text = self.locale.get(self.text_key) if self.locale else f"[{self.text_key}]"
@@ -1042,12 +1619,7 @@ class Button:
         """
         if event.type == pygame.MOUSEMOTION:
             # Проверка наведения
-            was_hovered = self.is_hovered
-            self.is_hovered = self.rect.collidepoint(event.pos)
-
-            # Воспроизведение звука при наведении
-            if not was_hovered and self.is_hovered and self.hover_sound:
-                self.hover_sound.play()
+            self.set_hovered(self.rect.collidepoint(event.pos))
 
         elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.is_hovered:
@@ -1066,15 +1638,111 @@ class Button:
 
         return False
 
+    def set_hovered(self, hovered: bool) -> None:
+        """Установка наведения; звук воспроизводится при входе курсора"""
+        if hovered and not self.is_hovered and self.hover_sound:
+            self.hover_sound.play()
+        self.is_hovered = hovered
+
     def check_hover(self, pos: Tuple[int, int]) -> bool:
         """Проверка наведения мыши с обновлением состояния"""
         self.is_hovered = self.rect.collidepoint(pos)
         return self.is_hovered
 
+    def is_animating(self) -> bool:
+        """Кнопка анимируется, пока размер и свечение не дошли до целевых значений"""
+        target_scale = 1.05 if self.is_hovered else 1.0
+        target_glow = 30 if self.is_hovered else 0
+        return abs(target_scale - self.current_size) > 0.002 or abs(target_glow - self.glow_alpha) > 0.5
+
+    def next_deadline(self) -> Optional[int]:
+        return None
+
+class StateEventType:
+    """Типы событий изменения состояния прохождения"""
+    STAT_CHANGED = "stat_changed"
+    ITEM_ADDED = "item_added"
+    ITEM_REMOVED = "item_removed"
+    ACTION_UNLOCKED = "action_unlocked"
+    ACTION_LOCKED = "action_locked"
+    ACTION_COMPLETED = "action_completed"
+    FLAG_SET = "flag_set"
+    STATE_RESET = "state_reset"
+
+class StateEvent(NamedTuple):
+    """Изменение состояния: тип, ключ (характеристика, предмет, флаг), новое и старое значение"""
+    type: str
+    key: Any = None
+    value: Any = None
+    old: Any = None
+
+class ReadOnlyList(Sequence):
+    """Представление списка только для чтения (без копирования)"""
+    __slots__ = ("_items",)
+
+    def __init__(self, items: list):
+        self._items = items
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return list(self._items) == list(other)
+
+    def __repr__(self) -> str:
+        return f"ReadOnlyList({self._items!r})"
+
+class ReadOnlySet(AbstractSet):
+    """Представление множества только для чтения (без копирования)"""
+    __slots__ = ("_items",)
+
+    def __init__(self, items: set):
+        self._items = items
+
+    def __contains__(self, item) -> bool:
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __repr__(self) -> str:
+        return f"ReadOnlySet({self._items!r})"
+
 class SaveManager:
     def __init__(self, save_file: str = SAVE_FILE, locale: Optional[Locale] = None):
         self.save_file = Path(__file__).parent / save_file
         self.locale = locale or Locale()
+        # Состояние текущего прохождения
+        self.session_defaults = {
+            "inventory": [],
+            "actions": [],
+            "story_flags": {},
+            "completed_actions": set(),
+            "current_dialog": "start",
+            "current_node": 0,
+            "character_stats": dict(DEFAULT_STATS)
+        }
+        self.current_data = self._new_session()
+        self.revision = 0  # Версия состояния: растёт с каждым изменением
+
+        # Подписчики на изменения и отложенные события текущего пакета
+        self._subscribers: List[Tuple[Callable[[StateEvent], None], frozenset]] = []
+        self._batch_depth = 0
+        self._pending_events: Dict[Tuple[str, Any], StateEvent] = {}
         self.default_data = {
             "game_state": GameState.MENU,
             "player_stats": {
@@ -1167,15 +1835,72 @@ class SaveManager:
                 "player_stats": {}
             }
 
-    def add_to_inventory(self, item: str):
-        """Добавляет предмет в инвентарь"""
-        if item not in self.current_data["inventory"]:
-            self.current_data["inventory"].append(item)
+    def subscribe(self, callback: Callable[['StateEvent'], None], *event_types: str) -> Callable[[], None]:
+        """
+        Подписывает callback на изменения состояния.
+        Без event_types - на все события. Возвращает функцию отписки.
+        """
+        subscription = (callback, frozenset(event_types))
+        self._subscribers.append(subscription)
+
+        def unsubscribe():
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+        return unsubscribe
+
+    @contextmanager
+    def batch(self):
+        """
+        Группирует изменения (например, все эффекты одной реплики):
+        подписчики получают события один раз, по одному на ключ
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending_events:
+                pending = list(self._pending_events.values())
+                self._pending_events.clear()
+                for event in pending:
+                    self._deliver(event)
+
+    def _emit(self, event_type: str, key: Any = None, value: Any = None, old: Any = None) -> None:
+        """Отправляет событие сразу или откладывает до конца пакета"""
+        self.revision += 1
+        event = StateEvent(event_type, key, value, old)
+        if self._batch_depth == 0:
+            self._deliver(event)
+            return
+
+        # Слияние событий внутри пакета: остаётся первое старое и последнее новое значение
+        pending_key = (event_type, key)
+        previous = self._pending_events.pop(pending_key, None)
+        if previous is not None:
+            event = event._replace(old=previous.old)
+        opposite = {StateEventType.ITEM_ADDED: StateEventType.ITEM_REMOVED,
+                    StateEventType.ITEM_REMOVED: StateEventType.ITEM_ADDED}.get(event_type)
+        if opposite and self._pending_events.pop((opposite, key), None) is not None:
+            return  # Предмет добавлен и удалён в одном пакете - изменений нет
+        self._pending_events[pending_key] = event
+
+    def _deliver(self, event: 'StateEvent') -> None:
+        for callback, event_types in list(self._subscribers):
+            if not event_types or event.type in event_types:
+                callback(event)
+
+    def add_to_inventory(self, item: str, position: Optional[int] = None):
+        """Добавляет предмет в инвентарь (в конец или на место position - при откате)"""
+        inventory = self.current_data["inventory"]
+        if item not in inventory:
+            inventory.insert(len(inventory) if position is None else position, item)
+            self._emit(StateEventType.ITEM_ADDED, item)
 
     def remove_from_inventory(self, item: str) -> bool:
         """Удаляет предмет из инвентаря, возвращает True если успешно"""
         if item in self.current_data["inventory"]:
             self.current_data["inventory"].remove(item)
+            self._emit(StateEventType.ITEM_REMOVED, item)
             return True
         return False
 
@@ -1183,6 +1908,13 @@ class SaveManager:
         """Добавляет новое доступное действие"""
         if action not in self.current_data["actions"]:
             self.current_data["actions"].append(action)
+            self._emit(StateEventType.ACTION_UNLOCKED, action)
+
+    def lock_action(self, action: str):
+        """Убирает открытое действие (откат эффекта unlock_action)"""
+        if action in self.current_data["actions"]:
+            self.current_data["actions"].remove(action)
+            self._emit(StateEventType.ACTION_LOCKED, action)
 
     def complete_action(self, action: str) -> bool:
         """
@@ -1192,34 +1924,75 @@ class SaveManager:
         if action in self.current_data["actions"]:
             self.current_data["actions"].remove(action)
             self.current_data["completed_actions"].add(action)
+            self._emit(StateEventType.ACTION_COMPLETED, action)
             return True
         return False
 
     def set_story_flag(self, flag: str, value: any = True):
         """Устанавливает флаг истории (для развилок)"""
+        old = self.current_data["story_flags"].get(flag)
         self.current_data["story_flags"][flag] = value
+        if old != value:
+            self._emit(StateEventType.FLAG_SET, flag, value, old)
+
+    def clear_story_flag(self, flag: str):
+        """Снимает флаг истории"""
+        if flag in self.current_data["story_flags"]:
+            old = self.current_data["story_flags"].pop(flag)
+            self._emit(StateEventType.FLAG_SET, flag, None, old)
 
     def get_story_flag(self, flag: str, default=None) -> any:
         """Получает значение флага истории"""
         return self.current_data["story_flags"].get(flag, default)
 
+    def get_story_flags(self) -> Mapping[str, Any]:
+        """Возвращает флаги истории (только для чтения)"""
+        return MappingProxyType(self.current_data["story_flags"])
+
+    def state_view(self) -> StateView:
+        """Состояние для проверки условий выборов (действия - открытые хотя бы раз)"""
+        data = self.current_data
+        return StateView(MappingProxyType(data["character_stats"]), ReadOnlyList(data["inventory"]),
+                         MappingProxyType(data["story_flags"]), set(data["actions"]) | data["completed_actions"])
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Копия состояния сценария, пригодная для JSON (в том же виде, что у StoryState)"""
+        data = self.current_data
+        return {"stats": dict(data["character_stats"]), "inventory": list(data["inventory"]),
+                "actions": list(data["actions"]), "flags": dict(data["story_flags"]),
+                "position": [data["current_dialog"], data["current_node"]]}
+
+    def _new_session(self) -> Dict[str, Any]:
+        """Создаёт независимую копию начального состояния прохождения"""
+        return {
+            "inventory": [],
+            "actions": [],
+            "story_flags": {},
+            "completed_actions": set(),
+            "current_dialog": self.session_defaults["current_dialog"],
+            "current_node": self.session_defaults["current_node"],
+            "character_stats": self.session_defaults["character_stats"].copy()
+        }
+
     def reset_game(self):
         """Сбрасывает состояние игры к начальному"""
-        self.current_data = self.default_data.copy()
+        self.current_data = self._new_session()
+        self._pending_events.clear()
+        self._emit(StateEventType.STATE_RESET)
         if os.path.exists(self.save_file):
             os.remove(self.save_file)
 
-    def get_available_actions(self) -> List[str]:
-        """Возвращает список доступных действий"""
-        return self.current_data["actions"].copy()
+    def get_available_actions(self) -> Sequence[str]:
+        """Возвращает доступные действия (представление только для чтения, без копирования)"""
+        return ReadOnlyList(self.current_data["actions"])
 
-    def get_inventory(self) -> List[str]:
-        """Возвращает список предметов в инвентаре"""
-        return self.current_data["inventory"].copy()
+    def get_inventory(self) -> Sequence[str]:
+        """Возвращает предметы инвентаря (представление только для чтения, без копирования)"""
+        return ReadOnlyList(self.current_data["inventory"])
 
-    def get_completed_actions(self) -> Set[str]:
-        """Возвращает множество выполненных действий"""
-        return self.current_data["completed_actions"].copy()
+    def get_completed_actions(self) -> AbstractSet[str]:
+        """Возвращает выполненные действия (представление только для чтения)"""
+        return ReadOnlySet(self.current_data["completed_actions"])
 
     def set_current_dialog(self, dialog_id: str):
         """Устанавливает текущий диалог"""
@@ -1229,16 +2002,27 @@ class SaveManager:
         """Получает текущий диалог"""
         return self.current_data["current_dialog"]
 
+    def set_story_position(self, scene_id: str, index: int):
+        """Запоминает позицию в истории: сцену и номер реплики"""
+        self.current_data["current_dialog"] = scene_id
+        self.current_data["current_node"] = index
+
+    def get_story_position(self) -> Tuple[str, int]:
+        """Сохранённая позиция в истории"""
+        return self.current_data["current_dialog"], self.current_data["current_node"]
+
     def update_character_stat(self, stat: str, change: int):
         """Изменяет характеристику персонажа"""
-        if stat in self.current_data["character_stats"]:
-            self.current_data["character_stats"][stat] = max(0, min(100,
-                                                                    self.current_data["character_stats"][
-                                                                        stat] + change))
+        stats = self.current_data["character_stats"]
+        if stat in stats:
+            old = stats[stat]
+            stats[stat] = max(STAT_MIN, min(STAT_MAX, old + change))
+            if stats[stat] != old:
+                self._emit(StateEventType.STAT_CHANGED, stat, stats[stat], old)
 
-    def get_character_stats(self) -> Dict[str, int]:
-        """Возвращает текущие характеристики персонажа"""
-        return self.current_data["character_stats"].copy()
+    def get_character_stats(self) -> Mapping[str, int]:
+        """Возвращает характеристики персонажа (представление только для чтения, без копирования)"""
+        return MappingProxyType(self.current_data["character_stats"])
 
 class CentralImageManager:
     """Класс для управления центральным изображением"""
@@ -1247,10 +2031,12 @@ class CentralImageManager:
         self.central_images = []  # Основные изображения
         self.special_images = {}  # Специальные изображения
         self.current_image_index = 0  # Текущий индекс изображения
-        self.last_image_change_time = pygame.time.get_ticks()  # Время последней смены изображения
-        self.last_click_time = pygame.time.get_ticks()  # Время последнего клика
+        self.last_image_change_time = game_clock.get_ticks()  # Время последней смены изображения
+        self.last_click_time = game_clock.get_ticks()  # Время последнего клика
         self.image_rect = pygame.Rect(SCREEN_WIDTH // 2 - 250, SCREEN_HEIGHT // 2 - 250, 500,
                                       500)  # Прямоугольник изображения
+        self.hover_rect = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2 - 100, 200,
+                                      200)  # Область наведения
         self.is_hovered = False  # Наведена ли мышь
         self.showing_special = False  # Показывается ли спец. изображение
         self.return_to_cycle = False  # Возврат к циклу изображений
@@ -1310,16 +2096,26 @@ class CentralImageManager:
 
     def update(self):
         """Обновление состояния изображения"""
-        current_time = pygame.time.get_ticks()
-        mouse_pos = pygame.mouse.get_pos()
-        hover_image = pygame.Rect(SCREEN_WIDTH // 2 - 100, SCREEN_HEIGHT // 2 - 100, 200, 200)
-        self.is_hovered = hover_image.collidepoint(mouse_pos)
+        current_time = game_clock.get_ticks()
 
         # Смена изображения каждые 500мс, если не показывается спец. изображение
         if current_time - self.last_image_change_time > 500 and not self.return_to_cycle:
             self.current_image_index = (self.current_image_index + 1) % len(self.central_images)
             self.last_image_change_time = current_time
 
+    def is_animating(self) -> bool:
+        return False
+
+    def next_deadline(self) -> Optional[int]:
+        """Время следующей смены изображения"""
+        if self.return_to_cycle:
+            return None
+        return self.last_image_change_time + 501
+
+    def set_hover(self, pos):
+        """Наведение на центр изображения (вызывается маршрутизатором ввода)"""
+        self.is_hovered = pos is not None
+
     def draw(self, surface):
         """Отрисовка текущего изображения"""
         if self.is_hovered and "hover" in self.special_images and not self.return_to_cycle:
@@ -1329,210 +2125,801 @@ class CentralImageManager:
             surface.blit(self.central_images[self.current_image_index], self.image_rect)
             self.showing_special = False
 
-class StatsPanel:
+class InputTarget:
+    """Зарегистрированная в маршрутизаторе область ввода"""
+
+    __slots__ = ("rect", "z", "order", "on_click", "on_event", "on_hover", "active", "cells")
+
+    def __init__(self, rect, z, order, on_click, on_event, on_hover, active):
+        self.rect = pygame.Rect(rect)
+        self.z = z
+        self.order = order
+        self.on_click = on_click  # on_click(pos) - левый клик; False - не обработан
+        self.on_event = on_event  # on_event(event) -> bool - любые события мыши
+        self.on_hover = on_hover  # on_hover(pos) при движении над целью, on_hover(None) при уходе
+        self.active = active  # active() -> bool; неактивная цель прозрачна для ввода
+        self.cells: List[Tuple[int, int]] = []
+
+    def is_active(self) -> bool:
+        return self.active is None or self.active()
+
+    def handle(self, event: pygame.event.Event) -> bool:
+        """Передаёт событие обработчику цели"""
+        if self.on_event is not None:
+            return bool(self.on_event(event))
+        if self.on_click is not None and event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            return self.on_click(event.pos) is not False
+        return False
+
+
+class InputRouter:
+    """
+    Маршрутизатор событий мыши.
+
+    Цели хранятся в сетке ячеек размером cell_size, каждая ячейка
+    отсортирована по убыванию z (при равном z выше тот, кто
+    зарегистрирован позже). Событие проходит по целям под курсором
+    сверху вниз, пока одна из них его не обработает.
+    capture() включает модальный захват: все события получает одна цель,
+    а наведение - она и цели выше неё (кнопки модального окна).
+    Нажатая кнопка мыши временно захватывает цель до отпускания.
+    Наведение пересчитывается только при движении мыши и кликах.
+    """
+
+    POINTER_EVENTS = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP, pygame.MOUSEMOTION)
+
+    def __init__(self, cell_size: int = 64):
+        self.cell_size = cell_size
+        self.grid: Dict[Tuple[int, int], List[InputTarget]] = {}
+        self.captured: Optional[InputTarget] = None  # Модальная цель
+        self.pressed: Optional[InputTarget] = None  # Цель, получившая нажатие кнопки
+        self.hovered: Optional[InputTarget] = None
+        self.pointer: Optional[Tuple[int, int]] = None  # Последняя позиция курсора
+        self._order = 0
+
+    def register(self, rect, z: int = 0, on_click: Optional[Callable] = None,
+                 on_event: Optional[Callable] = None, on_hover: Optional[Callable] = None,
+                 active: Optional[Callable[[], bool]] = None) -> InputTarget:
+        """Регистрирует область ввода и возвращает её дескриптор"""
+        self._order += 1
+        target = InputTarget(rect, z, self._order, on_click, on_event, on_hover, active)
+        self._index(target)
+        return target
+
+    def unregister(self, target: InputTarget) -> None:
+        """Удаляет цель из индекса"""
+        self._unindex(target)
+        if self.captured is target:
+            self.captured = None
+        if self.pressed is target:
+            self.pressed = None
+        if self.hovered is target:
+            self.hovered = None
+
+    def move(self, target: InputTarget, rect) -> None:
+        """Меняет область цели"""
+        self._unindex(target)
+        target.rect = pygame.Rect(rect)
+        self._index(target)
+
+    def _index(self, target: InputTarget) -> None:
+        rect, size = target.rect, self.cell_size
+        if rect.width <= 0 or rect.height <= 0:
+            return
+        for cx in range(rect.left // size, (rect.right - 1) // size + 1):
+            for cy in range(rect.top // size, (rect.bottom - 1) // size + 1):
+                cell = self.grid.setdefault((cx, cy), [])
+                cell.append(target)
+                cell.sort(key=lambda t: (-t.z, -t.order))
+                target.cells.append((cx, cy))
+
+    def _unindex(self, target: InputTarget) -> None:
+        for key in target.cells:
+            cell = self.grid[key]
+            cell.remove(target)
+            if not cell:
+                del self.grid[key]
+        target.cells = []
+
+    def targets_at(self, pos: Tuple[int, int]):
+        """Активные цели под точкой, сверху вниз"""
+        cell = self.grid.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ())
+        for target in cell:
+            if target.rect.collidepoint(pos) and target.is_active():
+                yield target
+
+    def hit_test(self, pos: Tuple[int, int]) -> Optional[InputTarget]:
+        """Самая верхняя активная цель под точкой"""
+        return next(self.targets_at(pos), None)
+
+    def capture(self, target: InputTarget) -> None:
+        """Модальный захват: события получает только эта цель"""
+        self.captured = target
+        self.pressed = None
+        self._set_hovered(None, None)
+        self.refresh_hover()
+
+    def release(self, target: Optional[InputTarget] = None) -> None:
+        """Снимает модальный захват (если задан target - только его)"""
+        if target is None or self.captured is target:
+            self.captured = None
+            self.refresh_hover()
+
+    def refresh_hover(self) -> None:
+        """Пересчитывает наведение для последней позиции курсора (после смены раскладки)"""
+        if self.pointer is not None:
+            self._update_hover(self.pointer)
+
+    def _update_hover(self, pos: Tuple[int, int]) -> None:
+        if self.captured is not None:
+            top = next((target for target in self.targets_at(pos) if target.z >= self.captured.z), None)
+        else:
+            top = self.hit_test(pos)
+        if top is not None and top.on_hover is None:
+            top = None  # Цель без наведения перекрывает нижние
+        self._set_hovered(top, pos)
+
+    def _set_hovered(self, target: Optional[InputTarget], pos: Optional[Tuple[int, int]]) -> None:
+        previous = self.hovered
+        self.hovered = target
+        if previous is not None and previous is not target:
+            previous.on_hover(None)
+        if target is not None:
+            target.on_hover(pos)
+
+    def dispatch(self, event: pygame.event.Event) -> bool:
+        """Передаёт событие мыши верхней заинтересованной цели"""
+        if event.type not in self.POINTER_EVENTS:
+            return False
+
+        pos = event.pos
+        self.pointer = pos
+        handled = False
+
+        if event.type == pygame.MOUSEMOTION:
+            owner = self.captured or self.pressed
+            if owner is not None and owner.on_event is not None:
+                handled = bool(owner.on_event(event))
+            self._update_hover(pos)
+            return handled
+
+        owner = self.captured or (self.pressed if event.type == pygame.MOUSEBUTTONUP else None)
+        if owner is not None:
+            handled = owner.handle(event)
+        else:
+            for target in self.targets_at(pos):
+                if target.handle(event):
+                    handled = True
+                    if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                        self.pressed = target
+                    break
+
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+            self.pressed = None
+        # Клик мог открыть или закрыть окно под неподвижным курсором
+        self._update_hover(pos)
+        return handled
+
+
+class Widget:
+    """
+    Элемент удерживаемого (retained) интерфейса.
+
+    Виджет рисует себя в собственную поверхность и перерисовывает её
+    только после invalidate(). Входные данные, от которых зависит
+    картинка (данные сохранения, язык, наведение, размеры), виджет
+    возвращает из get_inputs(); refresh() сравнивает их с прошлым кадром.
+    Инвалидация поднимается к родителям, поэтому в обычном кадре
+    дерево только копирует готовые поверхности на экран.
+    Координаты rect - экранные, render() получает локальную поверхность.
+    """
+
+    def __init__(self, rect=(0, 0, 0, 0)):
+        self.rect = pygame.Rect(rect)
+        self.parent: Optional['Widget'] = None
+        self.children: List['Widget'] = []
+        self.dirty = True
+        self._visible = True
+        self._surface: Optional[pygame.Surface] = None
+        self._inputs: Any = None
+
+    @property
+    def visible(self) -> bool:
+        return self._visible
+
+    @visible.setter
+    def visible(self, value: bool) -> None:
+        if self._visible != value:
+            self._visible = value
+            self.invalidate()
+
+    def add_child(self, child: 'Widget') -> 'Widget':
+        """Добавляет дочерний виджет"""
+        child.parent = self
+        self.children.append(child)
+        self.invalidate()
+        return child
+
+    def invalidate(self) -> None:
+        """Помечает виджет и всех его родителей как требующих перерисовки"""
+        widget = self
+        while widget is not None:
+            widget.dirty = True
+            widget = widget.parent
+
+    def get_inputs(self) -> Any:
+        """Данные, при изменении которых виджет перерисовывается"""
+        return None
+
+    def refresh(self) -> None:
+        """Сверяет входные данные с прошлым кадром (рекурсивно)"""
+        if not self._visible:
+            return
+        inputs = self.get_inputs()
+        if inputs != self._inputs:
+            self._inputs = inputs
+            self.invalidate()
+        for child in self.children:
+            child.refresh()
+
+    def render(self, surface: pygame.Surface) -> None:
+        """Рисует собственное содержимое в локальных координатах"""
+
+    def get_surface(self) -> pygame.Surface:
+        """Возвращает кэшированную поверхность, пересобирая её при необходимости"""
+        if self.dirty or self._surface is None or self._surface.get_size() != self.rect.size:
+            if self._surface is None or self._surface.get_size() != self.rect.size:
+                self._surface = pygame.Surface(self.rect.size, pygame.SRCALPHA)
+            else:
+                self._surface.fill((0, 0, 0, 0))
+            self.render(self._surface)
+            for child in self.children:
+                if child.visible:
+                    self._surface.blit(child.get_surface(), (child.rect.x - self.rect.x, child.rect.y - self.rect.y))
+            self.dirty = False
+        return self._surface
+
+    def draw(self, surface: pygame.Surface) -> None:
+        """Копирует готовую поверхность виджета на экран"""
+        if self._visible and self.rect.width > 0 and self.rect.height > 0:
+            surface.blit(self.get_surface(), self.rect)
+
+
+class WidgetLayer(Widget):
+    """
+    Корень дерева. draw() копирует поверхности детей прямо на экран,
+    минуя собственную; get_surface() собирает их в одну поверхность
+    размера rect (например, для снимка экрана) и только тогда сбрасывает dirty.
+    """
+
+    def draw(self, surface: pygame.Surface) -> None:
+        for child in self.children:
+            child.draw(surface)
+
+
+class StatsPanel(Widget):
     """Панель статистики персонажа"""
 
-    def __init__(self, save_system, locale):
+    def __init__(self, save_system, locale, font=None):
+        super().__init__((SCREEN_WIDTH - 230, 50, 200, SCREEN_HEIGHT - 300))
         self.save_system = save_system
         self.locale = locale
-        self.panel_rect = pygame.Rect(SCREEN_WIDTH - 230, 50, 200, SCREEN_HEIGHT - 300)
+        self.font = font or FONT_SMALL
         self.stat_colors = {
             "Отвага": (0, 200, 0),
             "ПТСР": (200, 0, 0),
             "Блядство": (0, 100, 200),
             "ЧСВ": (200, 200, 0)
         }
+        # Характеристики меняются только при выборе - перерисовка по событию, без опроса
+        save_system.subscribe(lambda event: self.invalidate(),
+                              StateEventType.STAT_CHANGED, StateEventType.STATE_RESET)
+
+    def get_inputs(self) -> Any:
+        return self.locale.revision
 
-    def draw(self, surface, font):
+    def render(self, surface):
         """Отрисовка панели статистики"""
-        pygame.draw.rect(surface, UI_PANEL_BG, self.panel_rect, border_radius=10)
-        pygame.draw.rect(surface, WHITE, self.panel_rect, 2, border_radius=10)
+        font = self.font
+        panel_cache.draw(surface, surface.get_rect(), UI_PANEL_BG, WHITE, 10, 2)
 
         title = font.render(self.locale.get("ui.stats_title"), True, WHITE)
-        surface.blit(title, (self.panel_rect.x + 10, self.panel_rect.y + 10))
+        surface.blit(title, (10, 10))
 
         y_offset = 50
         stats = self.save_system.get_character_stats()
         for stat, value in stats.items():
             # Название характеристики
             stat_text = font.render(stat, True, WHITE)
-            surface.blit(stat_text, (self.panel_rect.x + 15, self.panel_rect.y + y_offset))
+            surface.blit(stat_text, (15, y_offset))
 
             # Полоска характеристики
             bar_width = 170
             filled_width = (value / 100) * bar_width
-            pygame.draw.rect(surface, (50, 50, 80),
-                             (self.panel_rect.x + 15, self.panel_rect.y + y_offset + 25, bar_width, 15))
-            pygame.draw.rect(surface, self.stat_colors.get(stat, WHITE),
-                             (self.panel_rect.x + 15, self.panel_rect.y + y_offset + 25, filled_width, 15))
+            pygame.draw.rect(surface, (50, 50, 80), (15, y_offset + 25, bar_width, 15))
+            pygame.draw.rect(surface, self.stat_colors.get(stat, WHITE), (15, y_offset + 25, filled_width, 15))
 
             # Значение характеристики
             value_text = font.render(f"{value}%", True, WHITE)
-            surface.blit(value_text,
-                         (self.panel_rect.x + bar_width - value_text.get_width() + 15,
-                          self.panel_rect.y + y_offset + 25))
+            surface.blit(value_text, (bar_width - value_text.get_width() + 15, y_offset + 25))
 
             y_offset += 50
 
-class ActionsPanel:
+class ActionsPanel(Widget):
     """Панель действий"""
 
-    def __init__(self, locale):
+    def __init__(self, locale, font=None):
+        super().__init__((50, 50, 150, SCREEN_HEIGHT - 470))
         self.locale = locale
+        self.font = font or FONT_SMALL
         self.act_btn = pygame.Rect(60, SCREEN_HEIGHT - 540, 130, 30)  # Кнопка действий
         self.inv_btn = pygame.Rect(60, SCREEN_HEIGHT - 500, 130, 30)  # Кнопка инвентаря
         self.sett_btn = pygame.Rect(60, SCREEN_HEIGHT - 460, 130, 30)  # Кнопка настроек
 
-        self.act_hovered = False  # Наведение на кнопку действий
-        self.inv_hovered = False  # Наведение на кнопку инвентаря
-        self.sett_hovered = False  # Наведение на кнопку настроек
+        self.buttons = {"actions": self.act_btn, "inventory": self.inv_btn, "settings": self.sett_btn}
+        self.hovered_button: Optional[str] = None  # Кнопка под курсором
 
-    def draw(self, surface, font):
+    def get_inputs(self) -> Any:
+        return self.hovered_button, self.locale.revision
+
+    def render(self, surface):
         """Отрисовка панели действий"""
-        panel_rect = pygame.Rect(50, 50, 150, SCREEN_HEIGHT - 470)
-        pygame.draw.rect(surface, UI_PANEL_BG, panel_rect, border_radius=10)
-        pygame.draw.rect(surface, WHITE, panel_rect, 2, border_radius=10)
-
-        # Кнопка действий
-        btn_color = UI_BUTTON_HOVER if self.act_hovered else UI_BUTTON_COLOR
-        pygame.draw.rect(surface, btn_color, self.act_btn, border_radius=5)
-        pygame.draw.rect(surface, WHITE, self.act_btn, 1, border_radius=5)
-        text = font.render(self.locale.get("ui.actions"), True, WHITE)
-        surface.blit(text, (self.act_btn.centerx - text.get_width() // 2,
-                            self.act_btn.centery - text.get_height() // 2))
-
-        # Кнопка инвентаря
-        btn_color = UI_BUTTON_HOVER if self.inv_hovered else UI_BUTTON_COLOR
-        pygame.draw.rect(surface, btn_color, self.inv_btn, border_radius=5)
-        pygame.draw.rect(surface, WHITE, self.inv_btn, 1, border_radius=5)
-        text = font.render(self.locale.get("ui.inventory"), True, WHITE)
-        surface.blit(text, (self.inv_btn.centerx - text.get_width() // 2,
-                            self.inv_btn.centery - text.get_height() // 2))
-
-        # Кнопка настроек
-        btn_color = UI_BUTTON_HOVER if self.sett_hovered else UI_BUTTON_COLOR
-        pygame.draw.rect(surface, btn_color, self.sett_btn, border_radius=5)
-        pygame.draw.rect(surface, WHITE, self.sett_btn, 1, border_radius=5)
-        text = font.render(self.locale.get("ui.settings"), True, WHITE)
-        surface.blit(text, (self.sett_btn.centerx - text.get_width() // 2,
-                            self.sett_btn.centery - text.get_height() // 2))
+        panel_cache.draw(surface, surface.get_rect(), UI_PANEL_BG, WHITE, 10, 2)
+
+        for name, text_key in (("actions", "ui.actions"), ("inventory", "ui.inventory"),
+                               ("settings", "ui.settings")):
+            local_btn = self.buttons[name].move(-self.rect.x, -self.rect.y)
+            btn_color = UI_BUTTON_HOVER if name == self.hovered_button else UI_BUTTON_COLOR
+            panel_cache.draw(surface, local_btn, btn_color, WHITE, 5, 1)
+            text = self.font.render(self.locale.get(text_key), True, WHITE)
+            surface.blit(text, (local_btn.centerx - text.get_width() // 2,
+                                local_btn.centery - text.get_height() // 2))
+
+    def set_hover(self, name, pos):
+        """Наведение на кнопку name; pos None - курсор ушёл"""
+        if pos is not None:
+            self.hovered_button = name
+        elif self.hovered_button == name:
+            self.hovered_button = None
+
+class ListView(Widget):
+    """
+    Виртуализированный список с кинетической прокруткой.
+
+    Рисуются только строки, попадающие в окно; готовые поверхности строк
+    кэшируются по (элемент, подсветка), поэтому кадр стоит одинаково
+    и для трёх, и для десяти тысяч элементов. get_items() должен
+    возвращать последовательность с быстрыми len() и доступом по индексу.
+    """
+
+    FRICTION = 5.0  # Затухание кинетической прокрутки, 1/с
+    WHEEL_SPEED = 900.0  # Скорость от одного щелчка колеса, пикс/с
+    MIN_SPEED = 10.0  # Скорость, ниже которой прокрутка останавливается
+    FLICK_TIMEOUT = 100  # Мс без движения перед отпусканием - бросок отменяется
+    MAX_ROWS = 64  # Сколько поверхностей строк хранить
+
+    def __init__(self, rect, get_items, render_row, row_height, row_size, selectable=True):
+        """
+        :param get_items: Функция, возвращающая элементы списка
+        :param render_row: render_row(surface, item, highlighted) рисует строку в поверхность row_size
+        :param row_height: Шаг строк по вертикали
+        :param row_size: Размер поверхности строки
+        :param selectable: Клавиши двигают выбор (иначе просто прокручивают)
+        """
+        super().__init__(rect)
+        self.get_items = get_items
+        self.render_row = render_row
+        self.row_height = row_height
+        self.row_size = row_size
+        self.selectable = selectable
+        self.scroll = 0.0  # Смещение содержимого, пикс
+        self.velocity = 0.0  # Скорость прокрутки, пикс/с
+        self.dragging = False
+        self.drag_y = 0
+        self.drag_time = 0
+        self.hover_pos: Optional[Tuple[int, int]] = None
+        self.hovered: Optional[int] = None
+        self.selected: Optional[int] = None  # Выбор с клавиатуры
+        self._rows: Dict[Tuple, pygame.Surface] = {}
+
+    def get_inputs(self) -> Any:
+        return len(self.get_items()), int(self.scroll), self.hovered, self.selected
+
+    @property
+    def max_scroll(self) -> float:
+        return max(0, len(self.get_items()) * self.row_height - self.rect.height)
+
+    def reset(self) -> None:
+        """Сброс прокрутки и выбора (новое прохождение)"""
+        self.scroll = self.velocity = 0.0
+        self.selected = self.hovered = None
+        self.invalidate()
+
+    def scroll_to(self, value: float) -> None:
+        """Прокручивает к смещению value с ограничением по краям"""
+        limit = self.max_scroll
+        if value <= 0 or value >= limit:
+            self.velocity = 0.0
+        self.scroll = min(max(value, 0.0), limit)
+        if self.hover_pos is not None:
+            self.hovered = self.index_at(self.hover_pos)
+
+    def index_at(self, pos: Tuple[int, int]) -> Optional[int]:
+        """Индекс строки под экранной точкой"""
+        if not self.rect.collidepoint(pos):
+            return None
+        offset = pos[1] - self.rect.y + self.scroll
+        index = int(offset // self.row_height)
+        if index >= len(self.get_items()) or offset - index * self.row_height >= self.row_size[1]:
+            return None
+        return index
+
+    def select(self, index: int) -> None:
+        """Выбирает строку и прокручивает так, чтобы она была видна"""
+        count = len(self.get_items())
+        if not count:
+            return
+        self.selected = min(max(index, 0), count - 1)
+        self.velocity = 0.0
+        top = self.selected * self.row_height
+        if top < self.scroll:
+            self.scroll_to(top)
+        elif top + self.row_size[1] > self.scroll + self.rect.height:
+            self.scroll_to(top + self.row_size[1] - self.rect.height)
 
-    def check_hover(self, pos):
-        """Проверка наведения на кнопки"""
-        self.act_hovered = self.act_btn.collidepoint(pos)
-        self.inv_hovered = self.inv_btn.collidepoint(pos)
-        self.sett_hovered = self.sett_btn.collidepoint(pos)
+    def update(self, dt: float) -> None:
+        """Кинетическая прокрутка"""
+        if self.dragging or not self.velocity:
+            return
+        self.scroll_to(self.scroll + self.velocity * dt)
+        self.velocity *= math.exp(-self.FRICTION * dt)
+        if abs(self.velocity) < self.MIN_SPEED:
+            self.velocity = 0.0
 
-class ActionsWindow:
-    """Окно действий"""
+    def is_animating(self) -> bool:
+        return bool(self.velocity) and not self.dragging
 
-    def __init__(self, save_system, locale):
-        self.save_system = save_system
-        self.locale = locale
-        self.show = False  # Видимость окна
-        self.act_close_btn = pygame.Rect(0, 0, 30, 30)  # Кнопка закрытия
-        self.act_close_hovered = False  # Наведение на кнопку закрытия
+    def next_deadline(self) -> Optional[int]:
+        return None
 
-    def draw(self, surface, font):
-        """Отрисовка окна действий"""
-        if not self.show:
-            return
+    def _row_surface(self, item, highlighted: bool) -> pygame.Surface:
+        key = (item, highlighted)
+        row = self._rows.pop(key, None)
+        if row is None:
+            row = pygame.Surface(self.row_size, pygame.SRCALPHA)
+            self.render_row(row, item, highlighted)
+            if len(self._rows) >= self.MAX_ROWS:
+                del self._rows[next(iter(self._rows))]  # Вытесняем самую давнюю
+        self._rows[key] = row
+        return row
+
+    def clear_cache(self) -> None:
+        """Сбрасывает кэш строк (например, после смены шрифта)"""
+        self._rows.clear()
+        self.invalidate()
+
+    def render(self, surface):
+        """Отрисовка видимых строк и полосы прокрутки"""
+        items = self.get_items()
+        count = len(items)
+        self.scroll = min(self.scroll, self.max_scroll)
+        scroll = int(self.scroll)
+
+        first = scroll // self.row_height
+        last = min(count, (scroll + self.rect.height) // self.row_height + 1)
+        for index in range(first, last):
+            highlighted = index == self.hovered or index == self.selected
+            surface.blit(self._row_surface(items[index], highlighted), (0, index * self.row_height - scroll))
+
+        content_height = count * self.row_height
+        if content_height > self.rect.height:
+            thumb_height = max(20, self.rect.height * self.rect.height // content_height)
+            thumb_y = scroll * (self.rect.height - thumb_height) // max(1, content_height - self.rect.height)
+            pygame.draw.rect(surface, UI_BUTTON_COLOR, (self.rect.width - 4, 0, 4, self.rect.height))
+            pygame.draw.rect(surface, WHITE, (self.rect.width - 4, thumb_y, 4, thumb_height))
+
+    def set_hover(self, pos):
+        """Наведение на строку (вызывается маршрутизатором ввода)"""
+        self.hover_pos = pos
+        self.hovered = self.index_at(pos) if pos is not None else None
 
-        act_rect = pygame.Rect(SCREEN_WIDTH // 2 - 200, SCREEN_HEIGHT // 2 - 200, 400, 400)
-        pygame.draw.rect(surface, (20, 20, 50), act_rect, border_radius=10)
-        pygame.draw.rect(surface, WHITE, act_rect, 2, border_radius=10)
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """Колесо мыши и перетаскивание с броском"""
+        now = game_clock.get_ticks()
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button in (4, 5):
+                direction = -1 if event.button == 4 else 1
+                if self.velocity * direction < 0:
+                    self.velocity = 0.0
+                self.velocity += direction * self.WHEEL_SPEED
+                return True
+            if event.button == 1:
+                self.dragging = True
+                self.velocity = 0.0
+                self.drag_y, self.drag_time = event.pos[1], now
+                return True
 
-        title = font.render(self.locale.get("ui.actions_title"), True, WHITE)
-        surface.blit(title, (act_rect.centerx - title.get_width() // 2, act_rect.y + 20))
+        elif event.type == pygame.MOUSEMOTION and self.dragging:
+            delta = event.pos[1] - self.drag_y
+            elapsed = max(1, now - self.drag_time)
+            self.scroll_to(self.scroll - delta)
+            # Сглаженная скорость пальца/мыши для броска
+            self.velocity = 0.7 * (-delta * 1000 / elapsed) + 0.3 * self.velocity
+            self.drag_y, self.drag_time = event.pos[1], now
+            return True
 
-        # Отрисовка доступных действий
-        actions = self.save_system.get_available_actions()
-        y_offset = 70
-        for action in actions:
-            action_rect = pygame.Rect(act_rect.x + 20, act_rect.y + y_offset, 360, 30)
-            is_hovered = action_rect.collidepoint(pygame.mouse.get_pos())
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.dragging:
+            self.dragging = False
+            if now - self.drag_time > self.FLICK_TIMEOUT or abs(self.velocity) < self.MIN_SPEED:
+                self.velocity = 0.0
+            return True
 
-            btn_color = UI_BUTTON_HOVER if is_hovered else UI_BUTTON_COLOR
-            pygame.draw.rect(surface, btn_color, action_rect, border_radius=5)
-            pygame.draw.rect(surface, WHITE, action_rect, 1, border_radius=5)
+        return False
 
-            text = font.render(action, True, WHITE)
-            surface.blit(text, (action_rect.x + 10, action_rect.y + 5))
-            y_offset += 40
+    def handle_key(self, key: int) -> bool:
+        """Навигация клавишами: стрелки, PageUp/PageDown, Home/End"""
+        count = len(self.get_items())
+        if not count:
+            return False
+        page = max(1, self.rect.height // self.row_height)
+        if not self.selectable:
+            steps = {pygame.K_UP: -1, pygame.K_DOWN: 1, pygame.K_PAGEUP: -page, pygame.K_PAGEDOWN: page,
+                     pygame.K_HOME: -count, pygame.K_END: count}
+            if key not in steps:
+                return False
+            self.velocity = 0.0
+            self.scroll_to(self.scroll + steps[key] * self.row_height)
+            return True
+
+        current = self.selected if self.selected is not None else -1
+        if key == pygame.K_UP:
+            self.select(max(current - 1, 0))
+        elif key == pygame.K_DOWN:
+            self.select(current + 1)
+        elif key == pygame.K_PAGEUP:
+            self.select(max(current - page, 0))
+        elif key == pygame.K_PAGEDOWN:
+            self.select(current + page)
+        elif key == pygame.K_HOME:
+            self.select(0)
+        elif key == pygame.K_END:
+            self.select(count - 1)
+        else:
+            return False
+        return True
+
+
+class PopupWindow(Widget):
+    """Всплывающее окно с заголовком, кнопкой закрытия и прокручиваемым списком"""
+
+    title_key = ""
+    state_events: Tuple[str, ...] = ()  # События состояния, меняющие содержимое окна
+    row_height = 30  # Шаг строк списка
+    row_size = (350, 30)  # Размер строки списка
+
+    def __init__(self, save_system, locale, font=None):
+        super().__init__((SCREEN_WIDTH // 2 - 200, SCREEN_HEIGHT // 2 - 200, 400, 400))
+        self.save_system = save_system
+        self.locale = locale
+        self.font = font or FONT_SMALL
+        self._visible = False
+        self.close_btn = pygame.Rect(self.rect.right - 40, self.rect.y + 10, 30, 30)  # Кнопка закрытия
+        self.close_hovered = False  # Наведение на кнопку закрытия
+        self.list_view = self.add_child(ListView((self.rect.x + 20, self.rect.y + 70, 360, 310),
+                                                 self.get_items, self.render_row, self.row_height, self.row_size))
+        if self.state_events:
+            save_system.subscribe(self._on_state_event, StateEventType.STATE_RESET, *self.state_events)
+
+    @property
+    def show(self) -> bool:
+        """Видимость окна"""
+        return self.visible
+
+    @show.setter
+    def show(self, value: bool) -> None:
+        self.visible = value
+
+    def _on_state_event(self, event: StateEvent) -> None:
+        if event.type == StateEventType.STATE_RESET:
+            self.list_view.reset()
+        self.list_view.invalidate()
+
+    def get_inputs(self) -> Any:
+        return self.locale.revision, self.close_hovered
+
+    def get_items(self) -> Sequence:
+        """Элементы списка окна"""
+        return ()
+
+    def render_row(self, surface, item, highlighted):
+        """Отрисовка одной строки списка"""
+
+    def render(self, surface):
+        """Отрисовка рамки, заголовка и кнопки закрытия"""
+        font = self.font
+        panel_cache.draw(surface, surface.get_rect(), (20, 20, 50), WHITE, 10, 2)
+
+        title = font.render(self.locale.get(self.title_key), True, WHITE)
+        surface.blit(title, (self.rect.width // 2 - title.get_width() // 2, 20))
 
         # Кнопка закрытия
-        self.act_close_btn.update(act_rect.right - 40, act_rect.y + 10, 30, 30)
-        btn_color = (230, 80, 80) if self.act_close_hovered else (200, 50, 50)
-        pygame.draw.rect(surface, btn_color, self.act_close_btn, border_radius=15)
+        local_close = self.close_btn.move(-self.rect.x, -self.rect.y)
+        btn_color = (230, 80, 80) if self.close_hovered else (200, 50, 50)
+        panel_cache.draw(surface, local_close, btn_color, radius=15)
         close_text = font.render("X", True, WHITE)
-        surface.blit(close_text, (self.act_close_btn.centerx - close_text.get_width() // 2,
-                                  self.act_close_btn.centery - close_text.get_height() // 2))
+        surface.blit(close_text, (local_close.centerx - close_text.get_width() // 2,
+                                  local_close.centery - close_text.get_height() // 2))
 
     def check_hover(self, pos):
-        """Проверка наведения на кнопку закрытия"""
-        self.act_close_hovered = self.act_close_btn.collidepoint(pos) if self.show else False
+        """Наведение внутри окна; pos None - курсор ушёл с окна"""
+        self.close_hovered = pos is not None and self.close_btn.collidepoint(pos)
 
     def handle_click(self, pos):
-        """Обработка кликов в окне действий"""
-        if not self.show:
-            return False
-
-        if self.act_close_btn.collidepoint(pos):
+        """Клик внутри окна: закрытие по кнопке, остальные клики окно поглощает"""
+        if self.close_btn.collidepoint(pos):
             self.show = False
-            return True
-        return False
+        return True
 
-class InventoryWindow:
-    """Окно инвентаря"""
+class ActionsWindow(PopupWindow):
+    """Окно действий"""
 
-    def __init__(self, save_system, locale):
-        self.save_system = save_system
-        self.locale = locale
-        self.show = False  # Видимость окна
-        self.inv_close_btn = pygame.Rect(0, 0, 30, 30)  # Кнопка закрытия
-        self.inv_close_hovered = False  # Наведение на кнопку закрытия
+    title_key = "ui.actions_title"
+    state_events = (StateEventType.ACTION_UNLOCKED, StateEventType.ACTION_LOCKED, StateEventType.ACTION_COMPLETED)
+    row_height = 40
 
-    def draw(self, surface, font):
-        """Отрисовка окна инвентаря"""
-        if not self.show:
-            return
+    def get_items(self) -> Sequence:
+        return self.save_system.get_available_actions()
 
-        inv_rect = pygame.Rect(SCREEN_WIDTH // 2 - 200, SCREEN_HEIGHT // 2 - 200, 400, 400)
-        pygame.draw.rect(surface, (20, 20, 50), inv_rect, border_radius=10)
-        pygame.draw.rect(surface, WHITE, inv_rect, 2, border_radius=10)
+    def render_row(self, surface, action, highlighted):
+        """Действие - кнопка со скруглённой рамкой"""
+        btn_color = UI_BUTTON_HOVER if highlighted else UI_BUTTON_COLOR
+        panel_cache.draw(surface, surface.get_rect(), btn_color, WHITE, 5, 1)
+        text = self.font.render(action, True, WHITE)
+        surface.blit(text, (10, 5))
 
-        title = font.render(self.locale.get("ui.inventory_title"), True, WHITE)
-        surface.blit(title, (inv_rect.centerx - title.get_width() // 2, inv_rect.y + 20))
+class InventoryWindow(PopupWindow):
+    """Окно инвентаря"""
 
-        # Отрисовка предметов инвентаря
-        inventory = self.save_system.get_inventory()
-        y_offset = 70
-        for item in inventory:
-            text = font.render(item, True, WHITE)
-            surface.blit(text, (inv_rect.x + 20, inv_rect.y + y_offset))
-            y_offset += 30
+    title_key = "ui.inventory_title"
+    state_events = (StateEventType.ITEM_ADDED, StateEventType.ITEM_REMOVED)
 
-        # Кнопка закрытия
-        self.inv_close_btn.update(inv_rect.right - 40, inv_rect.y + 10, 30, 30)
-        btn_color = (230, 80, 80) if self.inv_close_hovered else (200, 50, 50)
-        pygame.draw.rect(surface, btn_color, self.inv_close_btn, border_radius=15)
-        close_text = font.render("X", True, WHITE)
-        surface.blit(close_text, (self.inv_close_btn.centerx - close_text.get_width() // 2,
-                                  self.inv_close_btn.centery - close_text.get_height() // 2))
+    def get_items(self) -> Sequence:
+        return self.save_system.get_inventory()
 
-    def check_hover(self, pos):
-        """Проверка наведения на кнопку закрытия"""
-        self.inv_close_hovered = self.inv_close_btn.collidepoint(pos) if self.show else False
+    def render_row(self, surface, item, highlighted):
+        """Предмет - строка текста, выбранная подсвечивается"""
+        if highlighted:
+            panel_cache.draw(surface, surface.get_rect(), UI_BUTTON_COLOR, radius=5)
+        text = self.font.render(item, True, WHITE)
+        surface.blit(text, (0, 0))
 
-    def handle_click(self, pos):
-        """Обработка кликов в окне инвентаря"""
-        if not self.show:
-            return False
+class BacklogView(Widget):
+    """Экран истории диалога: виртуализированный список прочитанных строк"""
 
-        if self.inv_close_btn.collidepoint(pos):
-            self.show = False
+    LINE_HEIGHT = 22
+    SPEAKER, TEXT, CHOICE, GAP = range(4)  # Виды строк
+
+    def __init__(self, dialog_manager, locale, font=None):
+        super().__init__((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.dialog_manager = dialog_manager
+        self.locale = locale
+        self.font = font or FONT_SMALL
+        self._visible = False
+        self._lines: List[Tuple[int, str]] = []
+        self._entries: List[Optional[int]] = []  # Запись истории каждой строки (None - текущая реплика)
+        self._press_pos: Optional[Tuple[int, int]] = None
+        self._built_version = -1
+        self._history_lines = 0  # Строк из буфера (без текущей реплики)
+        self.panel = pygame.Rect(50, 40, SCREEN_WIDTH - 100, SCREEN_HEIGHT - 80)
+        self.text_width = self.panel.width - 50
+        self.list_view = self.add_child(ListView((self.panel.x + 20, self.panel.y + 50, self.panel.width - 30,
+                                                  self.panel.height - 60),
+                                                 lambda: self._lines, self.render_row, self.LINE_HEIGHT,
+                                                 (self.panel.width - 40, self.LINE_HEIGHT), selectable=False))
+
+    @property
+    def show(self) -> bool:
+        return self.visible
+
+    def get_inputs(self) -> Any:
+        return self.locale.revision
+
+    def _build_entry(self, node, kind: int) -> Tuple:
+        """Раскладка одной записи (реплики или выбора) по строкам"""
+        text = self.dialog_manager.story.text
+        if kind == DialogBacklog.CHOICE:
+            return (self.CHOICE, "> " + text(node.text)), (self.GAP, "")
+        rows = []
+        if node.speaker:
+            rows.append((self.SPEAKER, text(node.speaker)))
+        for line in self.dialog_manager._wrap_text(text(node.text), self.font, self.text_width):
+            rows.append((self.TEXT, line))
+        rows.append((self.GAP, ""))
+        return tuple(rows)
+
+    def _rebuild(self) -> None:
+        """Собирает плоский список строк; новые записи раскладываются, старые берутся из кэша"""
+        backlog = self.dialog_manager.backlog
+        if backlog.version != self._built_version:
+            lines, entries = [], []
+            for index in range(len(backlog)):
+                rows = backlog.layout(index, self._build_entry)
+                lines.extend(rows)
+                entries.extend([index] * len(rows))
+            self._lines, self._entries = lines, entries
+            self._built_version = backlog.version
+        else:
+            del self._lines[self._history_lines:]
+            del self._entries[self._history_lines:]
+        self._history_lines = len(self._lines)
+
+        current = self.dialog_manager.current_node
+        if current is not None and self.dialog_manager.current_text:
+            rows = self._build_entry(current, DialogBacklog.LINE)
+            self._lines.extend(rows)
+            self._entries.extend([None] * len(rows))
+
+    def open(self) -> None:
+        """Показывает историю, прокрученную к последней реплике"""
+        self._rebuild()
+        self.visible = True
+        self.list_view.velocity = 0.0
+        self.list_view.scroll_to(self.list_view.max_scroll)
+        self.list_view.invalidate()
+
+    def close(self) -> None:
+        self.visible = False
+
+    def render(self, surface):
+        """Затемнение, рамка и заголовок; строки рисует список"""
+        surface.fill((0, 0, 0, 200))
+        panel = self.panel
+        panel_cache.draw(surface, panel, (20, 20, 50), WHITE, 10, 2)
+        title = self.font.render(self.locale.get("ui.backlog_title"), True, WHITE)
+        surface.blit(title, (panel.centerx - title.get_width() // 2, panel.y + 15))
+
+    def render_row(self, surface, row, highlighted):
+        kind, text = row
+        if kind == self.GAP:
+            return
+        color = (255, 255, 0) if kind == self.SPEAKER else (180, 180, 255) if kind == self.CHOICE else WHITE
+        surface.blit(self.font.render(text, True, color), (0, 2))
+
+    def handle_event(self, event: pygame.event.Event) -> bool:
+        """
+        Прокрутка колесом вниз у нижнего края или правый клик закрывают историю,
+        щелчок (не перетаскивание) по записи возвращает историю к ней
+        """
+        list_view = self.list_view
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
+            self.close()
             return True
-        return False
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+            self._press_pos = event.pos
+        elif event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self._press_pos is not None:
+            moved = abs(event.pos[1] - self._press_pos[1]) > 4
+            self._press_pos = None
+            row = None if moved else list_view.index_at(event.pos)
+            if row is not None and self._entries[row] is not None:
+                list_view.handle_event(event)
+                if self.dialog_manager.rewind_to_entry(self._entries[row]):
+                    self.close()
+                return True
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 5 and list_view.scroll >= list_view.max_scroll:
+            self.close()
+            return True
+        if event.type == pygame.MOUSEMOTION:
+            list_view.set_hover(event.pos)
+        return list_view.handle_event(event) or True
+
+    def handle_key(self, key: int) -> bool:
+        """Клавиши истории; PageDown у нижнего края и Escape закрывают её"""
+        list_view = self.list_view
+        if key == pygame.K_ESCAPE or (key == pygame.K_PAGEDOWN and list_view.scroll >= list_view.max_scroll):
+            self.close()
+        else:
+            list_view.handle_key(key)
+        return True
 
 class GameUI:
     """Основной класс пользовательского интерфейса"""
@@ -1549,87 +2936,173 @@ class GameUI:
         self.actions_panel = ActionsPanel(self.locale)  # Панель действий
         self.actions_window = ActionsWindow(save_system, self.locale)  # Окно действий
         self.inventory_window = InventoryWindow(save_system, self.locale)  # Окно инвентаря
+        self.backlog_view = BacklogView(dialog_manager, self.locale)  # Экран истории диалога
+
+        # Удерживаемые панели: перерисовываются только при изменении входных данных
+        self.widgets = WidgetLayer((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        for widget in (self.stats_panel, self.actions_panel, self.actions_window, self.inventory_window):
+            self.widgets.add_child(widget)
 
-        # Состояние UI
-        self.last_click_pos = None  # Позиция последнего клика
+        # Полупрозрачный фон (создаётся один раз)
+        self.overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+        self.overlay.fill((0, 0, 0, 180))
+
+        # Маршрутизация ввода по областям экрана
+        self.router = InputRouter()
+        self._register_inputs()
 
     def draw(self, surface):
         """Отрисовка всех элементов интерфейса"""
-        # Полупрозрачный фон
-        s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-        s.fill((0, 0, 0, 180))
-        surface.blit(s, (0, 0))
+        surface.blit(self.overlay, (0, 0))
 
-        # Отрисовка компонентов
+        # Центральное изображение анимируется и рисуется каждый кадр
         self.central_image.draw(surface)
-        self.stats_panel.draw(surface, FONT_SMALL)
-        self.actions_panel.draw(surface, FONT_SMALL)
 
-        # Отрисовка окон, если они видимы
-        self.actions_window.draw(surface, FONT_SMALL)
-        self.inventory_window.draw(surface, FONT_SMALL)
+        # Панели и окна копируются из кэша
+        self.widgets.draw(surface)
 
         # Всегда отрисовываем диалоги
         self.dialog_manager.draw(surface)
 
-    def handle_click(self, pos):
-        """Обработка кликов мыши"""
-        # Сначала проверяем диалоги
-        if self.dialog_manager.handle_click(pos):
-            return True
-
-        self.last_click_pos = pos
-
-        # Проверка кнопок панели
-        if self.actions_panel.act_btn.collidepoint(pos):
+        self.backlog_view.draw(surface)
+
+    def _register_inputs(self):
+        """Регистрирует области ввода; z повторяет порядок отрисовки"""
+        router = self.router
+        dialog = self.dialog_manager
+
+        router.register(self.central_image.hover_rect, z=0, on_hover=self.central_image.set_hover)
+
+        for name, rect in self.actions_panel.buttons.items():
+            router.register(rect, z=10, on_click=lambda pos, n=name: self.toggle_window(n),
+                            on_hover=lambda pos, n=name: self.actions_panel.set_hover(n, pos))
+
+        for window in (self.actions_window, self.inventory_window):
+            router.register(window.rect, z=20, on_click=window.handle_click, on_hover=window.check_hover,
+                            active=lambda w=window: w.show)
+            router.register(window.list_view.rect, z=21, on_event=window.list_view.handle_event,
+                            on_hover=window.list_view.set_hover, active=lambda w=window: w.show)
+
+        in_dialog = lambda: dialog.show_dialog and not dialog.is_show_ending
+        router.register(dialog.dialog_rect, z=30, on_event=self._dialog_box_event, active=in_dialog)
+        router.register(dialog.back_rect, z=31, on_click=lambda pos: dialog.previous(),
+                        active=lambda: in_dialog() and dialog.can_go_back())
+        router.register(dialog.choices_area, z=30, on_click=dialog.handle_choice_click,
+                        on_hover=dialog.set_choice_hover, active=lambda: in_dialog() and dialog.waiting_for_choice)
+
+        # История диалога - модальный экран поверх всего, кроме концовки
+        self.backlog_target = router.register((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), z=90,
+                                              on_event=self.backlog_view.handle_event,
+                                              active=lambda: self.backlog_view.show)
+
+        # Экран концовки модально захватывает ввод (см. update)
+        self.ending_target = router.register((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), z=100,
+                                             on_click=dialog.handle_ending_click, on_hover=dialog.set_ending_hover,
+                                             active=lambda: dialog.is_show_ending)
+
+    def toggle_window(self, name):
+        """Переключает окно действий или инвентаря (открытым может быть только одно)"""
+        if name == "actions":
             self.actions_window.show = not self.actions_window.show
             self.inventory_window.show = False
-            return True
-        elif self.actions_panel.inv_btn.collidepoint(pos):
+        elif name == "inventory":
             self.inventory_window.show = not self.inventory_window.show
             self.actions_window.show = False
-            return True
-        elif self.actions_panel.sett_btn.collidepoint(pos):
-            # Обработка кнопки настроек
-            return True
+        self.router.refresh_hover()
 
-        # Проверка кнопок закрытия окон
-        if self.actions_window.handle_click(pos):
-            return True
-        if self.inventory_window.handle_click(pos):
-            return True
+    def handle_event(self, event):
+        """Передаёт событие мыши маршрутизатору"""
+        return self.router.dispatch(event)
+
+    def open_windows(self):
+        """Открытые окна со списками"""
+        return [window for window in (self.actions_window, self.inventory_window) if window.show]
 
+    def _dialog_box_event(self, event):
+        """Клик по диалоговому окну - дальше, колесо вверх - история"""
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            if event.button == 1:
+                return self.dialog_manager.handle_dialog_click(event.pos)
+            if event.button == 4:
+                self.open_backlog()
+                return True
         return False
 
-    def check_hover(self, pos):
-        """Проверка наведения на элементы интерфейса"""
-        self.actions_panel.check_hover(pos)
-        self.actions_window.check_hover(pos)
-        self.inventory_window.check_hover(pos)
+    def open_backlog(self):
+        """Открывает историю диалога и отдаёт ей ввод"""
+        self.backlog_view.open()
+        self.router.capture(self.backlog_target)
 
-    def update(self):
+    def handle_key(self, key):
+        """Клавиши экрана истории или списка открытого окна; True, если клавиша обработана"""
+        if self.backlog_view.show:
+            return self.backlog_view.handle_key(key)
+        if any(window.list_view.handle_key(key) for window in self.open_windows()):
+            return True
+        if key == pygame.K_PAGEUP and not self.dialog_manager.is_show_ending:
+            self.open_backlog()
+            return True
+        return False
+
+    def update(self, dt=0.0):
         """Обновление состояния интерфейса"""
+        for window in self.open_windows():
+            window.list_view.update(dt)
+
+        if self.backlog_view.show:
+            self.backlog_view.list_view.update(dt)
+            self.backlog_view.refresh()
+        elif self.router.captured is self.backlog_target:
+            self.router.release()
+
+        ending = self.dialog_manager.is_show_ending
+        if ending and self.router.captured is not self.ending_target:
+            self.router.capture(self.ending_target)
+        elif not ending and self.router.captured is self.ending_target:
+            self.router.release()
+
         self.central_image.update()
+        self.widgets.refresh()
+
+    def is_animating(self) -> bool:
+        """Анимируется ли хотя бы один компонент интерфейса"""
+        return (self.central_image.is_animating() or self.dialog_manager.is_animating() or
+                any(window.list_view.is_animating() for window in self.open_windows()) or
+                (self.backlog_view.show and self.backlog_view.list_view.is_animating()))
+
+    def next_deadline(self) -> Optional[int]:
+        """Ближайшее запланированное изменение среди компонентов"""
+        deadlines = [d for d in (self.central_image.next_deadline(), self.dialog_manager.next_deadline())
+                     if d is not None]
+        return min(deadlines) if deadlines else None
+
 
 class DialogManager:
-    def __init__(self, locale: 'Locale', save_system: 'SaveManager'):
+    def __init__(self, locale: 'Locale', save_system: 'SaveManager', backlog_size: int = BACKLOG_SIZE):
         # Основные параметры диалогового окна
         self.dialog_rect = pygame.Rect(50, 600 - 150, 800 - 100, 140)
         self.locale = locale
         self.save_system = save_system
 
         # Текущее состояние диалога
-        self.current_dialog: List[Dict] = []
         self.current_text: str = ""
         self.char_index: int = 0
         self.text_speed: int = 1
         self.last_update: int = 0
         self.update_delay: int = 30
 
+        # Промотка прочитанного: пока зажат Ctrl или включена переключателем
+        self.skip_held: bool = False
+        self.skip_toggled: bool = False
+        self._skip_time: int = 0
+
         # Система выбора
         self.question: Optional[str] = None
-        self.choices: List[Dict] = []
+        self.choices: Tuple[Choice, ...] = ()
         self.choice_rects: List[pygame.Rect] = []
+        self.available_choices: List[Choice] = []  # Выборы, прошедшие проверку условий
+        self.choice_buttons: List[pygame.Rect] = []  # Экранные прямоугольники доступных выборов
+        self.hovered_choice: Optional[int] = None
         self.choice_result: Optional[str] = None
         self.waiting_for_choice: bool = False
 
@@ -1644,15 +3117,23 @@ class DialogManager:
         self.scroll_speed: int = 2
         self.last_scroll_time: int = 0
 
-        # История диалогов
-        self.dialog_history: List[Dict] = []
-
         # Концовки
         self.is_show_ending: bool = False
         self.current_ending: Optional[str] = None
+        self.ending_hovered: bool = False
+
+        # Области ввода
+        self.choices_area = pygame.Rect(800 // 2 - 175, 0, 350, self.dialog_rect.y)
+        self.back_rect = pygame.Rect(self.dialog_rect.x + 10, self.dialog_rect.bottom - 30, 60, 20)
+        self.ending_button = pygame.Rect(800 // 2 - 100, 600 // 2 + 80, 200, 40)
 
-        # Загрузка диалогов
-        self.dialogs: Dict = self.load_dialogs()
+        # Граф сценария: один на все языки, сцены читаются из контейнера по мере надобности
+        self.story: StoryGraph = self._open_story(locale.default_lang)
+
+        # Проигрывание сценария; здесь остаётся только показ
+        self.engine = StoryEngine(self.story, save_system, backlog_size, on_ending=self.show_ending)
+        self.read_file = Path(__file__).parent / READ_FILE
+        self.engine.read.load(self.read_file, self.story)
 
         # Шрифты (должны быть инициализированы в основном коде)
         self.font_small = pygame.font.SysFont("Courier New", 16)
@@ -1669,15 +3150,6 @@ class DialogManager:
             'yellow': (255, 255, 0)
         }
 
-    def load_dialogs(self) -> Dict:
-        """Загружает диалоги из файла story.json"""
-        try:
-            with open('story.json', 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            print(f"Error loading dialogs: {e}")
-            return self._create_default_dialogs()
-
     def _create_default_dialogs(self) -> Dict:
         """Создает стандартные диалоги, если файл не найден"""
         return {
@@ -1711,21 +3183,109 @@ class DialogManager:
             }
         }
 
-    def start_dialog(self, dialog_id: str, language: str = "ru") -> None:
-        """Начинает новый диалог по идентификатору"""
-        self.dialog_history = []
+    def _open_story(self, language: str) -> StoryGraph:
+        """Открывает сценарий; при ошибке - стандартные диалоги"""
+        try:
+            story = open_story(STORY_FILE, language, STORY_PACK_FILE)
+        except (OSError, ValueError) as e:
+            print(f"Error loading dialogs: {e}")
+            story = StoryGraph.compile(self._create_default_dialogs(), language)
+        for scene_id, index, target in story.unresolved:
+            print(f"Scene {target} not found! ({scene_id}, {index})")
+        return story
 
-        if dialog_id not in self.dialogs or language not in self.dialogs[dialog_id]:
-            print(f"Dialog {dialog_id} not found for language {language}")
+    def set_language(self, language: str) -> None:
+        """Переключает язык реплик на лету: позиция, история и выборы остаются прежними"""
+        if language == self.story.language:
             return
+        try:
+            switched = self.story.set_language(language)
+        except (OSError, ValueError) as e:
+            print(f"Error loading '{language}' story strings: {e}")
+            return
+        if not switched:
+            print(f"Story has no '{language}' translation")
+            return
+        self.backlog.relayout()
+        self._refresh_text()
 
-        dialog_data = self.dialogs[dialog_id][language]
-        self.current_dialog = dialog_data.copy()
-        self.next()
+    def save_read(self, force: bool = False) -> None:
+        """Записывает прочитанные реплики пачками по READ_FLUSH_BATCH (force - сколько накопилось)"""
+        read = self.engine.read
+        if read.unsaved >= READ_FLUSH_BATCH or (force and read.unsaved):
+            try:
+                read.save(self.read_file, self.story)
+            except OSError as e:
+                print(f"Error saving read lines: {e}")
+                read.unsaved = 0  # Следующая попытка - со следующей пачкой, а не каждый кадр
+
+    def replace_story(self, story: StoryGraph) -> None:
+        """Подменяет перезагруженный сценарий, оставаясь на той же реплике, если она ещё есть"""
+        try:
+            story.set_language(self.story.language)
+        except (OSError, ValueError) as e:
+            print(f"Error loading '{self.story.language}' story strings: {e}")
+        for scene_id, index, target in story.unresolved:
+            print(f"Scene {target} not found! ({scene_id}, {index})")
+        self.story = story
+        if not self.engine.rebind(story) and self.engine.node is not None:
+            self.char_index = 0
+        self._refresh_text()
+
+    def _refresh_text(self) -> None:
+        """Заново берёт строки текущей реплики, не перезапуская печатную машинку"""
+        engine = self.engine
+        node = engine.node
+        if node is None or engine.finished:
+            self._finish_scene()
+        else:
+            typed = self.char_index >= len(self.current_text)
+            self.current_text = self.story.text(node.text)
+            self.speaker = self.story.text(node.speaker)
+            self.question = self.current_text if node.choices else None
+            self.choices = node.choices
+            self.waiting_for_choice = engine.waiting_for_choice
+            self.char_index = len(self.current_text) if typed else min(self.char_index, len(self.current_text))
+            self.scrolling_texts = {}
+        if engine.ending is not None:
+            self.current_ending = self.story.text(engine.ending)
+
+    def start_dialog(self, dialog_id: str, language: Optional[str] = None) -> None:
+        """Начинает новый диалог по идентификатору (и, если указан, на другом языке)"""
+        if language:
+            self.set_language(language)
+        if not self.engine.start(dialog_id):
+            print(f"Dialog {dialog_id} not found")
+            return
+        self._sync()
+
+    @property
+    def backlog(self) -> DialogBacklog:
+        """История диалога (ведёт движок)"""
+        return self.engine.backlog
+
+    @property
+    def current_node(self) -> Optional[Node]:
+        """Узел текущей реплики"""
+        return self.engine.node
+
+    @property
+    def cursor(self) -> Optional[Cursor]:
+        """Позиция текущей реплики в графе сценария"""
+        node = self.engine.node
+        return node.cursor if node is not None else None
+
+    @property
+    def skipping(self) -> bool:
+        return self.skip_held or self.skip_toggled
 
     def update(self) -> None:
-        """Обновляет состояние диалога (постепенное появление текста)"""
-        current_time = pygame.time.get_ticks()
+        """Обновляет состояние диалога (промотка, постепенное появление текста)"""
+        current_time = game_clock.get_ticks()
+        if self.skipping:
+            self._skip(current_time)
+        else:
+            self._skip_time = 0
 
         if (self.current_text and
                 self.char_index < len(self.current_text) and
@@ -1736,70 +3296,73 @@ class DialogManager:
                 self.char_index = len(self.current_text)
             self.last_update = current_time
 
+    def is_animating(self) -> bool:
+        """Каждый кадр меняются дрожание кнопки на экране концовки и реплики при промотке"""
+        return (self.is_show_ending and self.ending_hovered) or (self.skipping and self.engine.can_skip())
+
+    def _skip(self, now: int) -> None:
+        """
+        Промотка: за кадр проходится столько реплик, сколько набежало по
+        SKIP_SPEED, без печатной машинки; показывается только последняя.
+        На выборе, концовке и новой реплике переключатель выключается.
+        """
+        elapsed = min(now - self._skip_time, 100) if self._skip_time else 0
+        self._skip_time = now
+        engine = self.engine
+        if self.show_dialog and not self.is_show_ending and engine.skip(max(1, elapsed * SKIP_SPEED // 1000)):
+            self._sync()
+            if not engine.fresh:
+                self.char_index = len(self.current_text)
+        if not engine.can_skip():
+            self.skip_toggled = False
+
+    def next_deadline(self) -> Optional[int]:
+        """Время следующего шага печатной машинки или бегущей строки выбора"""
+        deadlines = []
+        if self.char_index < len(self.current_text):
+            deadlines.append(self.last_update + self.update_delay + 1)
+        elif self.waiting_for_choice and self.show_dialog and not self.is_show_ending:
+            deadlines.extend(state['last_update'] + 51 for state in self.scrolling_texts.values())
+        return min(deadlines) if deadlines else None
+
     def next(self) -> None:
         """Переходит к следующей реплике в диалоге"""
         if self.char_index < len(self.current_text):
             self.char_index = len(self.current_text)
             return
 
-        if self.waiting_for_choice:
-            return
+        if self.engine.advance():
+            self._sync()
 
-        if not self.current_dialog:
-            self.current_text = ""
-            self.question = None
-            self.choices = []
+    def _sync(self) -> None:
+        """Показывает реплику, на которой стоит движок"""
+        engine = self.engine
+        node = engine.node
+        if node is None or engine.finished:
+            self._finish_scene()
             return
 
-        dialog = self.current_dialog.pop(0)
-
-        # Сохраняем текущий диалог в историю
-        if self.current_text:
-            self.dialog_history.append({
-                "text": self.current_text,
-                "speaker": self.speaker,
-                "choices": self.choices.copy() if self.choices else None
-            })
-
-        self.current_text = dialog["text"]
+        self.current_text = self.story.text(node.text)
+        self.speaker = self.story.text(node.speaker)
+        self.question = self.current_text if node.choices else None
+        self.choices = node.choices
+        self.waiting_for_choice = engine.waiting_for_choice
+        if engine.replayed:
+            # Реплика уже читалась - показываем сразу целиком
+            self.char_index = len(self.current_text)
+            return
         self.char_index = 0
-        self.last_update = pygame.time.get_ticks()
-        self.speaker = dialog.get("speaker")
-
-        # Обработка специальных эффектов
-        self._process_dialog_effects(dialog)
-
-        # Обработка выбора
-        if "choices" in dialog:
-            self.question = self.current_text
-            self.choices = dialog["choices"]
+        self.last_update = game_clock.get_ticks()
+        if node.choices:
             self.choice_rects = []
-            self.waiting_for_choice = True
+            self.scrolling_texts = {}
 
-    def _process_dialog_effects(self, dialog: Dict) -> None:
-        """Обрабатывает эффекты, связанные с диалогом"""
-        if "change_stats" in dialog:
-            for stat, change in dialog["change_stats"].items():
-                self.save_system.update_character_stat(stat, change)
-
-        if "add_item" in dialog:
-            self.save_system.add_to_inventory(dialog["add_item"])
-
-        if "remove_item" in dialog:
-            self.save_system.remove_from_inventory(dialog["remove_item"])
-
-        if "unlock_action" in dialog:
-            self.save_system.unlock_action(dialog["unlock_action"])
-
-        if "set_flag" in dialog:
-            flag, value = dialog["set_flag"]
-            self.save_system.set_story_flag(flag, value)
-
-        if "ending" in dialog:
-            self.show_ending(dialog["ending"])
-
-        if "next_scene" in dialog and not self.waiting_for_choice:
-            self.start_scene(dialog["next_scene"])
+    def _finish_scene(self) -> None:
+        """Реплики сцены закончились"""
+        self.current_text = ""
+        self.question = None
+        self.choices = []
+        self.waiting_for_choice = False
 
     def previous(self) -> None:
         """Возвращается к предыдущей реплике в диалоге"""
@@ -1807,39 +3370,38 @@ class DialogManager:
             self.char_index = len(self.current_text)
             return
 
-        if not self.dialog_history or self.waiting_for_choice:
-            return
+        if self.engine.back():
+            self._sync()
 
-        last_dialog = self.dialog_history.pop()
+    def can_go_back(self) -> bool:
+        """Шаг назад возможен по прочитанным репликам, но не через сделанный выбор"""
+        return self.engine.can_go_back()
 
-        if self.current_text:
-            self.current_dialog.insert(0, {
-                "text": self.current_text,
-                "speaker": self.speaker,
-                "choices": self.choices.copy() if self.choices else None
-            })
-
-        self.current_text = last_dialog["text"]
-        self.char_index = len(self.current_text)
-        self.speaker = last_dialog["speaker"]
-        self.choices = last_dialog["choices"] if last_dialog["choices"] else []
-        self.waiting_for_choice = bool(last_dialog["choices"])
+    def rewind_to_entry(self, index: int) -> bool:
+        """Возвращает историю к записи истории диалога (реплике или вопросу сделанного выбора)"""
+        if not self.engine.rewind_to(self.backlog.mark(index)):
+            return False
+        self.is_show_ending = False
+        self.show_dialog = True
+        self._sync()
+        return True
 
     def draw(self, surface: pygame.Surface) -> None:
         """Отрисовывает диалоговое окно и связанные элементы"""
+        if self.is_show_ending:
+            self._draw_ending(surface)
+            return
+
         if not self.show_dialog:
             return
 
-        if self.is_show_ending:
-            self._draw_ending(surface)
-        else:
-            self._draw_dialog_window(surface)
+        self._draw_dialog_window(surface)
 
-            if self.waiting_for_choice and self.char_index >= len(self.current_text):
-                self._draw_choices(surface)
+        if self.waiting_for_choice and self.char_index >= len(self.current_text):
+            self._draw_choices(surface)
 
-            if self.dialog_history:
-                self._draw_back_button(surface)
+        if self.can_go_back():
+            self._draw_back_button(surface)
 
     def _draw_dialog_window(self, surface: pygame.Surface) -> None:
         """Отрисовывает основное диалоговое окно"""
@@ -1859,6 +3421,10 @@ class DialogManager:
             speaker_surface = self.font_small.render(self.speaker, True, self.COLORS['yellow'])
             dialog_surface.blit(speaker_surface, (20, 5))
 
+        if self.skipping:
+            skip_surface = self.font_small.render(">>", True, self.COLORS['yellow'])
+            dialog_surface.blit(skip_surface, (self.dialog_rect.width - skip_surface.get_width() - 10, 5))
+
         surface.blit(dialog_surface, self.dialog_rect)
 
     def _wrap_text(self, text: str, font: pygame.font.Font, max_width: int) -> List[str]:
@@ -1885,22 +3451,15 @@ class DialogManager:
         if not self.choices:
             return
 
-        current_time = pygame.time.get_ticks()
-        mouse_pos = pygame.mouse.get_pos()
-        stats = self.save_system.get_character_stats()
+        current_time = game_clock.get_ticks()
 
-        # Фильтрация доступных выборов по условиям
-        available_choices = [
-            choice for choice in self.choices
-            if not choice.get("conditions") or all(
-                stats.get(stat, 0) >= min_value
-                for stat, min_value in choice["conditions"].items()
-            )
-        ]
+        # Доступные выборы: движок проверяет условия один раз на версию состояния
+        available_choices = self.engine.available_choices()
 
         if not available_choices:
             self.waiting_for_choice = False
             return
+        self.available_choices = available_choices
 
         # Расчет размеров окна выбора
         choice_height = len(available_choices) * 40 + 40
@@ -1928,13 +3487,12 @@ class DialogManager:
             )
             self.choice_buttons.append(global_btn_rect)
 
-            is_hovered = global_btn_rect.collidepoint(mouse_pos)
+            is_hovered = i == self.hovered_choice
             btn_color = self.COLORS['button_hover'] if is_hovered else self.COLORS['button']
 
-            pygame.draw.rect(choice_surface, btn_color, btn_rect, border_radius=5)
-            pygame.draw.rect(choice_surface, self.COLORS['white'], btn_rect, 1, border_radius=5)
+            panel_cache.draw(choice_surface, btn_rect, btn_color, self.COLORS['white'], 5, 1)
 
-            text = choice["text"]
+            text = self.story.text(choice.text)
             text_surface = self.font_small.render(text, True, self.COLORS['white'])
 
             # Обработка длинного текста с прокруткой
@@ -1975,15 +3533,9 @@ class DialogManager:
 
     def _draw_back_button(self, surface: pygame.Surface) -> None:
         """Отрисовывает кнопку 'Назад'"""
-        back_btn = pygame.Rect(
-            self.dialog_rect.x + 10,
-            self.dialog_rect.y + self.dialog_rect.height - 30,
-            60,
-            20
-        )
+        back_btn = self.back_rect
 
-        pygame.draw.rect(surface, self.COLORS['button'], back_btn, border_radius=3)
-        pygame.draw.rect(surface, self.COLORS['white'], back_btn, 1, border_radius=3)
+        panel_cache.draw(surface, back_btn, self.COLORS['button'], self.COLORS['white'], 3, 1)
 
         back_text = self.font_small.render("Назад", True, self.COLORS['white'])
         surface.blit(back_text, (back_btn.x + 10, back_btn.y + 5))
@@ -1995,8 +3547,7 @@ class DialogManager:
         surface.blit(overlay, (0, 0))
 
         ending_rect = pygame.Rect(800 // 2 - 250, 600 // 2 - 150, 500, 300)
-        pygame.draw.rect(surface, (30, 30, 60), ending_rect, border_radius=10)
-        pygame.draw.rect(surface, self.COLORS['white'], ending_rect, 2, border_radius=10)
+        panel_cache.draw(surface, ending_rect, (30, 30, 60), self.COLORS['white'], 10, 2)
 
         title = self.font_large.render("КОНЦОВКА", True, self.COLORS['white'])
         surface.blit(title, (ending_rect.centerx - title.get_width() // 2, ending_rect.y + 20))
@@ -2010,12 +3561,11 @@ class DialogManager:
             )
         )
 
-        menu_btn = pygame.Rect(ending_rect.centerx - 100, ending_rect.bottom - 70, 200, 40)
-        is_hovered = menu_btn.collidepoint(pygame.mouse.get_pos())
+        menu_btn = self.ending_button.copy()
+        is_hovered = self.ending_hovered
         btn_color = self.COLORS['button_hover'] if is_hovered else self.COLORS['button']
 
-        pygame.draw.rect(surface, btn_color, menu_btn, border_radius=5)
-        pygame.draw.rect(surface, self.COLORS['white'], menu_btn, 1, border_radius=5)
+        panel_cache.draw(surface, menu_btn, btn_color, self.COLORS['white'], 5, 1)
 
         btn_text = self.font_small.render("В главное меню", True, self.COLORS['white'])
         surface.blit(
@@ -2031,98 +3581,66 @@ class DialogManager:
             shake_y = random.randint(-1, 1)
             menu_btn.move_ip(shake_x, shake_y)
 
-    def handle_click(self, pos: Tuple[int, int]) -> bool:
-        """Обрабатывает клики мыши"""
-        if not self.show_dialog:
-            return False
+    def _choice_at(self, pos: Tuple[int, int]) -> Optional[int]:
+        """Индекс показанного варианта выбора под точкой"""
+        if not self.waiting_for_choice or self.char_index < len(self.current_text):
+            return None
+        for i, btn_rect in enumerate(self.choice_buttons):
+            if btn_rect.collidepoint(pos):
+                return i
+        return None
 
-        if self.is_show_ending:
-            return self._handle_ending_click(pos)
-
-        # Обработка кнопки "Назад"
-        if self.dialog_history:
-            back_btn = pygame.Rect(
-                self.dialog_rect.x + 10,
-                self.dialog_rect.y + self.dialog_rect.height - 30,
-                60,
-                20
-            )
-            if back_btn.collidepoint(pos):
-                self.previous()
-                return True
+    def set_choice_hover(self, pos: Optional[Tuple[int, int]]) -> None:
+        """Наведение на варианты выбора (pos None - курсор ушёл)"""
+        self.hovered_choice = self._choice_at(pos) if pos is not None else None
 
-        # Обработка выбора
-        if self.waiting_for_choice and hasattr(self, 'choice_buttons'):
-            for i, btn_rect in enumerate(self.choice_buttons):
-                if btn_rect.collidepoint(pos):
-                    choice = self.choices[i]
-                    self._handle_choice_effects(choice)
-
-                    next_step = choice.get("next_scene", choice.get("next"))
-                    if next_step:
-                        if "next_scene" in choice:
-                            self.start_scene(next_step)
-                        else:
-                            self.start_dialog(next_step)
-                    else:
-                        self.next()
-                    return True
-
-        # Обработка клика по диалоговому окну
-        if self.dialog_rect.collidepoint(pos):
-            self.next()
-            return True
+    def set_ending_hover(self, pos: Optional[Tuple[int, int]]) -> None:
+        """Наведение на кнопку экрана концовки"""
+        self.ending_hovered = pos is not None and self.ending_button.collidepoint(pos)
 
-        return False
+    def handle_choice_click(self, pos: Tuple[int, int]) -> bool:
+        """Обрабатывает клик по варианту выбора"""
+        index = self._choice_at(pos)
+        if index is None:
+            return False
 
-    def _handle_choice_effects(self, choice: Dict) -> None:
-        """Обрабатывает эффекты выбора"""
-        self.choice_result = choice.get("next")
-        self.waiting_for_choice = False
-        self.choices = []
+        choice = self.available_choices[index]
+        self.hovered_choice = None
+        self.choice_result = self.story.scene_id(choice.target) if choice.target is not None else None
         self.choice_buttons = []
+        if self.engine.choose(choice):
+            self._sync()
+        return True
 
-        if "conditions" in choice:
-            stats = self.save_system.get_character_stats()
-            for stat, min_value in choice["conditions"].items():
-                if stats.get(stat, 0) < min_value:
-                    return
-
-        if "change_stats" in choice:
-            for stat, change in choice["change_stats"].items():
-                self.save_system.update_character_stat(stat, change)
-
-        if "remove_item" in choice:
-            self.save_system.remove_from_inventory(choice["remove_item"])
-
-        if "add_item" in choice:
-            self.save_system.add_to_inventory(choice["add_item"])
-
-        if "unlock_action" in choice:
-            self.save_system.unlock_action(choice["unlock_action"])
-
-        if "set_flag" in choice:
-            flag, value = choice["set_flag"]
-            self.save_system.set_story_flag(flag, value)
-
-        if "next_scene" in choice:
-            self.start_scene(choice["next_scene"])
+    def handle_dialog_click(self, pos: Tuple[int, int]) -> bool:
+        """Клик по диалоговому окну - следующая реплика"""
+        self.next()
+        return True
 
-    def _handle_ending_click(self, pos: Tuple[int, int]) -> bool:
-        """Обрабатывает клики на экране концовки"""
-        menu_btn = pygame.Rect(800 // 2 - 100, 600 // 2 + 80, 200, 40)
-        if menu_btn.collidepoint(pos):
+    def handle_ending_click(self, pos: Tuple[int, int]) -> bool:
+        """Обрабатывает клики на экране концовки (экран поглощает все клики)"""
+        if self.ending_button.collidepoint(pos):
             self.is_show_ending = False
-            return True
-        return False
+            self.ending_hovered = False
+        return True
 
     def start_scene(self, scene_id: str) -> None:
         """Начинает новую сцену"""
-        if scene_id in self.dialogs:
-            self.current_dialog = self.dialogs[scene_id]["ru"].copy()
-            self.next()
-        else:
+        if not self.engine.jump(scene_id):
             print(f"Scene {scene_id} not found!")
+            return
+        self._sync()
+
+    def get_position(self) -> Optional[Tuple[str, int]]:
+        """Позиция в истории для сохранения: (сцена, номер реплики)"""
+        return self.engine.position()
+
+    def restore_position(self, scene_id: str, index: int) -> bool:
+        """Возвращает курсор на сохранённую реплику (эффекты уже учтены в сохранении)"""
+        if not self.engine.restore(scene_id, index):
+            return False
+        self._sync()
+        return True
 
     def show_ending(self, ending_title: str) -> None:
         """Показывает экран концовки"""
@@ -2130,3 +3648,575 @@ class DialogManager:
         self.current_ending = ending_title
         self.show_dialog = False
 
+
+class Display:
+    """
+    Слой вывода на экран.
+
+    Весь интерфейс рисуется в логический холст SCREEN_WIDTH x SCREEN_HEIGHT,
+    который один раз за кадр переносится в окно самым быстрым доступным
+    способом: напрямую (размеры совпадают), флагом SCALED (масштабирует
+    SDL, в полноэкранном режиме), целочисленным scale или smoothscale
+    с сохранением пропорций. Координаты мыши переводятся обратно в
+    логическое пространство, поэтому смена разрешения не затрагивает UI.
+    """
+
+    def __init__(self, logical_size: Tuple[int, int] = (SCREEN_WIDTH, SCREEN_HEIGHT)):
+        self.logical_size = logical_size
+        self.window: Optional[pygame.Surface] = None
+        self.canvas: Optional[pygame.Surface] = None
+        self.viewport = pygame.Rect((0, 0), logical_size)  # Область холста в окне
+        self.mode = "direct"  # direct / scaled / integer / smooth
+        self._target: Optional[pygame.Surface] = None
+        self._buffer: Optional[pygame.Surface] = None  # Отдельный холст для режимов с масштабированием
+
+    def parse_resolution(self, resolution: Any) -> Tuple[int, int]:
+        """Разбирает разрешение из настроек ("800x600" или [800, 600])"""
+        try:
+            if isinstance(resolution, str):
+                width, height = (int(part) for part in resolution.lower().split("x"))
+            else:
+                width, height = (int(part) for part in resolution)
+            if width > 0 and height > 0:
+                return width, height
+        except (TypeError, ValueError):
+            pass
+        return self.logical_size
+
+    def apply(self, resolution: Any, fullscreen: bool) -> None:
+        """Открывает окно с нужным разрешением или полноэкранный режим"""
+        if fullscreen:
+            try:
+                # SDL сам масштабирует логический размер на весь экран и переводит координаты мыши
+                self.window = pygame.display.set_mode(self.logical_size, pygame.FULLSCREEN | pygame.SCALED)
+                self._configure(scaled=True)
+                return
+            except pygame.error as e:
+                print(f"SCALED недоступен, используется программное масштабирование: {e}")
+            desktop_size = pygame.display.get_desktop_sizes()[0]
+            self.window = pygame.display.set_mode(desktop_size, pygame.FULLSCREEN)
+        else:
+            self.window = pygame.display.set_mode(self.parse_resolution(resolution), pygame.RESIZABLE)
+        self._configure()
+
+    def resize(self, size: Tuple[int, int]) -> None:
+        """Обработка изменения размера окна пользователем"""
+        if self.mode == "scaled":
+            return
+        self.window = pygame.display.get_surface()
+        if self.window is None or self.window.get_size() != tuple(size):
+            self.window = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self._configure()
+
+    def _configure(self, scaled: bool = False) -> None:
+        """Выбирает способ вывода для текущего размера окна"""
+        logical_w, logical_h = self.logical_size
+        window_w, window_h = self.window.get_size()
+
+        if scaled or (window_w, window_h) == self.logical_size:
+            # Рисуем прямо в поверхность окна
+            self.mode = "scaled" if scaled else "direct"
+            self.canvas = self.window
+            self.viewport = self.window.get_rect()
+            self._target = None
+            return
+
+        factor = min(window_w / logical_w, window_h / logical_h)
+        self.mode = "integer" if factor >= 1 and factor == int(factor) else "smooth"
+        self.viewport = pygame.Rect(0, 0, int(logical_w * factor), int(logical_h * factor))
+        self.viewport.center = (window_w // 2, window_h // 2)
+
+        if self._buffer is None:
+            self._buffer = pygame.Surface(self.logical_size).convert()
+        self.canvas = self._buffer
+
+        # Поля по краям закрашиваются один раз, в кадре обновляется только viewport
+        self.window.fill((0, 0, 0))
+        self._target = self.window.subsurface(self.viewport)
+
+    def present(self) -> None:
+        """Переносит холст в окно и показывает кадр"""
+        if self.mode == "integer":
+            pygame.transform.scale(self.canvas, self.viewport.size, self._target)
+        elif self.mode == "smooth":
+            pygame.transform.smoothscale(self.canvas, self.viewport.size, self._target)
+        pygame.display.flip()
+
+    def to_logical(self, pos: Tuple[int, int]) -> Tuple[int, int]:
+        """Переводит координаты окна в координаты логического холста"""
+        if self.mode in ("direct", "scaled"):
+            return pos
+        logical_w, logical_h = self.logical_size
+        x = (pos[0] - self.viewport.x) * logical_w // max(1, self.viewport.width)
+        y = (pos[1] - self.viewport.y) * logical_h // max(1, self.viewport.height)
+        return int(x), int(y)
+
+    def get_mouse_pos(self) -> Tuple[int, int]:
+        """Позиция мыши в логических координатах"""
+        return self.to_logical(pygame.mouse.get_pos())
+
+    def map_event(self, event: pygame.event.Event) -> None:
+        """Переводит координаты событий мыши в логическое пространство"""
+        if self.mode in ("direct", "scaled") or not hasattr(event, "pos"):
+            return
+        if event.type not in (pygame.MOUSEMOTION, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP):
+            return
+        event.pos = self.to_logical(event.pos)
+        if hasattr(event, "rel"):
+            event.rel = (event.rel[0] * self.logical_size[0] // max(1, self.viewport.width),
+                         event.rel[1] * self.logical_size[1] // max(1, self.viewport.height))
+
+
+display = Display()
+
+
+class IdleScheduler:
+    """
+    Планировщик кадров с режимом простоя.
+
+    Компоненты сообщают, анимируются ли они прямо сейчас (is_animating)
+    и когда наступит их следующее изменение по времени (next_deadline,
+    в тиках pygame). Если ничего не анимируется, цикл блокируется в
+    pygame.event.wait до ввода или ближайшего дедлайна вместо того,
+    чтобы перерисовывать неизменный кадр 60 раз в секунду.
+    """
+
+    def __init__(self, fps: int = FPS, max_wait: int = IDLE_MAX_WAIT):
+        self.fps = fps
+        self.max_wait = max_wait
+        self.clock = pygame.time.Clock()
+        self.dt = 0.0  # Секунды с прошлого кадра
+        self.idle = False  # Был ли последний кадр получен после ожидания
+        self.paused = False  # Отрисовка остановлена (окно свёрнуто)
+        self._redraw_requested = True
+
+    def request_redraw(self) -> None:
+        """Запрашивает ещё один кадр без ожидания"""
+        self._redraw_requested = True
+
+    def pause(self) -> None:
+        """Останавливает кадры: wait() только ждёт событий"""
+        self.paused = True
+
+    def resume(self) -> None:
+        """Возобновляет кадры, не засчитывая время паузы в dt"""
+        if self.paused:
+            self.paused = False
+            self.clock.tick()
+            self._redraw_requested = True
+
+    def wait(self, components) -> List[pygame.event.Event]:
+        """Ожидает следующего кадра и возвращает накопившиеся события"""
+        if self.paused:
+            self.idle = True
+            self.dt = 0.0
+            event = pygame.event.wait(self.max_wait)
+            events = [] if event.type == pygame.NOEVENT else [event]
+            events.extend(pygame.event.get())
+            return events
+
+        deadline = None
+        animating = self._redraw_requested
+        for component in components:
+            if animating:
+                break
+            if component.is_animating():
+                animating = True
+                break
+            component_deadline = component.next_deadline()
+            if component_deadline is not None and (deadline is None or component_deadline < deadline):
+                deadline = component_deadline
+
+        self._redraw_requested = False
+
+        if not animating:
+            timeout = self.max_wait
+            if deadline is not None:
+                timeout = min(timeout, deadline - game_clock.get_ticks())
+            # event.wait(0) ждёт бесконечно, поэтому наступивший дедлайн обрабатываем без ожидания
+            if timeout > 0:
+                self.idle = True
+                event = pygame.event.wait(timeout)
+                self.dt = self.clock.tick() / 1000
+                events = [] if event.type == pygame.NOEVENT else [event]
+                events.extend(pygame.event.get())
+                return events
+
+        self.idle = False
+        self.dt = self.clock.tick(self.fps) / 1000
+        return pygame.event.get()
+
+
+class Game:
+    """Главный цикл игры"""
+
+    WINDOW_EVENTS = (pygame.WINDOWFOCUSLOST, pygame.WINDOWFOCUSGAINED, pygame.WINDOWMINIMIZED,
+                     pygame.WINDOWHIDDEN, pygame.WINDOWRESTORED, pygame.WINDOWSHOWN)
+
+    def __init__(self):
+        # Настройки и системы
+        self.settings_config = SettingsConfig()
+        self.settings_manager = SettingsManager(self.settings_config)
+        self.settings_manager.load_settings()
+        language = self.settings_config.get("language", "ru")
+
+        self.display = display
+        self.display.apply(self.settings_config.get("resolution"), self.settings_config.get("fullscreen", False))
+        pygame.display.set_caption(GAME_TITLE)
+
+        self.locale = Locale()
+        self.locale.set_default_language(language)
+        self.save_system = SaveManager(locale=self.locale)
+        self.dialog_manager = DialogManager(self.locale, self.save_system,
+                                            self.settings_config.get("backlog_size", BACKLOG_SIZE))
+        self.game_ui = GameUI(self.save_system, self.dialog_manager, self.settings_config)
+        self.game_ui.locale.set_default_language(language)
+        self.settings_ui = SettingsUI(self.settings_config, self.settings_manager, language)
+        self.music_player = MusicPlayer(MUSIC_FOLDER, self.settings_config.get("music_volume", 0.5))
+        self.scheduler = IdleScheduler()
+        self.profiler = FrameProfiler()
+
+        # Правки сценария и переводов подхватываются на лету; чтение и компиляция - в фоновом потоке
+        self.reloader: Optional[HotReloader] = None
+        if HOT_RELOAD:
+            self.reloader = HotReloader(STORY_FILE, Path(__file__).parent / 'locales.json', self.dialog_manager.story,
+                                        notify=lambda: pygame.event.post(pygame.event.Event(HOT_RELOAD_EVENT)))
+            self.reloader.start()
+
+        # Фокус и видимость окна
+        self.focused = True
+        self.minimized = False
+
+        # Фон и эффекты
+        self.starfield = Starfield(SCREEN_WIDTH, SCREEN_HEIGHT, STAR_COUNT)
+        self.particles = ParticleSystem()
+        self.shake = ShakeEffect()
+
+        # Состояние
+        self.state = GameState.MENU
+        self.show_settings = False
+        self.running = True
+        self.zoom_factor = 1.0
+        self.target_star = [CENTER_X, CENTER_Y]
+
+        button_x = CENTER_X - BUTTON_WIDTH // 2
+        self.buttons = [
+            Button(button_x, CENTER_Y - 60, BUTTON_WIDTH, BUTTON_HEIGHT, "menu.play", self.start_zoom, self.locale),
+            Button(button_x, CENTER_Y + 10, BUTTON_WIDTH, BUTTON_HEIGHT, "menu.settings", self.open_settings,
+                   self.locale),
+            Button(button_x, CENTER_Y + 80, BUTTON_WIDTH, BUTTON_HEIGHT, "menu.quit", self.quit, self.locale)
+        ]
+
+        # Ввод меню: кнопки и модальное окно настроек
+        self.router = InputRouter()
+        in_menu = lambda: self.state == GameState.MENU
+        for button in self.buttons:
+            self.router.register(button.original_rect, z=10, on_event=button.handle_event,
+                                 on_hover=lambda pos, b=button: b.set_hovered(pos is not None), active=in_menu)
+        self.settings_target = self.router.register((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), z=100,
+                                                    on_event=self._handle_settings_event,
+                                                    active=lambda: self.show_settings)
+        self.settings_ui.register_inputs(self.router, z=101, active=lambda: self.show_settings)
+
+    def start_zoom(self) -> None:
+        """Запускает переход от меню к игре"""
+        self.state = GameState.ZOOM
+        self.zoom_factor = 1.0
+        if self.starfield.stars:
+            self.target_star[:] = random.choice(self.starfield.stars)[:2]
+        self.particles.add_particles(self.target_star, PARTICLE_COUNT)
+
+    def start_story(self) -> None:
+        """Начинает историю с первой сцены"""
+        self.save_system.reset_game()
+        self.dialog_manager.show_dialog = True
+        self.dialog_manager.start_dialog("start", self.settings_config.get("language", "ru"))
+
+    def open_settings(self) -> None:
+        self.show_settings = True
+        self.router.capture(self.settings_target)
+
+    def close_settings(self) -> None:
+        self.show_settings = False
+        self.router.release(self.settings_target)
+
+    def set_fullscreen(self, fullscreen: bool) -> None:
+        """Переключает полноэкранный режим без пересоздания интерфейса"""
+        self.settings_config.set("fullscreen", fullscreen)
+        self.settings_ui.toggle_buttons['fullscreen']['state'] = fullscreen
+        self.display.apply(self.settings_config.get("resolution"), fullscreen)
+        self.scheduler.request_redraw()
+
+    def set_language(self, language: str) -> None:
+        """Меняет язык интерфейса и реплик, не прерывая историю"""
+        self.settings_config.set("language", language)
+        self.locale.set_default_language(language)
+        self.game_ui.locale.set_default_language(language)
+        self.settings_ui.set_language(language)
+        self.dialog_manager.set_language(language)
+        self.scheduler.request_redraw()
+
+    def apply_reloads(self) -> None:
+        """Подменяет то, что наблюдатель уже прочитал и скомпилировал в фоне"""
+        for result in self.reloader.poll():
+            if isinstance(result, StoryReload):
+                self.dialog_manager.replace_story(result.story)
+                print(f"Story reloaded: scenes [{', '.join(result.scenes)}], strings [{', '.join(result.languages)}]")
+            elif isinstance(result, LocaleReload):
+                for locale in (self.locale, self.game_ui.locale, self.settings_ui.locale):
+                    locale.patch(result.sections)
+                print(f"Locales reloaded: {', '.join(f'{lang}.{section}' for lang, section in result.sections)}")
+            else:
+                print(f"Reload of {result.path} failed: {result.error}")
+        self.scheduler.request_redraw()
+
+    def set_resolution(self, resolution: str) -> None:
+        """Меняет размер окна; логический холст и интерфейс остаются прежними"""
+        self.settings_config.set("resolution", resolution)
+        self.settings_ui.toggle_buttons['resolution']['state'] = resolution
+        self.display.apply(resolution, self.settings_config.get("fullscreen", False))
+        self.scheduler.request_redraw()
+
+    def quit(self) -> None:
+        self.running = False
+
+    def animated_components(self) -> list:
+        """Компоненты, от которых зависит необходимость перерисовки"""
+        components = [self.particles, self.shake]
+        if self.state == GameState.PLAY:
+            components.append(self.game_ui)
+        else:
+            components.append(self.starfield)
+            components.extend(self.buttons)
+            if self.show_settings:
+                components.append(self.settings_ui)
+        components.append(self)
+        return components
+
+    def is_animating(self) -> bool:
+        return self.state == GameState.ZOOM
+
+    def next_deadline(self) -> Optional[int]:
+        """Мигание заголовка меню"""
+        if self.state != GameState.MENU:
+            return None
+        ticks = game_clock.get_ticks()
+        return ticks - ticks % TITLE_BLINK_PERIOD + TITLE_BLINK_PERIOD
+
+    def run(self) -> None:
+        """Главный цикл"""
+        self.music_player.play()
+
+        while self.running:
+            events = self.scheduler.wait(self.animated_components())
+            self.handle_events(events)
+            self.profiler.sample(self.in_background, rendered=not self.scheduler.paused)
+            if self.scheduler.paused:
+                continue
+
+            self.update(self.scheduler.dt)
+            self.draw()
+            self.display.present()
+
+        if self.reloader is not None:
+            self.reloader.stop()
+        self.dialog_manager.save_read(force=True)
+        self.settings_manager.save_settings()
+        pygame.quit()
+
+    def handle_events(self, events: List[pygame.event.Event]) -> None:
+        """Обработка событий"""
+        self.music_player.update(events)
+
+        for event in events:
+            self.display.map_event(event)
+
+            if event.type == pygame.QUIT:
+                self.running = False
+
+            elif event.type == pygame.VIDEORESIZE:
+                self.display.resize(event.size)
+
+            elif event.type in self.WINDOW_EVENTS:
+                self._handle_window_event(event)
+
+            elif event.type == HOT_RELOAD_EVENT:
+                if self.reloader is not None:
+                    self.apply_reloads()
+
+            elif event.type == pygame.KEYDOWN:
+                self._handle_key(event)
+
+            elif self.state == GameState.PLAY and not self.show_settings:
+                self.game_ui.handle_event(event)
+
+            else:
+                self.router.dispatch(event)
+
+    @property
+    def in_background(self) -> bool:
+        """Окно без фокуса или свёрнуто"""
+        return not self.focused or self.minimized
+
+    def _handle_window_event(self, event: pygame.event.Event) -> None:
+        """Отслеживание фокуса и видимости окна"""
+        if event.type == pygame.WINDOWFOCUSLOST:
+            self.focused = False
+        elif event.type == pygame.WINDOWFOCUSGAINED:
+            self.focused = True
+        elif event.type in (pygame.WINDOWMINIMIZED, pygame.WINDOWHIDDEN):
+            self.minimized = True
+        elif event.type in (pygame.WINDOWRESTORED, pygame.WINDOWSHOWN):
+            self.minimized = False
+        self._apply_background_mode()
+
+    def _apply_background_mode(self) -> None:
+        """Снижает частоту кадров, ставит анимации на паузу и приглушает музыку в фоне"""
+        background = self.in_background
+        pause = self.minimized or (background and self.settings_config.get("background_pause", False))
+
+        self.scheduler.fps = self.settings_config.get("background_fps", 5) if background else FPS
+        if pause:
+            self.scheduler.pause()
+            game_clock.pause()
+        else:
+            game_clock.resume()
+            self.scheduler.resume()
+
+        if background and self.settings_config.get("background_duck", True):
+            self.music_player.duck(self.settings_config.get("background_duck_volume", 0.3))
+        else:
+            self.music_player.unduck()
+
+    def _handle_key(self, event: pygame.event.Event) -> None:
+        """Обработка клавиатуры"""
+        if event.key == pygame.K_F11:  # F11 - полноэкранный режим
+            self.set_fullscreen(not self.settings_config.get("fullscreen", False))
+        elif event.key == pygame.K_m:  # M - выключить/включить звук
+            if pygame.mixer.music.get_volume() > 0:
+                self.music_player.set_volume(0)
+            else:
+                self.music_player.set_volume(self.settings_config.get("music_volume", 0.5))
+        elif event.key == pygame.K_ESCAPE:
+            if self.show_settings:
+                self.close_settings()
+            elif self.state == GameState.PLAY and self.game_ui.backlog_view.show:
+                self.game_ui.backlog_view.close()
+                return
+            elif self.state == GameState.PLAY:
+                self.state = GameState.MENU
+
+        if self.state != GameState.PLAY:
+            return
+
+        if self.game_ui.handle_key(event.key):
+            return
+
+        dialog = self.dialog_manager
+        if event.key in (pygame.K_RIGHT, pygame.K_SPACE):
+            if dialog.current_text or dialog.question:
+                dialog.next()
+        elif event.key == pygame.K_LEFT:
+            if dialog.current_text or dialog.question:
+                dialog.previous()
+        elif event.key == pygame.K_TAB:  # Tab - промотка прочитанного (или удерживать Ctrl)
+            dialog.skip_toggled = not dialog.skip_toggled
+        elif event.key == pygame.K_i:
+            self.game_ui.toggle_window("inventory")
+        elif event.key == pygame.K_a:
+            self.game_ui.toggle_window("actions")
+
+    def _handle_settings_event(self, event: pygame.event.Event) -> bool:
+        """Окно настроек модально получает все события мыши"""
+        self._handle_settings_result(self.settings_ui.handle_event(event))
+        return True
+
+    def _handle_settings_result(self, result: Optional[str]) -> None:
+        """Применение результата взаимодействия с окном настроек"""
+        if result == "close":
+            self.close_settings()
+        elif result == "volume_changed":
+            self.music_player.set_volume(self.settings_config.get("music_volume", 0.5))
+        elif result == "music_shuffle":
+            self.music_player.play(shuffle=True)
+        elif result == "music_prev":
+            self.music_player.prev_track()
+        elif result == "music_next":
+            self.music_player.next_track()
+        elif result == "music_play":
+            if pygame.mixer.music.get_busy():
+                self.music_player.pause()
+            else:
+                self.music_player.unpause()
+        elif result == "toggle_fullscreen":
+            self.set_fullscreen(self.settings_ui.toggle_buttons['fullscreen']['state'])
+        elif result == "toggle_language":
+            self.set_language(self.settings_ui.toggle_buttons['language']['state'])
+        elif result == "toggle_resolution":
+            self.set_resolution(self.settings_ui.toggle_buttons['resolution']['state'])
+        elif result == "save":
+            self.settings_manager.save_settings()
+
+    def update(self, dt: float) -> None:
+        """Обновление состояния игры"""
+        if self.state == GameState.MENU:
+            self.starfield.update()
+            for button in self.buttons:
+                button.update(dt)
+            if any(button.is_hovered for button in self.buttons) and random.random() < 0.1:
+                self.shake.start(1, 5)
+
+        elif self.state == GameState.ZOOM:
+            self.zoom_factor += ZOOM_SPEED
+            self.starfield.update(self.zoom_factor)
+            if self.zoom_factor >= MAX_ZOOM:
+                self.state = GameState.PLAY
+                self.zoom_factor = 1.0
+                self.start_story()
+
+        elif self.state == GameState.PLAY:
+            self.dialog_manager.skip_held = bool(pygame.key.get_mods() & pygame.KMOD_CTRL)
+            self.dialog_manager.update()
+            self.dialog_manager.save_read()
+            self.game_ui.update(dt)
+            # После выхода с экрана концовки возвращаемся в меню
+            if not self.dialog_manager.show_dialog and not self.dialog_manager.is_show_ending:
+                self.state = GameState.MENU
+
+        self.particles.update()
+        self.shake.update()
+
+    def draw(self) -> None:
+        """Отрисовка кадра в логический холст"""
+        screen = self.display.canvas
+        screen.fill(BLUE_DARK)
+        self.starfield.draw(screen, self.state, self.zoom_factor, self.target_star)
+        self.particles.draw(screen, WHITE)
+
+        if self.state == GameState.MENU:
+            ticks = game_clock.get_ticks()
+            title_color = (255, 255, 255) if ticks % (2 * TITLE_BLINK_PERIOD) < TITLE_BLINK_PERIOD else (100, 100, 255)
+            title = FONT_LARGE.render(self.locale.get("ui.title"), True, title_color)
+            screen.blit(title, (CENTER_X - title.get_width() // 2, 100))
+
+            for button in self.buttons:
+                original_rect = button.rect.copy()
+                button.rect.topleft = self.shake.apply(button.rect.topleft)
+                button.draw(screen)
+                button.rect = original_rect
+
+            if self.show_settings:
+                self.settings_ui.draw(screen)
+
+        elif self.state == GameState.ZOOM and self.zoom_factor >= MAX_ZOOM * 0.9:
+            alpha = int(255 * (self.zoom_factor - MAX_ZOOM * 0.9) / (MAX_ZOOM * 0.1))
+            transition = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+            transition.fill((0, 0, 0, min(255, alpha)))
+            screen.blit(transition, (0, 0))
+
+        elif self.state == GameState.PLAY:
+            self.game_ui.draw(screen)
+
+
+if __name__ == "__main__":
+    Game().run()
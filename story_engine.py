@@ -0,0 +1,1030 @@
+"""
+Проигрывание сценария без pygame.
+
+StoryEngine - курсор в графе сценария с правилами игры: реплики по
+порядку и переходы между сценами, выборы с условиями, эффекты,
+концовки, шаг назад по прочитанным репликам и повтор пройденных назад,
+сохранение и восстановление позиции. Состояние персонажа живёт в
+отдельном объекте с интерфейсом SaveManager: в игре это сам SaveManager
+(с событиями для интерфейса), в тестах и утилитах - StoryState.
+
+Движок не зависит от языка: в узлах стоят идентификаторы строк, а
+текст на текущем языке даёт story.text(), так что смена языка не
+трогает ни позицию, ни историю.
+
+Каждое изменение состояния от эффектов сценария записывается в журнал
+(EffectLog) вместе со старым значением. Шаг назад откатывает эффекты
+обратными изменениями за время, пропорциональное числу откатанных
+изменений, а хвост журнала после сохранения служит инкрементальным
+сохранением. Для переходов на тысячи реплик назад (например, из истории
+диалога) движок раз в SNAPSHOT_INTERVAL реплик и на каждом выборе
+снимает состояние: возврат к реплике - ближайший снимок перед ней и
+повтор журнала до неё, так что цена не зависит от длины прохождения.
+
+Прочитанные реплики отмечаются в битовых масках по сценам (ReadLines):
+промотка (skip) проходит только их и останавливается на первой новой.
+Маски общие для всех прохождений и хранятся в отдельном файле по
+устойчивым идентификаторам реплик, так что правка сценария их не сбивает.
+
+DialogManager в main.py только показывает то, что делает движок:
+печатную машинку, окно выбора, экран концовки.
+"""
+import base64
+import hashlib
+import json
+import os
+from bisect import bisect_right
+from contextlib import nullcontext
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from story_graph import DEFAULT_STATS, STAT_MAX, STAT_MIN, Choice, Effects, Node, Scene, StateView, StoryGraph
+
+BACKLOG_SIZE = 500  # Сколько прочитанных реплик хранит история диалога
+SNAPSHOT_INTERVAL = 50  # Раз в сколько реплик снимается состояние (и ещё на каждом выборе)
+SNAPSHOT_CAPACITY = 64  # Сколько снимков хранится; лишние прореживаются начиная с давних
+READ_LINES_FORMAT = 2  # Версия файла прочитанных реплик
+READ_FLUSH_BATCH = 32  # Сколько новых прочитанных реплик копится до записи файла
+
+
+class StateChange(NamedTuple):
+    """
+    Изменение состояния в журнале: ключ перешёл из old в value.
+
+    Для характеристик значение - число, для предметов - место в
+    инвентаре (None - предмета нет), для действий - открыто ли оно,
+    для флагов - значение (None - флаг не установлен). Обратное
+    изменение - та же запись с переставленными value и old.
+    """
+    kind: str
+    key: str
+    value: Any
+    old: Any
+
+    def inverse(self) -> 'StateChange':
+        return self._replace(value=self.old, old=self.value)
+
+
+class EffectLog:
+    """
+    Журнал эффектов сценария.
+
+    Журнал только дописывается: откат тоже попадает в него - обратными
+    изменениями, поэтому записи после последнего сохранения - готовое
+    инкрементальное сохранение (since). Отдельно хранится стек изменений
+    текущего пути: rewind(метка) снимает с него только то, что было
+    сделано после метки. Изменения состояния не из сценария (например,
+    выполненные игроком действия) в журнал не попадают.
+    """
+
+    STAT = "stat"
+    ITEM = "item"
+    ACTION = "action"
+    FLAG = "flag"
+
+    def __init__(self):
+        self._journal: List[StateChange] = []
+        self._base = 0  # Номер первой записи журнала, оставшейся в памяти
+        self._undo: List[StateChange] = []
+        self._undo_base = 0  # Метка первой записи стека отката
+
+    @property
+    def seq(self) -> int:
+        """Номер следующей записи журнала"""
+        return self._base + len(self._journal)
+
+    @property
+    def mark(self) -> int:
+        """Текущая точка пути (для rewind)"""
+        return self._undo_base + len(self._undo)
+
+    def since(self, seq: int) -> List[StateChange]:
+        """Записи журнала, начиная с номера seq"""
+        if seq < self._base:
+            raise ValueError(f"changes before {self._base} are already forgotten")
+        return self._journal[seq - self._base:]
+
+    def forget(self, seq: int) -> None:
+        """Освобождает записи до seq (они уже в полном сохранении)"""
+        drop = min(seq, self.seq) - self._base
+        if drop > 0:
+            del self._journal[:drop]
+            self._base += drop
+
+    def between(self, start: int, end: int) -> List[StateChange]:
+        """Записи журнала с номерами от start до end (не включая)"""
+        return self.since(start)[:end - start]
+
+    def can_rewind(self, mark: int) -> bool:
+        return self._undo_base <= mark <= self.mark
+
+    def checkpoint(self) -> None:
+        """Изменения до этой точки больше не откатываются (журнал их сохраняет)"""
+        self._undo_base = self.mark
+        self._undo.clear()
+
+    def transition(self, state: Any, before: Mapping[str, Any], after: Mapping[str, Any]) -> None:
+        """
+        Переводит состояние из снимка before в снимок after.
+
+        Изменения попадают в журнал (инкрементальное сохранение остаётся
+        верным), но откатить переход нельзя - это новая точка отсчёта.
+        """
+        for change in snapshot_changes(before, after):
+            self.perform(state, change)
+            self._journal.append(change)
+        self.checkpoint()
+
+    def apply(self, state: Any, effects: Effects) -> None:
+        """Применяет эффекты и записывает то, что действительно изменилось"""
+        record = self._record
+        stats = state.get_character_stats()
+        for stat, change in effects.change_stats:
+            old = stats.get(stat)
+            state.update_character_stat(stat, change)
+            if stats.get(stat) != old:
+                record(StateChange(self.STAT, stat, stats[stat], old))
+        for item in effects.add_items:
+            inventory = state.get_inventory()
+            if item not in inventory:
+                position = len(inventory)
+                state.add_to_inventory(item)
+                record(StateChange(self.ITEM, item, position, None))
+        for item in effects.remove_items:
+            inventory = state.get_inventory()
+            if item in inventory:
+                position = inventory.index(item)
+                state.remove_from_inventory(item)
+                record(StateChange(self.ITEM, item, None, position))
+        for action in effects.unlock_actions:
+            if action not in state.get_available_actions():
+                state.unlock_action(action)
+                record(StateChange(self.ACTION, action, True, False))
+        for flag, value in effects.set_flags:
+            old = state.get_story_flag(flag)
+            if value != old:
+                change = StateChange(self.FLAG, flag, value, old)
+                self.perform(state, change)
+                record(change)
+
+    def rewind(self, state: Any, mark: int) -> Optional[List[StateChange]]:
+        """
+        Откатывает изменения, сделанные после метки.
+
+        :return: Откатанные изменения в исходном порядке (для replay) или
+                 None, если метка раньше последнего checkpoint()
+        """
+        if mark < self._undo_base:
+            return None
+        start = mark - self._undo_base
+        undone = self._undo[start:]
+        del self._undo[start:]
+        for change in reversed(undone):
+            inverse = change.inverse()
+            self.perform(state, inverse)
+            self._journal.append(inverse)
+        return undone
+
+    def replay(self, state: Any, changes: List[StateChange]) -> None:
+        """Повторяет откатанные изменения"""
+        for change in changes:
+            self.perform(state, change)
+            self._record(change)
+
+    def _record(self, change: StateChange) -> None:
+        self._journal.append(change)
+        self._undo.append(change)
+
+    @classmethod
+    def perform(cls, state: Any, change: StateChange) -> None:
+        """Переводит ключ изменения в значение value"""
+        kind, key, value, old = change
+        if kind == cls.STAT:
+            state.update_character_stat(key, value - old)
+        elif kind == cls.ITEM:
+            if value is None:
+                state.remove_from_inventory(key)
+            else:
+                state.add_to_inventory(key, value)
+        elif kind == cls.ACTION:
+            if value:
+                state.unlock_action(key)
+            else:
+                state.lock_action(key)
+        elif value is None:
+            state.clear_story_flag(key)
+        else:
+            state.set_story_flag(key, value)
+
+
+def snapshot_changes(before: Mapping[str, Any], after: Mapping[str, Any]) -> List[StateChange]:
+    """Изменения, переводящие состояние из снимка before в снимок after (в порядке применения)"""
+    changes = [StateChange(EffectLog.STAT, stat, value, before["stats"][stat])
+               for stat, value in after["stats"].items() if before["stats"].get(stat, value) != value]
+
+    # Предметы: сначала убираем лишние с конца, затем вставляем недостающие на их места
+    inventory, target = before["inventory"], after["inventory"]
+    present, wanted = set(inventory), set(target)
+    kept = [item for item in inventory if item in wanted]
+    if kept != [item for item in target if item in present]:
+        kept = []  # Порядок оставшихся другой - инвентарь собирается заново
+    keep = set(kept)
+    changes.extend(StateChange(EffectLog.ITEM, inventory[position], None, position)
+                   for position in range(len(inventory) - 1, -1, -1) if inventory[position] not in keep)
+    changes.extend(StateChange(EffectLog.ITEM, item, position, None)
+                   for position, item in enumerate(target) if item not in keep)
+
+    actions, target_actions = set(before["actions"]), set(after["actions"])
+    changes.extend(StateChange(EffectLog.ACTION, action, False, True)
+                   for action in before["actions"] if action not in target_actions)
+    changes.extend(StateChange(EffectLog.ACTION, action, True, False)
+                   for action in after["actions"] if action not in actions)
+
+    flags, target_flags = before["flags"], after["flags"]
+    changes.extend(StateChange(EffectLog.FLAG, flag, target_flags.get(flag), flags.get(flag))
+                   for flag in {**flags, **target_flags} if target_flags.get(flag) != flags.get(flag))
+    return changes
+
+
+def _set_bits(bits: bytes) -> Iterator[int]:
+    """Номера установленных битов маски по возрастанию"""
+    for number, byte in enumerate(bits):
+        while byte:
+            low = byte & -byte
+            yield (number << 3) + low.bit_length() - 1
+            byte ^= low
+
+
+def _scene_digest(scene: Scene) -> str:
+    """Отпечаток последовательности строк сцены: пока он прежний, номера прочитанных реплик верны"""
+    return hashlib.sha1("\n".join(node.text for node in scene.nodes).encode('utf-8')).hexdigest()[:8]
+
+
+class ReadLines:
+    """
+    Прочитанные реплики: битовая маска на сцену.
+
+    Ключ - (идентификатор сцены, номер реплики); сцена из сотни реплик
+    занимает 13 байт. Между сессиями маски хранятся в файле (save/load):
+    {"format": 2, "scenes": {сцена: [маска в base64, отпечаток сцены]}}.
+    Отпечаток - хеш идентификаторов строк сцены по порядку, так что
+    сценарий в 100 тысяч реплик занимает десятки килобайт в любом
+    формате story.json. Маска сцены, которая изменилась между сессиями,
+    не загружается: старых идентификаторов её реплик уже нет, а по
+    номерам можно отметить чужие реплики. При горячей перезагрузке
+    (remap) прежний граф ещё в памяти, поэтому реплики изменившихся сцен
+    переносятся по идентификатору строки (сначала на прежнем месте,
+    потом во всём графе); исчезнувшие забываются.
+    """
+
+    def __init__(self):
+        self._scenes: Dict[str, bytearray] = {}
+        self._dumped: Dict[str, List[Any]] = {}  # Записи файла по сценам, пока в сцене нет новых отметок
+        self.unsaved: int = 0  # Реплики, прочитанные после последней записи файла
+
+    def __len__(self) -> int:
+        return sum(bin(byte).count("1") for bits in self._scenes.values() for byte in bits)
+
+    def __contains__(self, key: Tuple[str, int]) -> bool:
+        scene_id, index = key
+        bits = self._scenes.get(scene_id)
+        return bits is not None and index >> 3 < len(bits) and bool(bits[index >> 3] & (1 << (index & 7)))
+
+    def add(self, scene_id: str, index: int) -> bool:
+        """Отмечает реплику прочитанной; True, если раньше она не читалась"""
+        bits = self._scenes.get(scene_id)
+        if bits is None:
+            bits = self._scenes[scene_id] = bytearray()
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(bits):
+            bits.extend(bytes(byte + 1 - len(bits)))
+        if bits[byte] & bit:
+            return False
+        bits[byte] |= bit
+        self._dumped.pop(scene_id, None)
+        self.unsaved += 1
+        return True
+
+    def dump(self, story: StoryGraph) -> Dict[str, Any]:
+        """Маски с отпечатками сцен графа story (формат файла); сцены без новых отметок не пересчитываются"""
+        scenes = {}
+        for scene_id, bits in self._scenes.items():
+            if scene_id in self._dumped:
+                scenes[scene_id] = self._dumped[scene_id]
+                continue
+            scene = story.scene(scene_id)
+            if scene is None:
+                continue
+            kept = bytearray(len(bits))
+            for index in _set_bits(bits):
+                if index < len(scene.nodes) and scene.nodes[index].text:
+                    kept[index >> 3] |= 1 << (index & 7)
+            kept = kept.rstrip(b"\0")
+            if kept:
+                scenes[scene_id] = self._dumped[scene_id] = [base64.b64encode(kept).decode('ascii'),
+                                                              _scene_digest(scene)]
+        return {"format": READ_LINES_FORMAT, "scenes": scenes}
+
+    def merge(self, data: Mapping[str, Any], story: StoryGraph) -> None:
+        """Отмечает реплики из dump(); сцены, изменившиеся с тех пор, пропускаются"""
+        for scene_id, (encoded, digest) in data["scenes"].items():
+            scene = story.scene(scene_id)
+            if scene is None or _scene_digest(scene) != digest:
+                continue
+            nodes = scene.nodes
+            for index in _set_bits(base64.b64decode(encoded)):
+                if index < len(nodes) and nodes[index].text:
+                    self._mark(scene_id, index)
+
+    def remap(self, old: StoryGraph, new: StoryGraph) -> None:
+        """Переносит отметки на новую версию графа (перезагруженный сценарий)"""
+        scenes = dict(self._scenes)
+        self._scenes.clear()
+        self._dumped.clear()
+        located: Optional[Dict[str, Tuple[str, int]]] = None  # Строится при первом промахе
+        for scene_id, bits in scenes.items():
+            before, after = old.scene(scene_id), new.scene(scene_id)
+            if before is None:
+                continue
+            if after is not None and _scene_digest(before) == _scene_digest(after):
+                self._scenes[scene_id] = bits
+                continue
+            for index in _set_bits(bits):
+                string_id = before.nodes[index].text if index < len(before.nodes) else ""
+                if not string_id:
+                    continue
+                if after is not None and index < len(after.nodes) and after.nodes[index].text == string_id:
+                    self._mark(scene_id, index)
+                    continue
+                if located is None:
+                    located = {}
+                    for node in new.nodes():
+                        if node.text:
+                            located.setdefault(node.text, (new.scene_id(node.scene), node.index))
+                if string_id in located:
+                    self._mark(*located[string_id])
+
+    def load(self, path, story: StoryGraph) -> bool:
+        """Добавляет отметки из файла; False, если файла нет или он не читается"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("format") != READ_LINES_FORMAT:
+                return False
+            self.merge(data, story)
+        except (OSError, ValueError, TypeError, AttributeError, KeyError):
+            return False
+        return True
+
+    def save(self, path, story: StoryGraph) -> None:
+        """Записывает все отметки (через временный файл, чтобы не оставить половину)"""
+        tmp = Path(str(path) + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.dump(story), f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+        self.unsaved = 0
+
+    def _mark(self, scene_id: str, index: int) -> None:
+        unsaved = self.unsaved
+        self.add(scene_id, index)
+        self.unsaved = unsaved
+
+
+class Snapshot(NamedTuple):
+    """Снимок состояния на реплике пути"""
+    line: int  # Номер реплики в пути
+    seq: int  # Номер записи журнала на момент снимка
+    state: Mapping[str, Any]  # state.snapshot()
+
+
+class SnapshotStore:
+    """
+    Снимки состояния, упорядоченные по номеру реплики.
+
+    Хранит не больше capacity снимков: когда место кончается, старшая
+    половина прореживается через один. Недавние реплики покрыты плотно,
+    давние - всё реже, а самый первый снимок не удаляется никогда.
+    """
+
+    def __init__(self, capacity: int = SNAPSHOT_CAPACITY):
+        self.capacity = max(2, capacity)
+        self._snapshots: List[Snapshot] = []
+        self._lines: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._snapshots)
+
+    def add(self, snapshot: Snapshot) -> None:
+        """Добавляет снимок, заменяя снимки той же и более поздних реплик"""
+        self.truncate(snapshot.line - 1)
+        self._snapshots.append(snapshot)
+        self._lines.append(snapshot.line)
+        if len(self._snapshots) > self.capacity:
+            half = len(self._snapshots) // 2
+            self._snapshots[:half] = self._snapshots[:half:2]
+            self._lines = [snapshot.line for snapshot in self._snapshots]
+
+    def before(self, line: int) -> Optional[Snapshot]:
+        """Ближайший снимок не позже реплики line"""
+        index = bisect_right(self._lines, line)
+        return self._snapshots[index - 1] if index else None
+
+    def truncate(self, line: int) -> None:
+        """Убирает снимки реплик после line"""
+        index = bisect_right(self._lines, line)
+        del self._snapshots[index:]
+        del self._lines[index:]
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+        self._lines.clear()
+
+
+class DialogBacklog:
+    """
+    Кольцевой буфер прочитанных реплик.
+
+    Хранит ссылки на узлы истории (без копирования) и вид записи:
+    реплика или сделанный выбор. При переполнении затираются самые
+    старые записи. Раскладка записи по строкам экрана истории
+    вычисляется один раз и живёт в той же ячейке буфера, там же -
+    номер реплики в пути движка (куда возвращает шаг назад).
+    """
+
+    LINE = 0
+    CHOICE = 1
+
+    def __init__(self, capacity: int = BACKLOG_SIZE):
+        self.capacity = max(1, capacity)
+        self._nodes: List[Any] = [None] * self.capacity
+        self._kinds = bytearray(self.capacity)
+        self._marks = [0] * self.capacity
+        self._layout: List[Optional[Tuple]] = [None] * self.capacity
+        self._start = 0
+        self._count = 0
+        self.version = 0  # Меняется при каждом изменении буфера
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _slot(self, index: int) -> int:
+        if not -self._count <= index < self._count:
+            raise IndexError("backlog index out of range")
+        return (self._start + index % self._count) % self.capacity
+
+    def __getitem__(self, index: int) -> Tuple[Any, int]:
+        """Запись по индексу (0 - самая старая): (узел, вид)"""
+        slot = self._slot(index)
+        return self._nodes[slot], self._kinds[slot]
+
+    def mark(self, index: int) -> int:
+        """Номер реплики пути, записанный вместе с записью (у выбора - номер вопроса)"""
+        return self._marks[self._slot(index)]
+
+    def append(self, node: Any, kind: int = LINE, mark: int = 0) -> None:
+        """Добавляет запись, вытесняя самую старую при заполнении"""
+        if self._count < self.capacity:
+            slot = (self._start + self._count) % self.capacity
+            self._count += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._nodes[slot] = node
+        self._kinds[slot] = kind
+        self._marks[slot] = mark
+        self._layout[slot] = None
+        self.version += 1
+
+    def pop(self) -> Tuple[Any, int]:
+        """Снимает самую новую запись"""
+        slot = self._slot(-1)
+        entry = self._nodes[slot], self._kinds[slot]
+        self._nodes[slot] = self._layout[slot] = None
+        self._count -= 1
+        self.version += 1
+        return entry
+
+    def clear(self) -> None:
+        self._nodes = [None] * self.capacity
+        self._layout = [None] * self.capacity
+        self._start = self._count = 0
+        self.version += 1
+
+    def relayout(self) -> None:
+        """Сбрасывает раскладку всех записей (например, после смены языка)"""
+        self._layout = [None] * self.capacity
+        self.version += 1
+
+    def layout(self, index: int, build: Callable[[Any, int], Tuple]) -> Tuple:
+        """Строки записи для экрана истории; build(узел, вид) вызывается один раз на запись"""
+        slot = self._slot(index)
+        rows = self._layout[slot]
+        if rows is None:
+            rows = self._layout[slot] = build(self._nodes[slot], self._kinds[slot])
+        return rows
+
+
+class StoryState:
+    """
+    Состояние прохождения в памяти.
+
+    Повторяет ту часть интерфейса SaveManager, которой пользуется
+    StoryEngine, но без файлов и событий - для тестов и симуляций.
+    """
+
+    def __init__(self, stats: Mapping[str, int] = DEFAULT_STATS):
+        self.stats: Dict[str, int] = dict(stats)
+        self.inventory: List[str] = []
+        self.actions: List[str] = []
+        self.completed_actions: Set[str] = set()
+        self.flags: Dict[str, Any] = {}
+        self.position: Tuple[str, int] = ("start", 0)
+        self.revision = 0  # Версия состояния: растёт с каждым изменением
+
+    def batch(self) -> ContextManager:
+        return nullcontext()
+
+    def state_view(self) -> StateView:
+        """Состояние для проверки условий выборов (действия - открытые хотя бы раз, как у SaveManager)"""
+        return StateView(MappingProxyType(self.stats), tuple(self.inventory), MappingProxyType(self.flags),
+                         set(self.actions) | self.completed_actions)
+
+    def update_character_stat(self, stat: str, change: int) -> None:
+        if stat in self.stats:
+            self.stats[stat] = max(STAT_MIN, min(STAT_MAX, self.stats[stat] + change))
+            self.revision += 1
+
+    def get_character_stats(self) -> Mapping[str, int]:
+        return self.stats
+
+    def add_to_inventory(self, item: str, position: Optional[int] = None) -> None:
+        if item not in self.inventory:
+            self.inventory.insert(len(self.inventory) if position is None else position, item)
+            self.revision += 1
+
+    def remove_from_inventory(self, item: str) -> bool:
+        if item in self.inventory:
+            self.inventory.remove(item)
+            self.revision += 1
+            return True
+        return False
+
+    def get_inventory(self) -> List[str]:
+        return self.inventory
+
+    def unlock_action(self, action: str) -> None:
+        if action not in self.actions:
+            self.actions.append(action)
+            self.revision += 1
+
+    def lock_action(self, action: str) -> None:
+        if action in self.actions:
+            self.actions.remove(action)
+            self.revision += 1
+
+    def complete_action(self, action: str) -> bool:
+        """Действие выполнено и больше недоступно; False, если оно не было открыто"""
+        if action not in self.actions:
+            return False
+        self.actions.remove(action)
+        self.completed_actions.add(action)
+        self.revision += 1
+        return True
+
+    def get_available_actions(self) -> List[str]:
+        return self.actions
+
+    def get_completed_actions(self) -> Set[str]:
+        return self.completed_actions
+
+    def set_story_flag(self, flag: str, value: Any = True) -> None:
+        self.flags[flag] = value
+        self.revision += 1
+
+    def clear_story_flag(self, flag: str) -> None:
+        if flag in self.flags:
+            del self.flags[flag]
+            self.revision += 1
+
+    def get_story_flag(self, flag: str, default=None) -> Any:
+        return self.flags.get(flag, default)
+
+    def set_story_position(self, scene_id: str, index: int) -> None:
+        self.position = (scene_id, index)
+
+    def get_story_position(self) -> Tuple[str, int]:
+        return self.position
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Копия состояния, пригодная для JSON"""
+        return {"stats": dict(self.stats), "inventory": list(self.inventory), "actions": list(self.actions),
+                "flags": dict(self.flags), "position": list(self.position)}
+
+    def restore(self, data: Mapping[str, Any]) -> None:
+        self.stats = dict(data["stats"])
+        self.inventory = list(data["inventory"])
+        self.actions = list(data["actions"])
+        self.flags = dict(data["flags"])
+        self.position = tuple(data["position"])
+        self.revision += 1
+
+
+class StoryEngine:
+    """
+    Проигрывание сценария по правилам игры.
+
+    Текущая реплика - node. Реплика с выборами ждёт choose(), реплика с
+    концовкой останавливает историю (ending), реплика без текста только
+    применяет эффекты, и движок сразу идёт дальше. Если реплики
+    закончились, а перехода нет, история застревает (finished).
+
+    :param state: SaveManager или StoryState
+    :param on_ending: Вызывается с текстом концовки (на текущем языке) при её достижении
+    """
+
+    def __init__(self, story: StoryGraph, state: Any, backlog_size: int = BACKLOG_SIZE,
+                 on_ending: Optional[Callable[[str], None]] = None):
+        self.story = story
+        self.state = state
+        self.on_ending = on_ending
+        self.backlog = DialogBacklog(backlog_size)  # Прочитанные реплики и сделанные выборы
+        self.log = EffectLog()  # Журнал эффектов: откат шагов назад и инкрементальные сохранения
+        self.node: Optional[Node] = None
+        self.ending: Optional[str] = None  # Идентификатор строки концовки
+        self.finished: bool = False
+        self.replayed: bool = False  # Текущая реплика показана повторно (назад или повтор)
+        self.read = ReadLines()  # Реплики, которые игрок уже видел
+        self.fresh: bool = False  # Текущая реплика показана впервые
+        self._redo: List[Tuple[Node, List[StateChange]]] = []  # Пройденные кнопкой "Назад" и их откатанные эффекты
+        # Путь: показанные реплики по порядку, метка отката и номер записи журнала на момент показа
+        self._lines: List[Optional[Node]] = []
+        self._line_marks: List[int] = []
+        self._line_seqs: List[int] = []
+        self.snapshots = SnapshotStore()
+        self.snapshot_interval = SNAPSHOT_INTERVAL
+        self._available: Tuple[Any, List[Choice]] = (None, [])  # (реплика, версия состояния) -> выборы
+
+    @property
+    def waiting_for_choice(self) -> bool:
+        return self.node is not None and bool(self.node.choices) and not self.finished
+
+    @property
+    def line(self) -> int:
+        """Номер последней показанной реплики в пути (-1 - путь пуст)"""
+        return len(self._lines) - 1
+
+    def available_choices(self) -> List[Choice]:
+        """
+        Выборы текущей реплики, условия которых выполнены.
+
+        Результат живёт до изменения состояния (state.revision), так что
+        экран выбора проверяет каждое условие один раз, а не каждый кадр.
+        """
+        if not self.waiting_for_choice:
+            return []
+        key = (self.story, self.node.cursor, self.state.revision)
+        cached_key, choices = self._available
+        if cached_key != key:
+            view = self.state.state_view()
+            choices = [choice for choice in self.node.choices if choice.is_available(view)]
+            self._available = (key, choices)
+        return choices
+
+    def start(self, scene_id: str, story: Optional[StoryGraph] = None) -> bool:
+        """Начинает историю со сцены (можно сменить граф, например, перезагруженный сценарий)"""
+        story = story or self.story
+        cursor = story.locate(scene_id)
+        if cursor is None:
+            return False
+        self.story = story
+        self.backlog.clear()
+        self._reset()
+        self._enter(story.node(cursor))
+        return True
+
+    def jump(self, scene_id: str) -> bool:
+        """Переходит в начало сцены, сохраняя историю"""
+        cursor = self.story.locate(scene_id)
+        if cursor is None:
+            return False
+        self._redo.clear()
+        self.finished = False
+        self._enter(self.story.node(cursor))
+        return True
+
+    def advance(self) -> bool:
+        """Следующая реплика; False, если история ждёт выбора или остановилась"""
+        if self.node is None or self.waiting_for_choice or self.finished or self.ending is not None:
+            return False
+        # Сначала повторяем реплики, пройденные кнопкой "Назад"
+        if self._redo:
+            node, changes = self._redo.pop()
+            self._show(node, replayed=True)
+            with self.state.batch():
+                self.log.replay(self.state, changes)
+            self._record_line()
+            if node.ending is not None:
+                self._reach_ending(node)
+            return True
+        node = self.story.following(self.node)
+        if node is None:
+            self.finished = True
+            return True
+        self._enter(node)
+        return True
+
+    def choose(self, choice: Choice) -> bool:
+        """Делает выбор текущей реплики; недоступный по условиям выбор игнорируется"""
+        question = self.node
+        if choice not in self.available_choices():
+            return False
+        self._apply(choice.effects)
+
+        if choice.target is not None:
+            following = self.story.first(choice.target)
+        else:
+            following = self.story.node((question.scene, question.index + 1))
+
+        # В истории вопрос, затем сделанный выбор; назад через выбор не ходят, откат до него не нужен
+        self._leave()
+        self.node = None  # Вопрос уже в истории: _enter() не должен записать его второй раз
+        self.log.checkpoint()
+        if choice.restart:
+            self.backlog.clear()
+        self.backlog.append(choice, DialogBacklog.CHOICE, self.line)
+        if following is None:
+            self.finished = True
+        else:
+            self._enter(following)
+        return True
+
+    def can_skip(self) -> bool:
+        """Промотка идёт с уже прочитанной реплики без выбора и концовки"""
+        return (self.node is not None and not self.fresh and not self.waiting_for_choice and
+                self.ending is None and not self.finished)
+
+    def skip(self, limit: int) -> int:
+        """
+        Проходит до limit реплик подряд так же, как advance() (с эффектами).
+        Останавливается на выборе, концовке и непрочитанной реплике - она
+        становится текущей.
+
+        :return: Сколько реплик пройдено
+        """
+        count = 0
+        while count < limit and self.can_skip():
+            self.advance()
+            count += 1
+        return count
+
+    def can_go_back(self) -> bool:
+        """Шаг назад возможен по прочитанным репликам, но не через сделанный выбор"""
+        return (bool(self.backlog) and not self.waiting_for_choice and
+                self.backlog[-1][1] == DialogBacklog.LINE)
+
+    def back(self) -> bool:
+        """Возвращается к предыдущей реплике, откатывая эффекты, применённые после неё"""
+        if not self.can_go_back():
+            return False
+        line = self.backlog.mark(-1)
+        last_node, _ = self.backlog.pop()
+        forward = self._rewind_state(line, keep_forward=True)
+        if self.node is not None and self.node.text and not self.finished:
+            self._redo.append((self.node, forward))
+        self.node = last_node
+        self.ending = None
+        self.finished = False
+        self.replayed = True
+        self.fresh = False
+        return True
+
+    def rewind_to(self, line: int) -> bool:
+        """
+        Возвращается на прочитанную реплику пути (номер из backlog.mark)
+        с тем состоянием, какое было при её показе; через выборы тоже.
+
+        Записи истории после неё и повтор вперёд сбрасываются: дальше
+        история идёт заново, с новыми выборами.
+        """
+        if not 0 <= line < self.line or self._lines[line] is None:
+            return False
+        self._rewind_state(line)
+        while self.backlog and self.backlog.mark(-1) >= line:
+            self.backlog.pop()
+        self._redo.clear()
+        node = self.node = self._lines[line]
+        self.ending = None
+        self.finished = False
+        self.replayed = True
+        self.fresh = False
+        self.state.set_story_position(self.story.scene_id(node.scene), node.index)
+        return True
+
+    def position(self) -> Optional[Tuple[str, int]]:
+        """Позиция для сохранения: (сцена, номер реплики)"""
+        if self.node is None:
+            return None
+        return self.story.scene_id(self.node.scene), self.node.index
+
+    def restore(self, scene_id: str, index: int) -> bool:
+        """Возвращает курсор на сохранённую реплику (эффекты уже учтены в состоянии)"""
+        cursor = self.story.locate(scene_id, index)
+        if cursor is None:
+            return False
+        self.backlog.clear()
+        self._reset()
+        self._show(self.story.node(cursor))
+        if self.node.text:
+            self._record_line()
+        return True
+
+    def rebind(self, story: StoryGraph) -> bool:
+        """
+        Переносит прохождение на новую версию графа (перезагруженный сценарий).
+
+        Реплики ищутся в своей сцене по идентификатору строки, так что
+        вставленные или удалённые выше реплики не сдвигают курсор на
+        чужую. Реплика без текста или с новым идентификатором (в старом
+        формате он зависит от текста, так что правка текста меняет и его)
+        остаётся на своём номере. Текущая реплика, номера которой больше
+        нет, заменяется началом своей сцены, а если пропала и сцена,
+        история останавливается. Эффекты повторно не применяются.
+
+        :return: False, если текущей реплики в новом графе нет
+        """
+        old = self.story
+        self.read.remap(old, story)
+
+        lines: Dict[int, Dict[str, int]] = {}  # Сцена нового графа -> {строка: номер первой такой реплики}
+
+        def remap(node: Node) -> Optional[Node]:
+            scene = story.scene_index.get(old.scene_id(node.scene))
+            if scene is None:
+                return None
+            same = story.node((scene, node.index))
+            if not node.text or same is not None and same.text == node.text:
+                return same
+            ids = lines.get(scene)
+            if ids is None:
+                ids = lines[scene] = {}
+                for other in story.get_scene(scene).nodes:
+                    if other.text:
+                        ids.setdefault(other.text, other.index)
+            index = ids.get(node.text)
+            return story.node((scene, index)) if index is not None else same
+
+        entries = [(*self.backlog[i], self.backlog.mark(i)) for i in range(len(self.backlog))]
+        self.backlog.clear()
+        for entry, kind, mark in entries:
+            if kind == DialogBacklog.LINE:
+                entry = remap(entry)
+                if entry is None:
+                    continue
+            self.backlog.append(entry, kind, mark)
+        redo = ((remap(node), changes) for node, changes in self._redo)
+        self._redo = [(node, changes) for node, changes in redo if node is not None]
+        self._lines = [remap(node) if node is not None else None for node in self._lines]
+        self._available = (None, [])
+
+        current = self.node
+        self.story = story
+        if current is None:
+            return True
+        node = remap(current)
+        kept = node is not None
+        if node is None:
+            scene = story.scene_index.get(old.scene_id(current.scene))
+            node = story.first(scene) if scene is not None else None
+        if node is None:
+            self.node = None
+            self.finished = True
+            return False
+        self.node = node
+        if not kept or node.index != current.index:
+            self.state.set_story_position(story.scene_id(node.scene), node.index)
+        return kept
+
+    def save(self) -> Dict[str, Any]:
+        """Позиция и состояние (если оно умеет делать снимок) в виде словаря для JSON"""
+        data: Dict[str, Any] = {"position": self.position(), "seq": self.log.seq}
+        if hasattr(self.state, "snapshot"):
+            data["state"] = self.state.snapshot()
+        return data
+
+    def save_changes(self, since: int) -> Dict[str, Any]:
+        """Инкрементальное сохранение: позиция и записи журнала, начиная с номера since"""
+        return {"position": self.position(), "since": since, "seq": self.log.seq,
+                "changes": [list(change) for change in self.log.since(since)]}
+
+    def load_changes(self, data: Mapping[str, Any]) -> bool:
+        """Накатывает save_changes() на состояние, загруженное из предыдущего сохранения"""
+        with self.state.batch():
+            for change in data["changes"]:
+                EffectLog.perform(self.state, StateChange(*change))
+        position = data.get("position")
+        return position is not None and self.restore(*position)
+
+    def load(self, data: Mapping[str, Any]) -> bool:
+        """Обратная операция к save()"""
+        if "state" in data and hasattr(self.state, "restore"):
+            self.state.restore(data["state"])
+        position = data.get("position")
+        return position is not None and self.restore(*position)
+
+    def _reset(self) -> None:
+        self._redo.clear()
+        self.log.checkpoint()
+        self._lines.clear()
+        self._line_marks.clear()
+        self._line_seqs.clear()
+        self.snapshots.clear()
+        self.node = None
+        self.ending = None
+        self.finished = False
+
+    def _leave(self) -> None:
+        """Прочитанная реплика уходит в историю ссылкой на узел"""
+        if self.node is not None and self.node.text and not self.finished:
+            self.backlog.append(self.node, DialogBacklog.LINE, self.line)
+
+    def _record_line(self) -> None:
+        """Текущая реплика становится следующей в пути; раз в snapshot_interval реплик и на выборах - снимок"""
+        line = len(self._lines)
+        self.fresh = self.read.add(self.story.scene_id(self.node.scene), self.node.index)
+        self._lines.append(self.node)
+        self._line_marks.append(self.log.mark)
+        self._line_seqs.append(self.log.seq)
+        if line % self.snapshot_interval == 0 or self.node.choices:
+            self.snapshots.add(Snapshot(line, self.log.seq, self.state.snapshot()))
+
+    def _rewind_state(self, line: int, keep_forward: bool = False) -> List[StateChange]:
+        """
+        Возвращает состояние к моменту показа реплики line и обрезает путь после неё.
+
+        Если откат по журналу дешевле, изменения откатываются, иначе
+        состояние собирается из ближайшего снимка перед line и повтора
+        журнала до неё - на копии, после чего переводится одним пакетом.
+
+        :return: Изменения от реплики line до текущего момента (если keep_forward)
+        """
+        mark, seq = self._line_marks[line], self._line_seqs[line]
+        snapshot = self.snapshots.before(line)
+        with self.state.batch():
+            if self.log.can_rewind(mark) and (snapshot is None or self.log.mark - mark <= seq - snapshot.seq):
+                forward = self.log.rewind(self.state, mark)
+            else:
+                forward = self.log.between(seq, self.log.seq) if keep_forward else []
+                scratch = StoryState()
+                scratch.restore(snapshot.state)
+                for change in self.log.between(snapshot.seq, seq):
+                    EffectLog.perform(scratch, change)
+                self.log.transition(self.state, self.state.snapshot(), scratch.snapshot())
+
+        del self._lines[line + 1:]
+        del self._line_marks[line + 1:]
+        del self._line_seqs[line + 1:]
+        # Новая точка отсчёта для реплики: следующие снимки и откаты не проходят через отменённый кусок пути
+        self._line_marks[line] = self.log.mark
+        self._line_seqs[line] = self.log.seq
+        self.snapshots.add(Snapshot(line, self.log.seq, self.state.snapshot()))
+        return forward
+
+    def _show(self, node: Node, replayed: bool = False) -> None:
+        """Делает реплику текущей, не применяя её эффекты"""
+        # Прогноз подгрузки обновляется при смене сцены и после выбора (прочие ветки отменяются)
+        if self.node is None or self.node.scene != node.scene or self.node.choices:
+            self.story.prefetch(node)
+        self._leave()
+        self.node = node
+        self.finished = False
+        self.replayed = replayed
+        self.fresh = False
+        self.state.set_story_position(self.story.scene_id(node.scene), node.index)
+
+    def _enter(self, node: Node) -> None:
+        """Переходит на реплику: показ, эффекты, концовка"""
+        self._show(node)
+        self._apply(node.effects)
+        if node.text:
+            self._record_line()
+
+        if node.ending is not None:
+            self._reach_ending(node)
+            return
+
+        # Реплика без текста содержит только эффекты - сразу переходим дальше
+        if not node.text and not node.choices:
+            self.advance()
+
+    def _reach_ending(self, node: Node) -> None:
+        self.ending = node.ending
+        if self.on_ending is not None:
+            self.on_ending(self.story.text(node.ending))
+
+    def _apply(self, effects: Effects) -> None:
+        """Применяет разобранные эффекты одним пакетом изменений и записывает их в журнал"""
+        if not effects:
+            return
+        with self.state.batch():
+            self.log.apply(self.state, effects)
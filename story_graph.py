@@ -0,0 +1,1201 @@
+"""
+Компиляция сценария (story.json) в неизменяемый граф.
+
+Сцены интернируются и нумеруются, реплика адресуется парой
+(номер сцены, номер реплики), выборы хранятся списком рёбер, а эффекты
+разбираются один раз при загрузке. Проигрывание истории - это курсор
+в графе: переход к следующей реплике, назад и восстановление позиции
+выполняются за O(1) без копирования списков.
+
+Граф один на все языки: в репликах и выборах вместо текста стоят
+идентификаторы строк, а строки лежат в таблицах по языкам (формат 2):
+
+    {"format": 2, "base": "ru",
+     "scenes": {"start": [{"text": "start.0", "speaker": "start.0.speaker"}, ...]},
+     "strings": {"ru": "story.ru.json", "en": {"start.0": "..."}}}
+
+Таблица - файл рядом со сценарием или словарь прямо в нём. Таблица языка
+читается при первом обращении, поэтому смена языка - это замена таблицы
+без перезагрузки графа и без потери позиции. Строки без перевода берутся
+из базового языка. Файлы старого формата ({сцена: {язык: [реплики]}})
+переводятся в новый при загрузке, convert_story делает то же для записи
+на диск.
+
+Для больших сценариев есть контейнер (story.pack): проверенный и уже
+скомпилированный сценарий, где каждая сцена лежит отдельным блоком,
+таблица строк каждого языка - тоже, а в конце файла - индекс смещений и
+хеши исходников. При запуске читается только индекс, сцены загружаются
+по запросу, держатся в LRU-кэше и заранее подгружаются фоновым потоком:
+сначала самые вероятные по выборам, в пределах бюджета байт, а прогноз
+отменяется, как только игрок выбрал ветку.
+Если хеш story.json или файла строк не совпал, контейнер компилируется
+заново.
+
+Запуск модуля (python story_graph.py [story.json]) компилирует сценарий
+и замеряет холодную и тёплую загрузку и смену языка.
+
+Модуль не зависит от pygame и может использоваться утилитами.
+"""
+import hashlib
+import json
+import os
+import heapq
+import marshal
+import struct
+import sys
+import threading
+import time
+from functools import lru_cache, partial
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Collection, Dict, Iterator, List, Mapping, NamedTuple, Optional, Sequence, Set, Tuple
+
+STORY_FORMAT = 2  # Общий граф и таблицы строк по языкам
+TEXT_KEYS = ("text", "speaker", "ending")  # Переводимые поля реплики
+SCENE_CACHE_SIZE = 16  # Сколько разобранных сцен держит потоковый граф
+PREFETCH_DEPTH = 2  # На сколько переходов вперёд подгружаются сцены
+PREFETCH_BUDGET = 256 * 1024  # Сколько байт блоков сцен можно подгрузить заранее по одному прогнозу
+
+# Характеристики персонажа в начале игры и их допустимый диапазон
+DEFAULT_STATS: Mapping[str, int] = MappingProxyType({
+    "Отвага": 60,
+    "ПТСР": 30,
+    "Блядство": 20,
+    "ЧСВ": 60
+})
+STAT_MIN = 0
+STAT_MAX = 100
+
+
+class Effects(NamedTuple):
+    """Разобранные эффекты реплики или выбора"""
+    change_stats: Tuple[Tuple[str, int], ...] = ()
+    add_items: Tuple[str, ...] = ()
+    remove_items: Tuple[str, ...] = ()
+    unlock_actions: Tuple[str, ...] = ()
+    set_flags: Tuple[Tuple[str, Any], ...] = ()
+
+    def __bool__(self) -> bool:
+        return any(self)
+
+
+NO_EFFECTS = Effects()
+EFFECT_KEYS = frozenset(("change_stats", "add_item", "add_items", "remove_item", "unlock_action", "set_flag"))
+
+
+class Cursor(NamedTuple):
+    """Позиция в истории: номер сцены и номер реплики в ней"""
+    scene: int
+    index: int
+
+
+class StateView(NamedTuple):
+    """То, что условия выборов видят в состоянии прохождения"""
+    stats: Mapping[str, int]
+    items: Collection[str]
+    flags: Mapping[str, Any]
+    actions: Collection[str]  # Действия, открытые хотя бы раз
+
+
+# Скомпилированное условие - вложенные кортежи (хешируются и сохраняются в контейнер):
+#   ("stat", имя, мин или None, макс или None), ("item", имя), ("action", имя),
+#   ("flag", имя) - флаг установлен в истинное значение, ("flag", имя, значение),
+#   ("all", (условия...)), ("any", (условия...)), ("not", условие)
+Predicate = Tuple
+TRUE: Predicate = ("all", ())
+
+
+def parse_condition(raw: Any) -> Predicate:
+    """
+    Разбирает поле "conditions" выбора.
+
+    Словарь - конъюнкция своих ключей: {"Отвага": 50} (не меньше 50),
+    {"Отвага": {"min": 10, "max": 60}}, {"item": "Кинжал"} (или список),
+    {"flag": "имя"}, {"flag": ["имя", значение]}, {"action": "имя"},
+    {"all": [...]}, {"any": [...]}, {"not": {...}}. Список - конъюнкция элементов.
+
+    :raises ValueError: Если условие записано неверно
+    """
+    if raw is None:
+        return TRUE
+    if isinstance(raw, list):
+        return _conjunction([parse_condition(part) for part in raw])
+    if not isinstance(raw, dict):
+        raise ValueError(f"condition must be an object or a list, got {raw!r}")
+
+    parts: List[Predicate] = []
+    for key, value in raw.items():
+        if key in ("all", "any"):
+            if not isinstance(value, list):
+                raise ValueError(f"'{key}' takes a list of conditions")
+            parts.append((key, tuple(parse_condition(part) for part in value)))
+        elif key == "not":
+            parts.append(("not", parse_condition(value)))
+        elif key in ("item", "action"):
+            names = value if isinstance(value, list) else [value]
+            if not all(isinstance(name, str) for name in names):
+                raise ValueError(f"'{key}' takes a name or a list of names")
+            parts.extend((key, sys.intern(name)) for name in names)
+        elif key == "flag":
+            if isinstance(value, str):
+                parts.append(("flag", sys.intern(value)))
+            elif isinstance(value, list) and len(value) == 2 and isinstance(value[0], str) \
+                    and not isinstance(value[1], (list, dict)):
+                parts.append(("flag", sys.intern(value[0]), value[1]))
+            else:
+                raise ValueError("'flag' takes a name or [name, value]")
+        elif isinstance(value, bool) or not isinstance(value, (int, dict)):
+            raise ValueError(f"stat {key!r} takes a minimum or {{\"min\": ..., \"max\": ...}}")
+        elif isinstance(value, int):
+            parts.append(("stat", sys.intern(key), value, None))
+        else:
+            low, high = value.get("min"), value.get("max")
+            if set(value) - {"min", "max"} or not all(bound is None or isinstance(bound, int) for bound in (low, high)):
+                raise ValueError(f"stat {key!r} range takes integer 'min' and/or 'max'")
+            parts.append(("stat", sys.intern(key), low, high))
+    return _conjunction(parts)
+
+
+def _conjunction(parts: List[Predicate]) -> Predicate:
+    return parts[0] if len(parts) == 1 else ("all", tuple(parts))
+
+
+def predicate_leaves(predicate: Predicate) -> Iterator[Predicate]:
+    """Проверки stat/item/flag/action внутри условия"""
+    if predicate[0] in ("all", "any"):
+        for part in predicate[1]:
+            yield from predicate_leaves(part)
+    elif predicate[0] == "not":
+        yield from predicate_leaves(predicate[1])
+    else:
+        yield predicate
+
+
+def stat_bounds(predicate: Predicate) -> Optional[Tuple[Tuple[str, Optional[int], Optional[int]], ...]]:
+    """Границы характеристик, если условие - просто конъюнкция проверок характеристик"""
+    parts = predicate[1] if predicate[0] == "all" else (predicate,)
+    if all(part[0] == "stat" for part in parts):
+        return tuple(part[1:] for part in parts)
+    return None
+
+
+@lru_cache(maxsize=None)
+def compile_predicate(predicate: Predicate) -> Callable[[StateView], bool]:
+    """Замыкание, проверяющее условие (компилируется один раз на условие)"""
+    op = predicate[0]
+    if op == "stat":
+        _, name, low, high = predicate
+        if high is None:
+            return lambda view: view.stats.get(name, 0) >= low
+        if low is None:
+            return lambda view: view.stats.get(name, 0) <= high
+        return lambda view: low <= view.stats.get(name, 0) <= high
+    if op == "item":
+        name = predicate[1]
+        return lambda view: name in view.items
+    if op == "action":
+        name = predicate[1]
+        return lambda view: name in view.actions
+    if op == "flag":
+        name = predicate[1]
+        if len(predicate) == 2:
+            return lambda view: bool(view.flags.get(name))
+        value = predicate[2]
+        return lambda view: view.flags.get(name) == value
+    if op == "not":
+        inner = compile_predicate(predicate[1])
+        return lambda view: not inner(view)
+    parts = tuple(compile_predicate(part) for part in predicate[1])
+    if len(parts) == 1:
+        return parts[0]
+    if op == "all":
+        return lambda view: all(part(view) for part in parts)
+    return lambda view: any(part(view) for part in parts)
+
+
+class Choice(NamedTuple):
+    """Ребро выбора: текст (идентификатор строки), условие доступности, эффекты и цель"""
+    text: str
+    condition: Predicate
+    effects: Effects
+    target: Optional[int]  # Номер сцены перехода; None - продолжение текущей сцены
+    restart: bool  # Переход через "next": история диалога начинается заново
+
+    def is_available(self, view: StateView) -> bool:
+        """Выполнено ли условие выбора"""
+        return compile_predicate(self.condition)(view)
+
+
+class Node(NamedTuple):
+    """Реплика сценария; text, speaker и ending - идентификаторы строк (см. StoryGraph.text)"""
+    scene: int
+    index: int
+    text: str
+    speaker: Optional[str]
+    effects: Effects
+    choices: Tuple[Choice, ...]
+    jump: Optional[int]  # После этой реплики история продолжается со сцены jump
+    ending: Optional[str]
+
+    @property
+    def cursor(self) -> Cursor:
+        return Cursor(self.scene, self.index)
+
+
+class Scene(NamedTuple):
+    """Сцена: идентификатор и реплики"""
+    id: str
+    nodes: Tuple[Node, ...]
+
+
+class StringTables:
+    """
+    Таблицы строк сценария по языкам.
+
+    Таблица читается при первом обращении к языку, так что ненужные
+    переводы не занимают ни памяти, ни времени загрузки.
+
+    :param loaders: Для каждого языка - функция, возвращающая {идентификатор: текст}
+    :param base: Язык, из которого берутся строки без перевода
+    """
+
+    def __init__(self, loaders: Mapping[str, Callable[[], Mapping[str, str]]], base: str):
+        self.base = base
+        self.languages: Tuple[str, ...] = tuple(loaders)
+        self._loaders = dict(loaders)
+        self._tables: Dict[str, Mapping[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, language: str) -> bool:
+        return language in self._loaders
+
+    def is_loaded(self, language: str) -> bool:
+        return language in self._tables
+
+    def table(self, language: str) -> Mapping[str, str]:
+        """Таблица языка (читается один раз)"""
+        table = self._tables.get(language)
+        if table is None:
+            with self._lock:
+                table = self._tables.get(language)
+                if table is None:
+                    table = self._tables[language] = MappingProxyType(self._loaders[language]())
+        return table
+
+    @classmethod
+    def of(cls, document: Mapping[str, Any], root=None) -> 'StringTables':
+        """Таблицы документа формата 2; имена файлов отсчитываются от root"""
+        root = Path(root) if root is not None else Path()
+        loaders = {}
+        for language, table in document["strings"].items():
+            if isinstance(table, str):
+                loaders[language] = partial(read_strings, root / table)
+            else:
+                loaders[language] = partial(dict, table)
+        return cls(loaders, document["base"])
+
+
+class StoryGraph:
+    """Неизменяемый граф сценария; строки берутся из таблицы текущего языка"""
+
+    def __init__(self, scenes: Tuple[Scene, ...], strings: StringTables, language: Optional[str] = None,
+                 unresolved: Tuple[Tuple[str, int, str], ...] = ()):
+        self.scenes = scenes
+        self.scene_ids: Tuple[str, ...] = tuple(scene.id for scene in scenes)
+        self.scene_index: Mapping[str, int] = MappingProxyType({scene_id: i for i, scene_id in enumerate(self.scene_ids)})
+        self.unresolved = unresolved  # (сцена, реплика, неизвестная цель)
+        self._use_strings(strings, language)
+
+    def _use_strings(self, strings: StringTables, language: Optional[str]) -> None:
+        self.strings = strings
+        self.language = strings.base
+        self._table: Mapping[str, str] = {}
+        self._fallback: Optional[Mapping[str, str]] = None
+        if not (language and self.set_language(language)):
+            self.set_language(strings.base)
+
+    def set_language(self, language: str) -> bool:
+        """
+        Переключает язык строк. Граф, узлы и курсоры остаются прежними,
+        поэтому смена языка не прерывает прохождение.
+
+        :return: False, если такого языка в сценарии нет
+        """
+        if language not in self.strings:
+            return False
+        self._table = self.strings.table(language)
+        self.language = language
+        return True
+
+    def text(self, string_id: Optional[str]) -> str:
+        """Строка текущего языка по идентификатору; без перевода - строка базового языка"""
+        if not string_id:
+            return ""
+        text = self._table.get(string_id)
+        if text is None:
+            if self._fallback is None:
+                self._fallback = self.strings.table(self.strings.base)
+            text = self._fallback.get(string_id, string_id)
+        return text
+
+    def __len__(self) -> int:
+        return len(self.scene_ids)
+
+    def __contains__(self, scene_id: str) -> bool:
+        return scene_id in self.scene_index
+
+    def get_scene(self, number: int) -> Scene:
+        """Сцена по номеру"""
+        return self.scenes[number]
+
+    def scene_id(self, number: int) -> str:
+        return self.scene_ids[number]
+
+    def scene(self, scene_id: str) -> Optional[Scene]:
+        index = self.scene_index.get(scene_id)
+        return self.get_scene(index) if index is not None else None
+
+    def node(self, cursor: Tuple[int, int]) -> Optional[Node]:
+        """Реплика по позиции; None, если позиция за пределами сцены"""
+        scene, index = cursor
+        if 0 <= scene < len(self.scene_ids) and index >= 0:
+            nodes = self.get_scene(scene).nodes
+            if index < len(nodes):
+                return nodes[index]
+        return None
+
+    def first(self, scene: int) -> Optional[Node]:
+        """Первая реплика сцены"""
+        return self.node((scene, 0))
+
+    def following(self, node: Node) -> Optional[Node]:
+        """Реплика, идущая после node (с учётом перехода в другую сцену)"""
+        if node.jump is not None:
+            return self.first(node.jump)
+        return self.node((node.scene, node.index + 1))
+
+    def nodes(self) -> Iterator[Node]:
+        for number in range(len(self.scene_ids)):
+            yield from self.get_scene(number).nodes
+
+    def locate(self, scene_id: str, index: int = 0) -> Optional[Cursor]:
+        """Курсор по идентификатору сцены и номеру реплики"""
+        scene = self.scene_index.get(scene_id)
+        if scene is None or self.node((scene, index)) is None:
+            return None
+        return Cursor(scene, index)
+
+    def prefetch(self, node: Node) -> None:
+        """Подсказка о том, какие сцены скоро понадобятся (в памяти и так всё есть)"""
+
+    @classmethod
+    def compile(cls, data: Dict[str, Any], language: str = "ru", root=None) -> 'StoryGraph':
+        """
+        Компилирует разобранный story.json любого формата.
+
+        :param root: Каталог, от которого отсчитываются файлы строк
+        """
+        document = as_document(data)
+        scene_ids = [sys.intern(scene_id) for scene_id in document["scenes"]]
+        index = {scene_id: i for i, scene_id in enumerate(scene_ids)}
+        unresolved: List[Tuple[str, int, str]] = []
+        scenes = tuple(compile_scene(number, scene_id, document["scenes"][scene_id], index, unresolved)
+                       for number, scene_id in enumerate(scene_ids))
+        return cls(scenes, StringTables.of(document, root), language, tuple(unresolved))
+
+    @classmethod
+    def load(cls, path, language: str = "ru") -> 'StoryGraph':
+        """
+        Загружает, проверяет и компилирует файл сценария.
+
+        :raises StoryError: Если сценарий не прошёл проверку
+        """
+        path = Path(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        problems = validate_story(data)
+        if problems:
+            raise StoryError(problems)
+        return cls.compile(data, language, path.parent)
+
+
+def parse_effects(raw: Dict[str, Any]) -> Effects:
+    """Разбирает эффекты из словаря реплики или выбора"""
+    if raw.keys().isdisjoint(EFFECT_KEYS):
+        return NO_EFFECTS
+    add_items = list(raw.get("add_items") or ())
+    if "add_item" in raw:
+        add_items.insert(0, raw["add_item"])
+    effects = Effects(
+        change_stats=tuple((sys.intern(stat), change) for stat, change in (raw.get("change_stats") or {}).items()),
+        add_items=tuple(add_items),
+        remove_items=(raw["remove_item"],) if "remove_item" in raw else (),
+        unlock_actions=(raw["unlock_action"],) if "unlock_action" in raw else (),
+        set_flags=(tuple(raw["set_flag"]),) if "set_flag" in raw else ()
+    )
+    return effects if effects else NO_EFFECTS
+
+
+def compile_scene(number: int, scene_id: str, raw_nodes: List[Dict[str, Any]], index: Mapping[str, int],
+                  unresolved: Optional[List[Tuple[str, int, str]]] = None) -> Scene:
+    """
+    Компилирует реплики одной сцены.
+
+    :param index: Номера всех сцен языка (для разрешения переходов)
+    :param unresolved: Сюда добавляются переходы на неизвестные сцены
+    """
+    def resolve(node_index: int, target: Optional[str]) -> Optional[int]:
+        if target is None:
+            return None
+        if target not in index:
+            if unresolved is not None:
+                unresolved.append((scene_id, node_index, target))
+            return None
+        return index[target]
+
+    nodes = []
+    for node_index, raw in enumerate(raw_nodes):
+        choices = tuple(
+            Choice(
+                text=choice.get("text", ""),
+                condition=parse_condition(choice.get("conditions")),
+                effects=parse_effects(choice),
+                target=resolve(node_index, choice.get("next_scene", choice.get("next"))),
+                restart="next_scene" not in choice and "next" in choice
+            )
+            for choice in raw.get("choices") or ()
+        )
+        speaker = raw.get("speaker")
+        nodes.append(Node(
+            scene=number,
+            index=node_index,
+            text=raw.get("text", ""),
+            speaker=sys.intern(speaker) if speaker else None,
+            effects=parse_effects(raw),
+            choices=choices,
+            jump=resolve(node_index, raw.get("next_scene")),
+            ending=raw.get("ending")
+        ))
+    return Scene(scene_id, tuple(nodes))
+
+
+def scene_targets(raw_nodes: List[Dict[str, Any]]) -> Set[str]:
+    """Сцены, на которые ссылаются переходы реплик (те же, что разрешает compile_scene)"""
+    targets = set()
+    for raw in raw_nodes:
+        if raw.get("next_scene") is not None:
+            targets.add(raw["next_scene"])
+        for choice in raw.get("choices") or ():
+            target = choice.get("next_scene", choice.get("next"))
+            if target is not None:
+                targets.add(target)
+    return targets
+
+
+def renumber_scene(scene: Scene, numbers: Mapping[int, int]) -> Scene:
+    """
+    Сцена с переходами, переведёнными на новые номера сцен.
+
+    :param numbers: Прежний номер сцены -> новый; должен содержать саму
+        сцену и все её переходы
+    """
+    def target(number: Optional[int]) -> Optional[int]:
+        return numbers[number] if number is not None else None
+
+    return Scene(scene.id, tuple(
+        node._replace(
+            scene=numbers[node.scene],
+            jump=target(node.jump),
+            choices=tuple(choice._replace(target=target(choice.target)) for choice in node.choices)
+        )
+        for node in scene.nodes
+    ))
+
+
+def exit_weights(scene: Scene, start: int = 0) -> Dict[int, float]:
+    """
+    Вероятности уйти из scene в другие сцены, начиная с реплики start.
+
+    Выборы реплики считаются равновероятными; выборы без перехода ведут
+    дальше по сцене, концовка обрывает путь. Сумма меньше 1, если часть
+    путей заканчивается в самой сцене.
+    """
+    weights: Dict[int, float] = {}
+    weight = 1.0
+    for node in scene.nodes[start:]:
+        if node.choices:
+            share = weight / len(node.choices)
+            for choice in node.choices:
+                if choice.target is not None:
+                    weights[choice.target] = weights.get(choice.target, 0.0) + share
+            weight = share * sum(1 for choice in node.choices if choice.target is None)
+        elif node.jump is not None:
+            weights[node.jump] = weights.get(node.jump, 0.0) + weight
+            break
+        if node.ending is not None or not weight:
+            break
+    return weights
+
+
+class StoryError(ValueError):
+    """Сценарий не прошёл проверку"""
+
+    def __init__(self, problems: List[str]):
+        self.problems = problems
+        shown = "; ".join(problems[:10])
+        more = f" (and {len(problems) - 10} more)" if len(problems) > 10 else ""
+        super().__init__(f"invalid story: {shown}{more}")
+
+
+def _check_effects(raw: Dict[str, Any], where: str, problems: List[str]) -> None:
+    stats = raw.get("change_stats")
+    if stats is not None and (not isinstance(stats, dict)
+                              or not all(isinstance(v, int) for v in stats.values())):
+        problems.append(f"{where}: change_stats must map stats to integers")
+    items = raw.get("add_items")
+    if items is not None and (not isinstance(items, list) or not all(isinstance(v, str) for v in items)):
+        problems.append(f"{where}: add_items must be a list of strings")
+    for key in ("add_item", "remove_item", "unlock_action"):
+        if key in raw and not isinstance(raw[key], str):
+            problems.append(f"{where}: {key} must be a string")
+    flag = raw.get("set_flag")
+    if flag is not None and (not isinstance(flag, list) or len(flag) != 2 or not isinstance(flag[0], str)):
+        problems.append(f"{where}: set_flag must be [name, value]")
+
+
+def _check_lines(where: str, raw_nodes: Any, problems: List[str]) -> None:
+    if not isinstance(raw_nodes, list):
+        problems.append(f"{where}: lines must be a list")
+        return
+    for index, raw in enumerate(raw_nodes):
+        line = f"{where}[{index}]"
+        if not isinstance(raw, dict):
+            problems.append(f"{line}: line must be an object")
+            continue
+        for key in ("text", "speaker", "next_scene", "ending"):
+            if raw.get(key) is not None and not isinstance(raw[key], str):
+                problems.append(f"{line}: {key} must be a string")
+        _check_effects(raw, line, problems)
+        choices = raw.get("choices") or []
+        if not isinstance(choices, list):
+            problems.append(f"{line}: choices must be a list")
+            continue
+        for number, choice in enumerate(choices):
+            option = f"{line} choice {number}"
+            if not isinstance(choice, dict):
+                problems.append(f"{option}: choice must be an object")
+                continue
+            if choice.get("text") is not None and not isinstance(choice["text"], str):
+                problems.append(f"{option}: text must be a string")
+            try:
+                parse_condition(choice.get("conditions"))
+            except ValueError as e:
+                problems.append(f"{option}: {e}")
+            _check_effects(choice, option, problems)
+
+
+def is_document(data: Any) -> bool:
+    """Разобранный story.json в формате 2 (а не {сцена: {язык: [реплики]}})"""
+    return isinstance(data, dict) and isinstance(data.get("format"), int)
+
+
+def validate_story(data: Any) -> List[str]:
+    """
+    Проверяет структуру разобранного story.json (любого формата).
+
+    Файлы строк здесь не читаются: они проверяются при загрузке языка.
+
+    :return: Список найденных проблем (пустой, если всё в порядке)
+    """
+    if not isinstance(data, dict):
+        return ["story root must be an object"]
+    problems: List[str] = []
+    if not is_document(data):
+        for scene_id, variants in data.items():
+            if not isinstance(variants, dict):
+                problems.append(f"{scene_id}: scene must map languages to lines")
+                continue
+            for language, raw_nodes in variants.items():
+                _check_lines(f"{scene_id}/{language}", raw_nodes, problems)
+        return problems
+
+    if data["format"] != STORY_FORMAT:
+        return [f"unsupported story format {data['format']}"]
+    scenes, strings = data.get("scenes"), data.get("strings")
+    if not isinstance(scenes, dict):
+        problems.append("scenes must map scene ids to lines")
+    else:
+        for scene_id, raw_nodes in scenes.items():
+            _check_lines(scene_id, raw_nodes, problems)
+    if not isinstance(strings, dict) or not strings:
+        problems.append("strings must map languages to string tables or file names")
+        return problems
+    for language, table in strings.items():
+        if not isinstance(table, str) and not _is_table(table):
+            problems.append(f"strings/{language}: must be a file name or map string ids to text")
+    if data.get("base") not in strings:
+        problems.append("base must name one of the languages in strings")
+    return problems
+
+
+def _is_table(table: Any) -> bool:
+    return isinstance(table, dict) and all(isinstance(text, str) for text in table.values())
+
+
+def read_strings(path) -> Dict[str, str]:
+    """
+    Читает файл строк одного языка: {идентификатор: текст}.
+
+    :raises StoryError: Если в файле не таблица строк
+    """
+    with open(path, 'rb') as f:
+        return _parse_strings(f.read(), path)
+
+
+def _parse_strings(raw: bytes, where) -> Dict[str, str]:
+    table = json.loads(raw.decode('utf-8'))
+    if not _is_table(table):
+        raise StoryError([f"{where}: strings must map string ids to text"])
+    return {sys.intern(string_id): text for string_id, text in table.items()}
+
+
+def _line_id(scene_id: str, raw: Mapping[str, Any], taken: Dict[str, int]) -> str:
+    """
+    Устойчивый идентификатор реплики старого формата: "сцена.хеш" от
+    говорящего и текста (у реплики без текста - от концовки и выборов),
+    так что вставка и удаление соседних реплик его не меняют. Повторы
+    одинаковой реплики в сцене нумеруются: "сцена.хеш~2".
+
+    :param taken: Уже выданные в сцене идентификаторы и число их повторов
+    """
+    if isinstance(raw.get("text"), str) and raw["text"]:
+        parts = [raw.get("speaker"), raw["text"]]
+    else:
+        parts = [raw.get("ending")] + [choice.get("text") for choice in raw.get("choices") or ()]
+    source = "\0".join(part if isinstance(part, str) else "" for part in parts)
+    line_id = f"{scene_id}.{hashlib.sha1(source.encode('utf-8')).hexdigest()[:8]}"
+    count = taken[line_id] = taken.get(line_id, 0) + 1
+    return line_id if count == 1 else f"{line_id}~{count}"
+
+
+def _texts(line_id: str, raw: Mapping[str, Any]) -> Dict[str, str]:
+    """Переводимые строки реплики старого формата по их идентификаторам"""
+    texts = {}
+    for key in TEXT_KEYS:
+        value = raw.get(key)
+        if isinstance(value, str) and value:
+            texts[line_id if key == "text" else f"{line_id}.{key}"] = value
+    for number, choice in enumerate(raw.get("choices") or ()):
+        value = choice.get("text")
+        if isinstance(value, str) and value:
+            texts[f"{line_id}.choice.{number}"] = value
+    return texts
+
+
+def _structure(raw: Mapping[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Реплика старого формата без переводимых строк"""
+    rest = {key: value for key, value in raw.items() if key not in TEXT_KEYS and key != "choices"}
+    return rest, [{key: value for key, value in choice.items() if key != "text"} for choice in raw.get("choices") or ()]
+
+
+def convert_story(data: Mapping[str, Any], base: Optional[str] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Переводит проверенный сценарий старого формата в формат 2.
+
+    Структура сцены (выборы, условия, эффекты, переходы) берётся из
+    базового языка (по умолчанию - первого в файле), тексты остальных
+    языков сопоставляются с ней по позиции. Идентификаторы строк:
+    "сцена.хеш" - текст реплики (см. _line_id), "сцена.хеш.speaker",
+    "сцена.хеш.ending", "сцена.хеш.choice.K" - текст выбора. Идентификатор
+    зависит от содержания реплики, а не от её места, поэтому при горячей
+    перезагрузке курсор и прочитанные реплики (ReadLines) переносятся
+    через вставленные и удалённые реплики.
+
+    :return: Документ со встроенными таблицами строк и расхождения между
+             языками (лишние строки отбрасываются, недостающие берутся из
+             базового языка, отличия в эффектах и переходах - из него же)
+    """
+    languages = list(dict.fromkeys(language for variants in data.values() for language in variants))
+    base = base or (languages[0] if languages else "ru")
+    if base not in languages:
+        languages.insert(0, base)
+    scenes: Dict[str, List[Dict[str, Any]]] = {}
+    strings: Dict[str, Dict[str, str]] = {language: {} for language in languages}
+    warnings: List[str] = []
+    for scene_id, variants in data.items():
+        source = base if base in variants else next(iter(variants), None)
+        nodes = scenes[scene_id] = []
+        if source is None:
+            continue
+        if source != base:
+            warnings.append(f"{scene_id}: no '{base}' version, structure taken from '{source}'")
+        known, line_ids, taken = set(), [], {}
+        for raw in variants[source]:
+            line_id = _line_id(scene_id, raw, taken)
+            line_ids.append(line_id)
+            node = dict(raw)
+            for key in TEXT_KEYS:
+                if isinstance(raw.get(key), str) and raw[key]:
+                    node[key] = line_id if key == "text" else f"{line_id}.{key}"
+            if raw.get("choices"):
+                node["choices"] = [dict(choice, text=f"{line_id}.choice.{number}")
+                                   if isinstance(choice.get("text"), str) and choice["text"] else dict(choice)
+                                   for number, choice in enumerate(raw["choices"])]
+            known.update(_texts(line_id, raw))
+            nodes.append(node)
+
+        for language, raw_nodes in variants.items():
+            if language != source:
+                if [len(raw.get("choices") or ()) for raw in raw_nodes] != \
+                        [len(raw.get("choices") or ()) for raw in variants[source]]:
+                    warnings.append(f"{scene_id}/{language}: lines or choices differ from '{source}', "
+                                    f"text matched by position")
+                elif any(_structure(raw) != _structure(other) for raw, other in zip(raw_nodes, variants[source])):
+                    warnings.append(f"{scene_id}/{language}: effects or transitions differ from '{source}', "
+                                    f"'{source}' ones are kept")
+            table = strings[language]
+            for line_id, raw in zip(line_ids, raw_nodes):
+                for string_id, text in _texts(line_id, raw).items():
+                    if string_id in known:
+                        table[string_id] = text
+    return {"format": STORY_FORMAT, "base": base, "scenes": scenes, "strings": strings}, warnings
+
+
+def as_document(data: Mapping[str, Any]) -> Mapping[str, Any]:
+    """Проверенный story.json любого формата в виде документа формата 2"""
+    return data if is_document(data) else convert_story(data)[0]
+
+
+def string_ids(document: Mapping[str, Any]) -> Iterator[str]:
+    """Идентификаторы строк, на которые ссылается структура документа"""
+    for raw_nodes in document["scenes"].values():
+        for raw in raw_nodes:
+            for key in TEXT_KEYS:
+                if raw.get(key):
+                    yield raw[key]
+            for choice in raw.get("choices") or ():
+                if choice.get("text"):
+                    yield choice["text"]
+
+
+def _source_key(path) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _source_hash(path) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Версия раскладки блоков сцен: меняется вместе с полями кортежей, так что
+# контейнер, собранный со старыми полями, не читается, а пересобирается
+BLOCK_LAYOUT = hashlib.sha1(repr([(cls.__name__, cls._fields) for cls in (Scene, Node, Choice, Effects)])
+                            .encode('ascii')).hexdigest()[:12]
+
+
+def _scene_record(scene: Scene) -> Tuple:
+    """Сцена простыми кортежами (marshal не сохраняет NamedTuple)"""
+    return scene.id, tuple(
+        (node.scene, node.index, node.text, node.speaker, tuple(node.effects),
+         tuple((choice.text, choice.condition, tuple(choice.effects), choice.target, choice.restart)
+               for choice in node.choices),
+         node.jump, node.ending)
+        for node in scene.nodes
+    )
+
+
+def _effects(record: Tuple) -> Effects:
+    return Effects(*record) if any(record) else NO_EFFECTS
+
+
+def _scene_from_record(record: Tuple) -> Scene:
+    """Сцена из _scene_record()"""
+    scene_id, nodes = record
+    return Scene(scene_id, tuple(
+        Node(scene, index, text, speaker, _effects(effects),
+             tuple(Choice(choice_text, condition, _effects(choice_effects), target, restart)
+                   for choice_text, condition, choice_effects, target, restart in choices),
+             jump, ending)
+        for scene, index, text, speaker, effects, choices, jump, ending in nodes
+    ))
+
+
+class StoryContainer:
+    """
+    Скомпилированный сценарий с индексом смещений блоков.
+
+    Формат: заголовок (сигнатура, смещение и длина индекса), затем
+    скомпилированные сцены (marshal простых кортежей, см. _scene_record:
+    проверены, переходы разрешены, эффекты и условия разобраны) и
+    таблицы строк (marshal словаря на язык), в конце - индекс:
+    {"layout": BLOCK_LAYOUT, "sources": [{"path", "sha256", "mtime_ns",
+    "size"}, ...], "base": язык, "scenes": [[сцена, смещение, длина], ...],
+    "unresolved": [...], "strings": {язык: [смещение, длина]}}. Первый
+    источник - сам story.json, остальные - файлы строк; контейнер
+    действителен, пока их хеши совпадают с записанными. marshal, в
+    отличие от pickle, не выполняет кода при чтении, так что подложенный
+    рядом со сценарием story.pack может разве что не прочитаться.
+    """
+
+    MAGIC = b"ROYPACK6"  # Меняется вместе с форматом контейнера и идентификаторами строк
+    HEADER = struct.Struct("<8sQI")
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            magic, index_offset, index_length = self.HEADER.unpack(f.read(self.HEADER.size))
+            if magic != self.MAGIC:
+                raise ValueError(f"{self.path}: not a story container")
+            f.seek(index_offset)
+            self.index: Dict[str, Any] = json.loads(f.read(index_length).decode('utf-8'))
+        if self.index.get("layout") != BLOCK_LAYOUT:
+            raise ValueError(f"{self.path}: built for another scene layout")
+
+    @property
+    def languages(self) -> Tuple[str, ...]:
+        return tuple(self.index["strings"])
+
+    def scene_table(self) -> List[List[Any]]:
+        """[[сцена, смещение, длина], ...]"""
+        return self.index["scenes"]
+
+    def read_block(self, offset: int, length: int) -> Any:
+        """Читает блок контейнера (кортежи сцены или таблицу строк)"""
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return marshal.loads(f.read(length))
+
+    def read_scene(self, offset: int, length: int) -> Scene:
+        """Читает скомпилированную сцену"""
+        return _scene_from_record(self.read_block(offset, length))
+
+    def strings(self) -> StringTables:
+        """Таблицы строк, читаемые из контейнера по запросу"""
+        return StringTables({language: partial(self.read_block, offset, length)
+                             for language, (offset, length) in self.index["strings"].items()}, self.index["base"])
+
+    def is_current(self, source) -> bool:
+        """
+        Собран ли контейнер из текущих версий story.json и файлов строк.
+
+        Совпадение времени изменения и размера принимается без чтения
+        файла; иначе сравнивается хеш содержимого.
+        """
+        root = Path(source).parent
+        for number, recorded in enumerate(self.index.get("sources", ())):
+            path = Path(source) if number == 0 else root / recorded["path"]
+            try:
+                mtime_ns, size = _source_key(path)
+            except OSError:
+                continue  # Исходника нет - пользуемся тем, что собрано
+            if recorded["mtime_ns"] == mtime_ns and recorded["size"] == size:
+                continue
+            if recorded["size"] != size or recorded["sha256"] != _source_hash(path):
+                return False
+        return True
+
+    @staticmethod
+    def _read_source(path, name: str) -> Tuple[bytes, Dict[str, Any]]:
+        """Содержимое исходного файла и его запись для индекса"""
+        mtime_ns, size = _source_key(path)
+        with open(path, 'rb') as f:
+            raw = f.read()
+        return raw, {"path": name, "sha256": hashlib.sha256(raw).hexdigest(), "mtime_ns": mtime_ns, "size": size}
+
+    @classmethod
+    def build(cls, source, target) -> 'StoryContainer':
+        """
+        Компилирует story.json (и его файлы строк) в контейнер.
+
+        :raises StoryError: Если сценарий или таблица строк не прошли проверку
+        """
+        source = Path(source)
+        raw, entry = cls._read_source(source, source.name)
+        sources = [entry]
+        data = json.loads(raw.decode('utf-8'))
+        problems = validate_story(data)
+        if problems:
+            raise StoryError(problems)
+        document = as_document(data)
+
+        tables: Dict[str, Mapping[str, str]] = {}
+        for language, table in document["strings"].items():
+            if isinstance(table, str):
+                raw_table, entry = cls._read_source(source.parent / table, table)
+                sources.append(entry)
+                table = _parse_strings(raw_table, table)
+            tables[language] = table
+
+        scene_ids = [sys.intern(scene_id) for scene_id in document["scenes"]]
+        index = {scene_id: i for i, scene_id in enumerate(scene_ids)}
+        unresolved: List[Tuple[str, int, str]] = []
+        scenes: List[List[Any]] = []
+        strings: Dict[str, List[int]] = {}
+        tmp = Path(str(target) + ".tmp")
+        with open(tmp, 'wb') as out:
+            out.write(cls.HEADER.pack(cls.MAGIC, 0, 0))
+            for number, scene_id in enumerate(scene_ids):
+                scene = compile_scene(number, scene_id, document["scenes"][scene_id], index, unresolved)
+                blob = marshal.dumps(_scene_record(scene))
+                scenes.append([scene_id, out.tell(), len(blob)])
+                out.write(blob)
+            for language, table in tables.items():
+                blob = marshal.dumps(dict(table))
+                strings[language] = [out.tell(), len(blob)]
+                out.write(blob)
+
+            index = json.dumps({
+                "layout": BLOCK_LAYOUT,
+                "sources": sources,
+                "base": document["base"],
+                "scenes": scenes,
+                "unresolved": unresolved,
+                "strings": strings
+            }, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            index_offset = out.tell()
+            out.write(index)
+            out.seek(0)
+            out.write(cls.HEADER.pack(cls.MAGIC, index_offset, len(index)))
+        os.replace(tmp, target)
+        return cls(target)
+
+
+class StreamingStory(StoryGraph):
+    """
+    Граф сценария, сцены которого читаются из контейнера по запросу.
+
+    Загруженные сцены живут в LRU-кэше на cache_size сцен. prefetch()
+    составляет прогноз для фонового потока: сцены, достижимые из текущей
+    реплики на глубину prefetch_depth переходов, в порядке вероятности
+    попасть в них (выборы равновероятны, вероятности вдоль пути
+    перемножаются). Поток читает их, пока не израсходует prefetch_budget
+    байт блоков или половину кэша, чтобы не вытеснить то, что читается
+    сейчас. Новый вызов prefetch() отменяет прежний прогноз: сцены,
+    которые ещё не прочитаны, больше не загружаются.
+
+    После горячей перезагрузки (revise) перекомпилированные сцены
+    хранятся в памяти, остальные по-прежнему читаются из контейнера.
+    """
+
+    def __init__(self, container: StoryContainer, language: str, cache_size: int = SCENE_CACHE_SIZE,
+                 prefetch_depth: int = PREFETCH_DEPTH, prefetch_budget: int = PREFETCH_BUDGET):
+        table = container.scene_table()
+        self._setup(container, [scene_id for scene_id, _, _ in table], cache_size, prefetch_depth, prefetch_budget)
+        self.unresolved = tuple(tuple(entry) for entry in container.index["unresolved"])
+        self._use_strings(container.strings(), language)
+        self._extents = [(offset, length) for _, offset, length in table]
+
+    def _setup(self, container: StoryContainer, scene_ids: Sequence[str], cache_size: int,
+               prefetch_depth: int, prefetch_budget: int) -> None:
+        self.container = container
+        self.scene_ids = tuple(sys.intern(scene_id) for scene_id in scene_ids)
+        self.scene_index = MappingProxyType({scene_id: i for i, scene_id in enumerate(self.scene_ids)})
+        self.cache_size = max(1, cache_size)
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_budget = prefetch_budget
+        # Блок сцены в контейнере; None - сцена перекомпилирована и лежит в _pinned
+        self._extents: List[Optional[Tuple[int, int]]] = []
+        self._pinned: Dict[int, Scene] = {}
+        # Номер сцены в контейнере -> номер в этом графе; None - номера совпадают
+        self._renumber: Optional[Dict[int, int]] = None
+        self._cache: Dict[int, Scene] = {}
+        self._lock = threading.Lock()
+        # Прогноз: куча (-вероятность, сцена, оставшаяся глубина) и что уже потрачено на него
+        self._wakeup = threading.Condition(self._lock)
+        self._worker: Optional[threading.Thread] = None
+        self._generation = 0
+        self._plan: List[Tuple[float, int, int]] = []
+        self._planned: set = set()
+        self._spent = 0
+        self._fetched = 0
+
+    @property
+    def scenes(self) -> Tuple[Scene, ...]:
+        """Все сцены (читает весь сценарий - только для утилит)"""
+        return tuple(self.get_scene(number) for number in range(len(self.scene_ids)))
+
+    def is_loaded(self, number: int) -> bool:
+        with self._lock:
+            return number in self._cache or number in self._pinned
+
+    def get_scene(self, number: int) -> Scene:
+        scene = self._pinned.get(number)
+        if scene is not None:
+            return scene
+        with self._lock:
+            scene = self._cache.pop(number, None)
+            if scene is not None:
+                self._cache[number] = scene  # Перемещаем в конец как недавно использованную
+                return scene
+        return self._load(number)
+
+    def _load(self, number: int, generation: Optional[int] = None) -> Scene:
+        """Читает сцену в кэш; с generation - только если прогноз с тех пор не сменился"""
+        offset, length = self._extents[number]
+        scene = self.container.read_scene(offset, length)
+        if self._renumber is not None:
+            scene = renumber_scene(scene, self._renumber)
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return scene
+            if number not in self._cache and len(self._cache) >= self.cache_size:
+                del self._cache[next(iter(self._cache))]  # Вытесняем самую давнюю
+            self._cache[number] = scene
+        return scene
+
+    def prefetch(self, node: Node) -> None:
+        """Заменяет прогноз: подгружает в фоне сцены, в которые можно попасть из текущей реплики"""
+        exits = exit_weights(self.get_scene(node.scene), node.index) if self.prefetch_depth > 0 else {}
+        with self._lock:
+            self._generation += 1
+            self._plan = [(-weight, number, self.prefetch_depth) for number, weight in exits.items()]
+            heapq.heapify(self._plan)
+            self._planned = set(exits) | {node.scene}
+            self._spent = 0
+            self._fetched = 0
+            if not self._plan:
+                return
+            self._wakeup.notify()
+        if self._worker is None:
+            self._worker = threading.Thread(target=self._prefetch_worker, name="story-prefetch", daemon=True)
+            self._worker.start()
+
+    def _prefetch_worker(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._plan:
+                    self._wakeup.wait()
+                generation = self._generation
+                weight, number, depth = heapq.heappop(self._plan)
+                cached = number in self._cache or number in self._pinned
+                if not cached:
+                    size = self._extents[number][1]
+                    if self._spent + size > self.prefetch_budget or self._fetched >= self.cache_size // 2:
+                        continue  # Не влезает в бюджет; сцены поменьше ещё могут влезть
+                    self._spent += size
+                    self._fetched += 1
+                elif depth <= 1:
+                    continue
+            with self._lock:
+                if generation != self._generation:
+                    continue  # Прогноз сменился, пока поток выбирал сцену: не читаем зря и не вытесняем кэш
+            try:
+                scene = self.get_scene(number) if cached else self._load(number, generation)
+            except (OSError, ValueError, EOFError, TypeError) as e:
+                print(f"Story prefetch failed for scene {self.scene_ids[number]}: {e}")
+                continue
+            if depth <= 1:
+                continue
+            with self._lock:
+                if generation != self._generation:
+                    continue  # Игрок уже ушёл по другой ветке
+                for target, share in exit_weights(scene).items():
+                    if target not in self._planned:
+                        self._planned.add(target)
+                        heapq.heappush(self._plan, (weight * share, target, depth - 1))
+
+    def revise(self, scene_ids: Sequence[str], changed: Mapping[str, Scene], strings: StringTables,
+               unresolved: Tuple[Tuple[str, int, str], ...]) -> 'StreamingStory':
+        """
+        Новая версия графа на том же контейнере (для горячей перезагрузки).
+
+        Сцены changed, уже скомпилированные под номерами scene_ids,
+        хранятся в памяти; остальные сцены scene_ids должны быть в этом
+        графе и не ссылаться на добавленные или удалённые сцены - они
+        читаются из контейнера, как прежде, а номера в их переходах
+        переводятся на новые. Пока набор и порядок сцен прежний,
+        прочитанные сцены переходят в кэш новой версии.
+        """
+        story = StreamingStory.__new__(StreamingStory)
+        story._setup(self.container, scene_ids, self.cache_size, self.prefetch_depth, self.prefetch_budget)
+        story.unresolved = unresolved
+        story._use_strings(strings, self.language)
+        same_layout = story.scene_ids == self.scene_ids
+        numbers = {number: story.scene_index[scene_id]
+                   for number, scene_id in enumerate(self.scene_ids) if scene_id in story.scene_index}
+
+        for number, scene_id in enumerate(story.scene_ids):
+            scene = changed.get(scene_id)
+            if scene is None:
+                previous = self.scene_index[scene_id]
+                scene = self._pinned.get(previous)
+                if scene is None:
+                    story._extents.append(self._extents[previous])
+                    continue
+                if not same_layout:
+                    scene = renumber_scene(scene, numbers)
+            story._extents.append(None)
+            story._pinned[number] = scene
+
+        if same_layout:
+            story._renumber = self._renumber
+            with self._lock:
+                story._cache = {number: scene for number, scene in self._cache.items() if number not in story._pinned}
+        else:
+            blocks = self._renumber if self._renumber is not None else {number: number for number in numbers}
+            renumber = {block: numbers[number] for block, number in blocks.items() if number in numbers}
+            if any(block != number for block, number in renumber.items()):
+                story._renumber = renumber
+        return story
+
+
+def open_story(source, language: str = "ru", container=None, cache_size: int = SCENE_CACHE_SIZE,
+               prefetch_depth: int = PREFETCH_DEPTH, prefetch_budget: int = PREFETCH_BUDGET) -> StoryGraph:
+    """
+    Открывает сценарий для проигрывания.
+
+    Если контейнер отсутствует, повреждён или собран из другой версии
+    source или его файлов строк, сценарий компилируется заново; дальше
+    сцены и таблицы строк читаются из контейнера по запросу.
+
+    :raises StoryError: Если сценарий не прошёл проверку
+    """
+    source = Path(source)
+    container_path = Path(container) if container else source.with_suffix(".pack")
+    pack = None
+    if container_path.exists():
+        try:
+            pack = StoryContainer(container_path)
+        except (OSError, ValueError, KeyError, struct.error) as e:
+            print(f"Story container {container_path} is unreadable, rebuilding: {e}")
+    if pack is None or not pack.is_current(source):
+        pack = StoryContainer.build(source, container_path)
+    return StreamingStory(pack, language, cache_size, prefetch_depth, prefetch_budget)
+
+
+def _benchmark(source, language: str = "ru", repeat: int = 5) -> None:
+    """Сравнивает загрузку: JSON без кэша, компиляция контейнера, тёплый старт, смена языка"""
+    source = Path(source)
+    pack = source.with_suffix(".pack")
+
+    def measure(action) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            action()
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+
+    def warm():
+        story = open_story(source, language, pack)
+        for number in range(len(story)):
+            story.get_scene(number)
+
+    eager = measure(lambda: StoryGraph.load(source, language))
+    cold = measure(lambda: StoryContainer.build(source, pack))
+    start = measure(lambda: open_story(source, language, pack))
+    full = measure(warm)
+    story = open_story(source, language, pack)
+    switch = measure(lambda: [story.set_language(other) for other in story.strings.languages])
+    print(f"{source}: {len(story)} scenes, {sum(1 for _ in story.nodes())} lines, "
+          f"{len(story.unresolved)} unresolved targets, languages: {', '.join(story.strings.languages)}")
+    print(f"  json + compile:       {eager:8.2f} ms")
+    print(f"  cold (build pack):    {cold:8.2f} ms")
+    print(f"  warm start (index):   {start:8.2f} ms")
+    print(f"  warm, all scenes:     {full:8.2f} ms")
+    print(f"  switch all languages: {switch:8.2f} ms")
+
+
+if __name__ == "__main__":
+    _benchmark(sys.argv[1] if len(sys.argv) > 1 else "story.json")
@@ -0,0 +1,282 @@
+"""
+Горячая перезагрузка сценария и строк интерфейса во время игры.
+
+HotReloader в фоновом потоке раз в POLL_INTERVAL сверяет время
+изменения и размер story.json, его файлов строк и locales.json (только
+os.stat, без сторонних служб). Изменившийся файл читается, проверяется
+и компилируется в том же потоке: у сценария заново компилируются только
+сцены, чей JSON поменялся, остальные сцены и таблицы строк неизменённых
+языков берутся из прежнего графа (потоковый граф остаётся потоковым:
+неизменённые сцены по-прежнему читаются из контейнера); у locales.json вычисляются
+изменившиеся разделы. Готовый результат кладётся в очередь, а игра
+забирает его в главном потоке через poll() и только подменяет объекты,
+так что кадр не ждёт ни диска, ни компиляции.
+
+Модуль не зависит от pygame: о готовом результате он сообщает функцией
+notify (игра будит ею свой цикл событий).
+"""
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, NamedTuple, Optional, Tuple, Union
+
+from story_graph import (Scene, StoryError, StoryGraph, StreamingStory, StringTables, as_document, compile_scene,
+                         read_strings, renumber_scene, scene_targets, validate_story)
+
+POLL_INTERVAL = 0.5  # Секунды между проверками файлов
+
+
+class StoryReload(NamedTuple):
+    """Новая версия графа сценария"""
+    story: StoryGraph
+    scenes: Tuple[str, ...]  # Перекомпилированные сцены
+    languages: Tuple[str, ...]  # Языки, чьи строки перечитаны
+
+
+class LocaleReload(NamedTuple):
+    """Изменившиеся разделы locales.json: (язык, раздел) -> новое значение, None - раздел удалён"""
+    sections: Dict[Tuple[str, str], Any]
+
+
+class ReloadFailed(NamedTuple):
+    """Файл изменился, но не читается или не прошёл проверку; игра остаётся на прежней версии"""
+    path: str
+    error: str
+
+
+ReloadResult = Union[StoryReload, LocaleReload, ReloadFailed]
+
+
+def _stat_key(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _digest(value: Any) -> str:
+    """Отпечаток разобранного JSON (не зависит от отступов и порядка ключей)"""
+    return hashlib.sha1(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def diff_sections(old: Mapping[str, Any], new: Mapping[str, Any]) -> Dict[Tuple[str, str], Any]:
+    """Разделы верхнего уровня каждого языка, которые в new не такие, как в old"""
+    changes = {}
+    for language in {**old, **new}:
+        before, after = old.get(language, {}), new.get(language, {})
+        for section in {**before, **after}:
+            if before.get(section) != after.get(section):
+                changes[(language, section)] = after.get(section)
+    return changes
+
+
+class HotReloader:
+    """
+    Наблюдатель за файлами сценария и локализации.
+
+    :param story_file: story.json
+    :param locales_file: locales.json (None - не следить)
+    :param story: Граф, который сейчас показывает игра (из него берутся неизменённые сцены)
+    :param notify: Вызывается из фонового потока, когда в очереди появился результат
+    """
+
+    def __init__(self, story_file, locales_file, story: StoryGraph,
+                 notify: Optional[Callable[[], None]] = None, interval: float = POLL_INTERVAL):
+        self.story_file = Path(story_file)
+        self.locales_file = Path(locales_file) if locales_file is not None else None
+        self.interval = interval
+        self.notify = notify
+        self._story = story  # Последний собранный граф (игра может ещё не забрать его)
+        self._scene_digests: Dict[str, str] = {}
+        self._table_digests: Dict[str, Any] = {}
+        self._story_keys: Dict[Path, Optional[Tuple[int, int]]] = {}
+        self._locales: Dict[str, Any] = {}
+        self._locales_key: Optional[Tuple[int, int]] = None
+        self._results: "queue.Queue[ReloadResult]" = queue.Queue()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Запускает фоновый поток (сначала он запоминает текущие версии файлов)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hot-reload", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll(self) -> List[ReloadResult]:
+        """Готовые результаты перезагрузки (вызывается из главного потока)"""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def _run(self) -> None:
+        self.prime()
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def prime(self) -> None:
+        """Запоминает текущие версии файлов, с которыми будут сравниваться следующие"""
+        try:
+            document, self._story_keys = self._read_story()
+        except (OSError, ValueError):
+            # Сценарий пока не читается: первая удачная правка скомпилирует его целиком
+            self._story_keys = {self.story_file: _stat_key(self.story_file)}
+        else:
+            self._scene_digests = {scene_id: _digest(raw) for scene_id, raw in document["scenes"].items()}
+            self._table_digests = self._tables(document)
+
+        if self.locales_file is not None:
+            self._locales_key = _stat_key(self.locales_file)
+            try:
+                self._locales = self._read_locales()
+            except (OSError, ValueError):
+                self._locales = {}
+
+    def check(self) -> None:
+        """Одна проверка файлов; изменившиеся перечитываются сразу"""
+        if any(_stat_key(path) != key for path, key in self._story_keys.items()):
+            self._reload_story()
+        if self.locales_file is not None and _stat_key(self.locales_file) != self._locales_key:
+            self._reload_locales()
+
+    def _push(self, result: ReloadResult) -> None:
+        self._results.put(result)
+        if self.notify is not None:
+            self.notify()
+
+    def _read_story(self) -> Tuple[Mapping[str, Any], Dict[Path, Optional[Tuple[int, int]]]]:
+        """Проверенный документ формата 2 и версии всех его файлов"""
+        # Версия снимается до чтения: запись во время чтения вызовет ещё одну перезагрузку
+        keys = {self.story_file: _stat_key(self.story_file)}
+        with open(self.story_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        problems = validate_story(data)
+        if problems:
+            raise StoryError(problems)
+        document = as_document(data)
+        for table in document["strings"].values():
+            if isinstance(table, str):
+                path = self.story_file.parent / table
+                keys[path] = _stat_key(path)
+        return document, keys
+
+    def _tables(self, document: Mapping[str, Any]) -> Dict[str, Any]:
+        """Версия таблицы строк каждого языка: файл - имя и его версия, встроенная - отпечаток"""
+        versions = {}
+        for language, table in document["strings"].items():
+            if isinstance(table, str):
+                versions[language] = (table, _stat_key(self.story_file.parent / table))
+            else:
+                versions[language] = _digest(table)
+        return versions
+
+    def _reload_story(self) -> None:
+        try:
+            document, keys = self._read_story()
+            story, scenes, languages, digests, tables = self._recompile(document)
+        except (OSError, ValueError) as e:
+            # Запоминаем и неудачную версию, чтобы не повторять ошибку на каждой проверке
+            self._story_keys = {path: _stat_key(path) for path in self._story_keys}
+            self._push(ReloadFailed(str(self.story_file), str(e)))
+            return
+        self._story_keys = keys
+        if not scenes and not languages:
+            return
+        self._story = story
+        self._scene_digests = digests
+        self._table_digests = tables
+        self._push(StoryReload(story, scenes, languages))
+
+    def _recompile(self, document: Mapping[str, Any]) -> Tuple[StoryGraph, Tuple[str, ...], Tuple[str, ...],
+                                                               Dict[str, str], Dict[str, Any]]:
+        """
+        Собирает новый граф, компилируя только изменившиеся сцены.
+
+        Неизменённая сцена компилируется заново, только если она ссылается
+        на добавленную или удалённую сцену (переход на неё разрешается
+        иначе); у остальных лишь переводятся номера сцен в переходах.
+        Потоковый граф пересобирается через StreamingStory.revise, так что
+        неизменённые сцены не читаются из контейнера.
+        """
+        old = self._story
+        raw_scenes = document["scenes"]
+        scene_ids = [sys.intern(scene_id) for scene_id in raw_scenes]
+        digests = {scene_id: _digest(raw_scenes[scene_id]) for scene_id in scene_ids}
+        index = {scene_id: i for i, scene_id in enumerate(scene_ids)}
+        moved = set(scene_ids).symmetric_difference(old.scene_ids)
+
+        old_unresolved: Dict[str, List[Tuple[str, int, str]]] = {}
+        for entry in old.unresolved:
+            old_unresolved.setdefault(entry[0], []).append(entry)
+        changed: Dict[str, Scene] = {}
+        unresolved: List[Tuple[str, int, str]] = []
+        for number, scene_id in enumerate(scene_ids):
+            reuse = digests[scene_id] == self._scene_digests.get(scene_id) and scene_id in old
+            if reuse and moved:
+                reuse = not moved.intersection(scene_targets(raw_scenes[scene_id]))
+            if reuse:
+                unresolved.extend(old_unresolved.get(scene_id, ()))
+            else:
+                changed[scene_id] = compile_scene(number, scene_id, raw_scenes[scene_id], index, unresolved)
+
+        tables = self._tables(document)
+        loaders, languages = {}, []
+        for language, table in document["strings"].items():
+            if tables[language] == self._table_digests.get(language) and language in old.strings:
+                loaders[language] = partial(old.strings.table, language)
+                continue
+            loaded = read_strings(self.story_file.parent / table) if isinstance(table, str) else dict(table)
+            loaders[language] = partial(dict, loaded)
+            languages.append(language)
+        if document["base"] != old.strings.base and not languages:
+            languages.append(document["base"])
+
+        strings = StringTables(loaders, document["base"])
+        if isinstance(old, StreamingStory):
+            story = old.revise(scene_ids, changed, strings, tuple(unresolved))
+        else:
+            same_layout = tuple(scene_ids) == old.scene_ids
+            numbers = {number: index[scene_id] for number, scene_id in enumerate(old.scene_ids) if scene_id in index}
+            scenes = []
+            for scene_id in scene_ids:
+                scene = changed.get(scene_id)
+                if scene is None:
+                    scene = old.get_scene(old.scene_index[scene_id])
+                    if not same_layout:
+                        scene = renumber_scene(scene, numbers)
+                scenes.append(scene)
+            story = StoryGraph(tuple(scenes), strings, old.language, tuple(unresolved))
+        return story, tuple(changed), tuple(languages), digests, tables
+
+    def _read_locales(self) -> Dict[str, Any]:
+        with open(self.locales_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or not all(isinstance(sections, dict) for sections in data.values()):
+            raise ValueError("locales must map languages to sections")
+        return data
+
+    def _reload_locales(self) -> None:
+        self._locales_key = _stat_key(self.locales_file)
+        try:
+            locales = self._read_locales()
+        except (OSError, ValueError) as e:
+            self._push(ReloadFailed(str(self.locales_file), str(e)))
+            return
+        changes = diff_sections(self._locales, locales)
+        self._locales = locales
+        if changes:
+            self._push(LocaleReload(changes))
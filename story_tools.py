@@ -0,0 +1,1167 @@
+"""
+Утилиты командной строки для проверки сценария без запуска игры.
+
+    python story_tools.py analyze [story.json] [--language ru] [--start start] [--json]
+    python story_tools.py explore [story.json] [--language ru] [--stat ИМЯ=ЗНАЧЕНИЕ] [--max-states N]
+    python story_tools.py simulate [story.json] [--runs N] [--model random|greedy:СТАТ|weighted:...] [--seed S]
+    python story_tools.py convert [story.json] --output story2.json [--base ru] [--inline]
+
+analyze строит граф реплик и за линейное время (обход в ширину вперёд
+от стартовой реплики и назад от концовок) находит недостижимые сцены,
+переходы на несуществующие сцены, сцены, из которых нельзя дойти ни до
+одной концовки, и тупиковые реплики. Дополнительно сверяются переводы
+(строки без перевода, лишние строки, а в старом формате - расхождения
+структуры между языками) и собирается сводка по характеристикам,
+предметам, действиям и флагам.
+
+Условия выборов при анализе не учитываются: считается, что доступен
+любой выбор, поэтому достижимость оценивается сверху.
+
+explore, наоборот, проигрывает историю по правилам DialogManager:
+условия выборов, характеристики с ограничением STAT_MIN..STAT_MAX,
+предметы, действия и флаги. Перебираются все различимые состояния,
+для каждой концовки выводятся пример пути и диапазоны характеристик.
+
+simulate проигрывает много случайных прохождений за выбранную модель
+игрока на пуле процессов и считает частоты исходов, частоты выборов
+и распределения характеристик при входе в каждую сцену.
+
+convert переводит story.json старого формата ({сцена: {язык: [реплики]}})
+в формат 2: общая структура и таблицы строк по языкам в отдельных файлах
+рядом (ИМЯ.ЯЗЫК.json) или, с --inline, внутри самого файла.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Mapping, NamedTuple, Optional, Tuple
+
+from story_graph import (DEFAULT_STATS, STAT_MAX, STAT_MIN, Choice, Cursor, Effects, Node, StateView, StoryError,
+                         StoryGraph, StringTables, compile_predicate, convert_story, is_document, predicate_leaves,
+                         stat_bounds, string_ids, validate_story)
+
+START_SCENE = "start"
+
+
+class NodeGraph:
+    """
+    Граф реплик с плотной нумерацией: реплика (сцена, i) получает номер
+    offsets[сцена] + i, рёбра хранятся списками смежности.
+    """
+
+    def __init__(self, story: StoryGraph):
+        self.story = story
+        self.offsets: List[int] = []
+        total = 0
+        for number in range(len(story)):
+            self.offsets.append(total)
+            total += len(story.get_scene(number).nodes)
+        self.size = total
+        self.edges: List[List[int]] = [[] for _ in range(total)]
+        self.endings: List[int] = []
+        self.dead_ends: List[int] = []
+
+        for node in story.nodes():
+            node_id = self.offsets[node.scene] + node.index
+            if node.ending is not None:
+                self.endings.append(node_id)
+                continue
+            if node.choices:
+                targets = [self._first(choice.target) if choice.target is not None
+                           else self._next(node.scene, node.index) for choice in node.choices]
+            elif node.jump is not None:
+                targets = [self._first(node.jump)]
+            else:
+                targets = [self._next(node.scene, node.index)]
+            targets = [target for target in targets if target is not None]
+            if not targets:
+                self.dead_ends.append(node_id)
+            self.edges[node_id] = targets
+
+    def _first(self, scene: int) -> Optional[int]:
+        return self.offsets[scene] if self.story.get_scene(scene).nodes else None
+
+    def _next(self, scene: int, index: int) -> Optional[int]:
+        return self.offsets[scene] + index + 1 if index + 1 < len(self.story.get_scene(scene).nodes) else None
+
+    def scene_of(self, node_id: int) -> int:
+        """Номер сцены по номеру реплики (двоичный поиск по смещениям)"""
+        low, high = 0, len(self.offsets) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.offsets[middle] <= node_id:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def node(self, node_id: int) -> Node:
+        scene = self.scene_of(node_id)
+        return self.story.get_scene(scene).nodes[node_id - self.offsets[scene]]
+
+    def location(self, node_id: int) -> str:
+        scene = self.scene_of(node_id)
+        return f"{self.story.scene_id(scene)}[{node_id - self.offsets[scene]}]"
+
+    def reachable_from(self, sources: List[int]) -> bytearray:
+        """Отметки реплик, достижимых из sources (обход в ширину)"""
+        return self._walk(sources, self.edges)
+
+    def reaching(self, targets: List[int]) -> bytearray:
+        """Отметки реплик, из которых достижима хотя бы одна из targets"""
+        reverse: List[List[int]] = [[] for _ in range(self.size)]
+        for source, edges in enumerate(self.edges):
+            for target in edges:
+                reverse[target].append(source)
+        return self._walk(targets, reverse)
+
+    def _walk(self, sources: List[int], edges: List[List[int]]) -> bytearray:
+        seen = bytearray(self.size)
+        pending = deque()
+        for source in sources:
+            if not seen[source]:
+                seen[source] = 1
+                pending.append(source)
+        while pending:
+            for target in edges[pending.popleft()]:
+                if not seen[target]:
+                    seen[target] = 1
+                    pending.append(target)
+        return seen
+
+
+def check_translations(data: Dict[str, Any], root=None) -> Dict[str, Any]:
+    """
+    Строки без перевода и лишние строки в таблице каждого языка.
+
+    Для старого формата ещё и расхождения структуры между языками - то,
+    что convert_story не сможет перенести.
+
+    :param root: Каталог, от которого отсчитываются файлы строк
+    """
+    mismatched: List[str] = []
+    if is_document(data):
+        document = data
+    else:
+        document, mismatched = convert_story(data)
+    used = list(dict.fromkeys(string_ids(document)))  # В порядке сценария
+    strings = StringTables.of(document, root)
+    missing: Dict[str, List[str]] = {}
+    unused: Dict[str, List[str]] = {}
+    for language in strings.languages:
+        table = strings.table(language)
+        absent = [string_id for string_id in used if string_id not in table]
+        extra = sorted(set(table).difference(used))
+        if absent:
+            missing[language] = absent
+        if extra:
+            unused[language] = extra
+    return {"languages": list(strings.languages), "base": document["base"], "missing": missing, "unused": unused,
+            "mismatched": mismatched}
+
+
+def collect_usage(story: StoryGraph) -> Dict[str, Any]:
+    """Где меняются и проверяются характеристики, выдаются и забираются предметы"""
+    stats: Dict[str, Dict[str, Any]] = {}
+    items: Dict[str, Dict[str, List[str]]] = {}
+    actions: Dict[str, List[str]] = {}
+    flags: Dict[str, List[str]] = {}
+    tested: Dict[str, Dict[str, List[str]]] = {"item": {}, "flag": {}, "action": {}}  # Условия на предметы и т.п.
+
+    def stat(name: str) -> Dict[str, Any]:
+        return stats.setdefault(name, {"raised": 0, "lowered": 0, "min_change": 0, "max_change": 0,
+                                       "tested": [], "thresholds": []})
+
+    def record(effects, where: str) -> None:
+        for name, change in effects.change_stats:
+            entry = stat(name)
+            entry["raised" if change >= 0 else "lowered"] += 1
+            entry["min_change"] = min(entry["min_change"], change)
+            entry["max_change"] = max(entry["max_change"], change)
+        for item in effects.add_items:
+            items.setdefault(item, {"added": [], "removed": []})["added"].append(where)
+        for item in effects.remove_items:
+            items.setdefault(item, {"added": [], "removed": []})["removed"].append(where)
+        for action in effects.unlock_actions:
+            actions.setdefault(action, []).append(where)
+        for flag, _ in effects.set_flags:
+            flags.setdefault(flag, []).append(where)
+
+    for node in story.nodes():
+        where = f"{story.scene_id(node.scene)}[{node.index}]"
+        record(node.effects, where)
+        for number, choice in enumerate(node.choices):
+            option = f"{where} choice {number}"
+            record(choice.effects, option)
+            for leaf in predicate_leaves(choice.condition):
+                if leaf[0] == "stat":
+                    entry = stat(leaf[1])
+                    entry["tested"].append(option)
+                    entry["thresholds"].append((leaf[2], leaf[3]))
+                else:
+                    tested[leaf[0]].setdefault(leaf[1], []).append(option)
+
+    provided = {"item": {item for item, entry in items.items() if entry["added"]}, "flag": flags, "action": actions}
+
+    return {
+        "stats": stats,
+        "items": items,
+        "actions": actions,
+        "flags": flags,
+        "tested": tested,
+        "never_provided": sorted(f"{kind} {name}" for kind, names in tested.items()
+                                 for name in names if name not in provided[kind]),
+        "never_changed": sorted(name for name, entry in stats.items()
+                                if entry["tested"] and not entry["raised"] and not entry["lowered"]),
+        "removed_never_added": sorted(item for item, entry in items.items()
+                                      if entry["removed"] and not entry["added"])
+    }
+
+
+def analyze(data: Dict[str, Any], language: str = "ru", start: str = START_SCENE, root=None) -> Dict[str, Any]:
+    """
+    Анализирует разобранный story.json.
+
+    :param root: Каталог, от которого отсчитываются файлы строк
+    :raises StoryError: Если сценарий не прошёл проверку структуры
+    """
+    problems = validate_story(data)
+    if problems:
+        raise StoryError(problems)
+    story = StoryGraph.compile(data, language, root)
+    graph = NodeGraph(story)
+
+    start_cursor = story.locate(start)
+    reached = graph.reachable_from([graph.offsets[start_cursor.scene]] if start_cursor else [])
+    finishing = graph.reaching(graph.endings)
+
+    scene_reached = bytearray(len(story))
+    scene_finishes = bytearray(len(story))
+    for scene, begin in enumerate(graph.offsets):
+        for node_id in range(begin, begin + len(story.get_scene(scene).nodes)):
+            if reached[node_id]:
+                scene_reached[scene] = 1
+                if finishing[node_id]:
+                    scene_finishes[scene] = 1
+
+    return {
+        "language": language,
+        "start": start if start_cursor else None,
+        "scenes": len(story),
+        "lines": graph.size,
+        "reachable_lines": sum(reached),
+        "unreachable_scenes": [story.scene_id(n) for n in range(len(story)) if not scene_reached[n]],
+        "dangling_targets": [f"{scene_id}[{index}] -> {target}" for scene_id, index, target in story.unresolved],
+        "no_terminal": [story.scene_id(n) for n in range(len(story)) if scene_reached[n] and not scene_finishes[n]],
+        "dead_ends": [graph.location(node_id) for node_id in graph.dead_ends if reached[node_id]],
+        "endings": [f"{graph.location(node_id)}: {story.text(graph.node(node_id).ending)}"
+                    for node_id in graph.endings if reached[node_id]],
+        "translations": check_translations(data, root),
+        "usage": collect_usage(story)
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Текстовый отчёт для консоли"""
+    lines = [f"Story ({report['language']}): {report['scenes']} scenes, {report['lines']} lines, "
+             f"{report['reachable_lines']} reachable from {report['start'] or 'nowhere (start scene missing)'}"]
+
+    def section(title: str, entries: List[str]) -> None:
+        lines.append(f"{title}: {len(entries)}")
+        lines.extend(f"  {entry}" for entry in entries)
+
+    section("Dangling next_scene targets", report["dangling_targets"])
+    section("Unreachable scenes", report["unreachable_scenes"])
+    section("Reachable scenes without a path to an ending", report["no_terminal"])
+    section("Reachable dead ends (story stops without an ending)", report["dead_ends"])
+    section("Reachable endings", report["endings"])
+
+    translations = report["translations"]
+    lines.append(f"Languages: {', '.join(translations['languages'])} (base: {translations['base']})")
+    for language, string_list in translations["missing"].items():
+        section(f"Strings missing in '{language}'", string_list)
+    for language, string_list in translations["unused"].items():
+        section(f"Unused strings in '{language}'", string_list)
+    section("Translations with a different structure", translations["mismatched"])
+
+    usage = report["usage"]
+    lines.append("Stats:")
+    for name, entry in sorted(usage["stats"].items()):
+        thresholds = ", never tested"
+        if entry["tested"]:
+            lows = [low for low, _ in entry["thresholds"] if low is not None]
+            highs = [high for _, high in entry["thresholds"] if high is not None]
+            bounds = ([f">= {min(lows)}..{max(lows)}"] if lows else []) + \
+                     ([f"<= {min(highs)}..{max(highs)}"] if highs else [])
+            thresholds = f", tested {', '.join(bounds)} in {len(entry['tested'])} choices"
+        lines.append(f"  {name}: +{entry['raised']}/-{entry['lowered']} changes "
+                     f"({entry['min_change']:+d}..{entry['max_change']:+d}){thresholds}")
+    section("Stats tested but never changed", usage["never_changed"])
+    lines.append("Items:")
+    for item, entry in sorted(usage["items"].items()):
+        lines.append(f"  {item}: added {len(entry['added'])}, removed {len(entry['removed'])}")
+    section("Items removed but never added", usage["removed_never_added"])
+    section("Unlocked actions", sorted(usage["actions"]))
+    section("Flags", sorted(usage["flags"]))
+    section("Conditions on items, flags or actions that nothing provides", usage["never_provided"])
+    return "\n".join(lines)
+
+
+def _hashable(value: Any) -> Any:
+    return json.dumps(value, ensure_ascii=False, sort_keys=True) if isinstance(value, (list, dict)) else value
+
+
+class Summary(NamedTuple):
+    """
+    Сводка множества состояний: диапазон каждой характеристики и
+    объединения предметов, флагов и открытых действий
+    """
+    stats: Tuple[Tuple[int, int], ...]
+    items: FrozenSet[str]
+    flags: FrozenSet[Tuple[str, Any]]
+    actions: FrozenSet[str]
+
+    def join(self, other: 'Summary') -> 'Summary':
+        return Summary(tuple((min(a[0], b[0]), max(a[1], b[1])) for a, b in zip(self.stats, other.stats)),
+                       self.items | other.items, self.flags | other.flags, self.actions | other.actions)
+
+
+class Transfer(NamedTuple):
+    """
+    Суммарное действие цепочки эффектов на состояние.
+
+    Характеристика x переходит в clamp(x + add, low, high): композиция
+    сложений с ограничением снова имеет такой вид, поэтому цепочка
+    реплик любой длины применяется за O(число характеристик).
+    """
+    stats: Tuple[Tuple[int, int, int], ...]  # (add, low, high) для каждой характеристики
+    added: FrozenSet[str]
+    removed: FrozenSet[str]
+    flags: Tuple[Tuple[str, Any], ...]
+    actions: FrozenSet[str]
+
+    @classmethod
+    def identity(cls, stat_count: int) -> 'Transfer':
+        return cls(((0, STAT_MIN, STAT_MAX),) * stat_count, frozenset(), frozenset(), (), frozenset())
+
+    @classmethod
+    def of(cls, effects: Effects, names: Mapping[str, int]) -> 'Transfer':
+        """Действие эффектов одной реплики или выбора (как в SaveManager)"""
+        stats = [(0, STAT_MIN, STAT_MAX)] * len(names)
+        for stat, change in effects.change_stats:
+            number = names.get(stat)
+            if number is not None:  # Неизвестные характеристики SaveManager пропускает
+                stats[number] = Transfer._chain(stats[number], (change, STAT_MIN, STAT_MAX))
+        added, removed = set(), set()
+        for item in effects.add_items:
+            added.add(item)
+        for item in effects.remove_items:
+            removed.add(item)
+            added.discard(item)
+        flags = {flag: _hashable(value) for flag, value in effects.set_flags}
+        return cls(tuple(stats), frozenset(added), frozenset(removed - added), tuple(flags.items()),
+                   frozenset(effects.unlock_actions))
+
+    @staticmethod
+    def _chain(first: Tuple[int, int, int], second: Tuple[int, int, int]) -> Tuple[int, int, int]:
+        add, low, high = first
+        change, low2, high2 = second
+        return (add + change, max(low2, min(high2, low + change)), max(low2, min(high2, high + change)))
+
+    def then(self, other: 'Transfer') -> 'Transfer':
+        """Эта цепочка, за которой применяется other"""
+        flags = dict(self.flags)
+        flags.update(other.flags)
+        return Transfer(tuple(self._chain(a, b) for a, b in zip(self.stats, other.stats)),
+                        (self.added - other.removed) | other.added,
+                        (self.removed - other.added) | other.removed,
+                        tuple(flags.items()),
+                        self.actions | other.actions)
+
+    def value(self, number: int, value: int) -> int:
+        add, low, high = self.stats[number]
+        return max(low, min(high, value + add))
+
+    def apply(self, summary: Summary) -> Summary:
+        """Преобразование монотонно, поэтому границы диапазонов переходят в границы"""
+        stats = tuple((self.value(n, low), self.value(n, high)) for n, (low, high) in enumerate(summary.stats))
+        items = (summary.items - self.removed) | self.added
+        return Summary(stats, items, self.set_flags(summary.flags), summary.actions | self.actions)
+
+    def set_flags(self, flags: FrozenSet[Tuple[str, Any]]) -> FrozenSet[Tuple[str, Any]]:
+        """Пары (флаг, значение) после эффектов цепочки"""
+        if not self.flags:
+            return flags
+        names = {flag for flag, _ in self.flags}
+        return frozenset(entry for entry in flags if entry[0] not in names) | frozenset(self.flags)
+
+
+class Segment(NamedTuple):
+    """Детерминированный участок от реплики до следующего выбора или конца"""
+    transfer: Transfer
+    outcome: str  # Explorer.CHOICE, ENDING, DEAD_END или LOOP
+    node: Optional[Node]  # Реплика с выбором или концовкой; для тупика - последняя реплика
+    entries: Tuple[Tuple[int, Transfer], ...]  # Входы в сцены: (сцена, действие участка до входа)
+
+
+class Step(NamedTuple):
+    """Выбор и всё, что происходит после него до следующего выбора или исхода"""
+    choice: Choice
+    transfer: Transfer
+    outcome: str
+    node: Node
+    entries: Tuple[Tuple[int, Transfer], ...]
+
+
+class Liveness(NamedTuple):
+    """Что проверяют условия в точке выбора и дальше по графу"""
+    stats: int  # Маска номеров характеристик
+    items: FrozenSet[str]
+    flags: FrozenSet[str]
+    actions: FrozenSet[str]
+
+    def join(self, other: 'Liveness') -> 'Liveness':
+        return Liveness(self.stats | other.stats, self.items | other.items, self.flags | other.flags,
+                        self.actions | other.actions)
+
+
+class Explorer:
+    """
+    Полный перебор прохождений с запоминанием состояний.
+
+    - Участки между выборами детерминированы: они один раз сворачиваются
+      в Segment и дальше применяются целиком.
+    - Состояние запоминается только в точке выбора. Ключ - реплика,
+      значения тех характеристик и те предметы, флаги и действия, которые
+      проверяются условиями где-то дальше по графу (живое состояние).
+      Остальное на ветвление уже не влияет: состояния, различающиеся
+      только этим, склеиваются, а значения хранятся в Summary.
+    - Каждый ключ раскрывается один раз; затем диапазоны и предметы
+      протягиваются по найденным переходам до неподвижной точки.
+    """
+
+    CHOICE, ENDING, DEAD_END, LOOP, NO_CHOICE = "choice", "ending", "dead end", "loop", "no available choice"
+
+    def __init__(self, story: StoryGraph, stats: Mapping[str, int] = DEFAULT_STATS):
+        self.story = story
+        self.stat_names = tuple(stats)
+        self.names = {name: number for number, name in enumerate(self.stat_names)}
+        self.initial = Summary(tuple((value, value) for value in stats.values()),
+                               frozenset(), frozenset(), frozenset())
+        self._segments: Dict[Cursor, Segment] = {}
+        self._steps: Dict[Cursor, List[Step]] = {}
+
+    def segment(self, node: Node) -> Segment:
+        """Сворачивает реплики от node до ближайшего выбора, концовки или тупика"""
+        segment = self._segments.get(node.cursor)
+        if segment is not None:
+            return segment
+        transfer = Transfer.identity(len(self.stat_names))
+        passed = set()
+        entries = []
+        start = node
+        while True:
+            passed.add(node.cursor)
+            if node.index == 0:
+                entries.append((node.scene, transfer))
+            if node.effects:
+                transfer = transfer.then(Transfer.of(node.effects, self.names))
+            if node.ending is not None:
+                segment = Segment(transfer, self.ENDING, node, tuple(entries))
+                break
+            if node.choices:
+                segment = Segment(transfer, self.CHOICE, node, tuple(entries))
+                break
+            following = self.story.following(node)
+            if following is None:
+                segment = Segment(transfer, self.DEAD_END, node, tuple(entries))
+                break
+            if following.cursor in passed:
+                segment = Segment(transfer, self.LOOP, following, tuple(entries))
+                break
+            node = following
+        self._segments[start.cursor] = segment
+        return segment
+
+    def steps(self, question: Node) -> List[Step]:
+        """Для каждого выбора: суммарный переход до следующего выбора или исхода"""
+        steps = self._steps.get(question.cursor)
+        if steps is None:
+            steps = self._steps[question.cursor] = []
+            for choice in question.choices:
+                transfer = Transfer.of(choice.effects, self.names)
+                if choice.target is not None:
+                    following = self.story.first(choice.target)
+                else:
+                    following = self.story.node((question.scene, question.index + 1))
+                if following is None:
+                    steps.append(Step(choice, transfer, self.DEAD_END, question, ()))
+                    continue
+                segment = self.segment(following)
+                entries = tuple((scene, transfer.then(prefix)) for scene, prefix in segment.entries)
+                steps.append(Step(choice, transfer.then(segment.transfer), segment.outcome, segment.node, entries))
+        return steps
+
+    def live_state(self, first: Node) -> Dict[Cursor, Liveness]:
+        """
+        Живое состояние точек выбора, достижимых из first.
+
+        Условия здесь не учитываются, поэтому оценка сверху. Итерация по
+        обратным рёбрам: живое состояние может только расти, не больше чем
+        на число проверок в условиях для каждой точки.
+        """
+        segment = self.segment(first)
+        if segment.outcome != self.CHOICE:
+            return {}
+        questions = [segment.node]
+        masks: Dict[Cursor, Liveness] = {}
+        predecessors: Dict[Cursor, List[Cursor]] = {segment.node.cursor: []}
+        for question in questions:
+            mask = 0
+            names: Dict[str, set] = {"item": set(), "flag": set(), "action": set()}
+            for choice in question.choices:
+                for leaf in predicate_leaves(choice.condition):
+                    if leaf[0] != "stat":
+                        names[leaf[0]].add(leaf[1])
+                    elif leaf[1] in self.names:
+                        mask |= 1 << self.names[leaf[1]]
+            masks[question.cursor] = Liveness(mask, frozenset(names["item"]), frozenset(names["flag"]),
+                                              frozenset(names["action"]))
+            for step in self.steps(question):
+                if step.outcome != self.CHOICE:
+                    continue
+                if step.node.cursor not in predecessors:
+                    predecessors[step.node.cursor] = []
+                    questions.append(step.node)
+                predecessors[step.node.cursor].append(question.cursor)
+
+        pending = deque(masks)
+        while pending:
+            cursor = pending.popleft()
+            for previous in predecessors[cursor]:
+                combined = masks[previous].join(masks[cursor])
+                if combined != masks[previous]:
+                    masks[previous] = combined
+                    pending.append(previous)
+        return masks
+
+    def explore(self, start: str = START_SCENE, max_states: int = 1_000_000) -> Dict[str, Any]:
+        """
+        Обходит все различимые состояния в ширину.
+
+        :return: Исходы (концовки, тупики, циклы) с примером пути и диапазонами характеристик
+        """
+        cursor = self.story.locate(start)
+        if cursor is None:
+            raise ValueError(f"start scene {start!r} not found")
+        first = self.story.node(cursor)
+        masks = self.live_state(first)
+        count = len(self.stat_names)
+
+        # Ключи точек выбора нумеруются; для каждого - родитель и текст выбора (для примера пути).
+        # Состояние - (характеристики, предметы, флаги, действия), мёртвое в ключе отброшено
+        keys: Dict[Tuple[Any, ...], int] = {}
+        questions: List[Node] = []
+        parents: List[Optional[Tuple[int, str]]] = []
+        edges: List[List[Tuple[Transfer, int]]] = []  # Цель >= 0 - ключ, < 0 - исход ~номер
+        outcomes: List[Dict[str, Any]] = []
+        outcome_index: Dict[Tuple[str, str, Optional[str]], int] = {}
+        pending = deque()
+
+        def target(kind: str, node: Node, state: Tuple[Any, ...], parent: Optional[int],
+                   label: Optional[str]) -> int:
+            if kind == self.CHOICE:
+                live = masks[node.cursor]
+                values, items, flags, actions = state
+                key = (node.cursor, tuple(value if live.stats >> n & 1 else None for n, value in enumerate(values)),
+                       items & live.items, frozenset(entry for entry in flags if entry[0] in live.flags),
+                       actions & live.actions)
+                number = keys.get(key)
+                if number is None:
+                    number = keys[key] = len(questions)
+                    questions.append(node)
+                    parents.append((parent, label) if parent is not None else None)
+                    edges.append([])
+                    pending.append((number, key[1:]))
+                return number
+            where = f"{self.story.scene_id(node.scene)}[{node.index}]"
+            text = self.story.text(node.ending) if kind == self.ENDING else None
+            number = outcome_index.get((kind, where, text))
+            if number is None:
+                number = outcome_index[(kind, where, text)] = len(outcomes)
+                example = self._path(parents, parent) + ([label] if label else [])
+                outcomes.append({"kind": kind, "where": where, "ending": text, "arrivals": 0,
+                                 "example": example, "summary": None})
+            outcomes[number]["arrivals"] += 1
+            return ~number
+
+        segment = self.segment(first)
+        root_summary = segment.transfer.apply(self.initial)
+        state = (tuple(low for low, _ in root_summary.stats), root_summary.items, root_summary.flags,
+                 root_summary.actions)
+        root = target(segment.outcome, segment.node, state, None, None)
+
+        truncated = False
+        transitions = 0
+        while pending:
+            if len(questions) > max_states:
+                truncated = True
+                break
+            number, state = pending.popleft()
+            values, items, flags, actions = state
+            question = questions[number]
+            view = StateView({self.stat_names[n]: value for n, value in enumerate(values) if value is not None},
+                             items, dict(flags), actions)
+            available = False
+            for step in self.steps(question):
+                if not step.choice.is_available(view):
+                    continue
+                available = True
+                transitions += 1
+                transfer = step.transfer
+                following = (tuple(transfer.value(n, value) if value is not None else None
+                                   for n, value in enumerate(values)),
+                             (items - transfer.removed) | transfer.added, transfer.set_flags(flags),
+                             actions | transfer.actions)
+                edges[number].append((transfer, target(step.outcome, step.node, following, number,
+                                                       self.story.text(step.choice.text))))
+            if not available:
+                edges[number].append((Transfer.identity(count),
+                                      target(self.NO_CHOICE, question, state, number, None)))
+
+        # Диапазоны и предметы протягиваются по переходам до неподвижной точки
+        summaries: List[Optional[Summary]] = [None] * len(questions)
+
+        def merge(number: int, summary: Summary) -> bool:
+            if number < 0:
+                outcome = outcomes[~number]
+                outcome["summary"] = summary if outcome["summary"] is None else outcome["summary"].join(summary)
+                return False
+            if number >= len(summaries):
+                return False  # Ключ за пределом max_states
+            current = summaries[number]
+            joined = summary if current is None else current.join(summary)
+            if joined == current:
+                return False
+            summaries[number] = joined
+            return True
+
+        changed = deque([root]) if merge(root, root_summary) else deque()
+        while changed:
+            number = changed.popleft()
+            summary = summaries[number]
+            for transfer, destination in edges[number]:
+                if merge(destination, transfer.apply(summary)):
+                    changed.append(destination)
+
+        report = []
+        for outcome in outcomes:
+            summary = outcome.pop("summary")
+            if summary is None:
+                continue  # Достигается только через отброшенные по max_states ключи
+            outcome["stats"] = {name: list(bounds) for name, bounds in zip(self.stat_names, summary.stats)}
+            outcome["items"] = sorted(summary.items)
+            outcome["flags"] = sorted(flag for flag, _ in summary.flags)
+            report.append(outcome)
+        return {
+            "start": start,
+            "choice_states": len(questions),
+            "transitions": transitions,
+            "segments": len(self._segments),
+            "live_stats": sorted({self.stat_names[n] for live in masks.values()
+                                  for n in range(count) if live.stats >> n & 1}),
+            "live_names": sorted({f"{kind} {name}" for live in masks.values()
+                                  for kind, names in (("item", live.items), ("flag", live.flags),
+                                                      ("action", live.actions))
+                                  for name in names}),
+            "truncated": truncated,
+            "outcomes": sorted(report, key=lambda outcome: (outcome["kind"], outcome["where"]))
+        }
+
+    @staticmethod
+    def _path(parents: List[Optional[Tuple[int, str]]], number: Optional[int]) -> List[str]:
+        """Тексты выборов от начала истории до точки выбора number"""
+        path = []
+        while number is not None:
+            link = parents[number]
+            if link is None:
+                break
+            number, label = link
+            path.append(label)
+        path.reverse()
+        return path
+
+
+def format_exploration(result: Dict[str, Any]) -> str:
+    """Текстовый отчёт перебора для консоли"""
+    lines = [f"Explored from {result['start']}: {result['choice_states']} distinct choice states, "
+             f"{result['transitions']} transitions, {result['segments']} segments, "
+             f"live stats: {', '.join(result['live_stats']) or 'none'}"
+             + (f", live conditions: {', '.join(result['live_names'])}" if result["live_names"] else "")
+             + (" (TRUNCATED: --max-states reached)" if result["truncated"] else "")]
+    for outcome in result["outcomes"]:
+        title = f"{outcome['kind']} at {outcome['where']}"
+        if outcome["ending"]:
+            title += f": {outcome['ending']}"
+        lines.append(f"{title} ({outcome['arrivals']} arrivals)")
+        ranges = ", ".join(f"{name} {low}..{high}" for name, (low, high) in outcome["stats"].items())
+        lines.append(f"  stats: {ranges}")
+        if outcome["items"]:
+            lines.append(f"  items seen: {', '.join(outcome['items'])}")
+        if outcome["flags"]:
+            lines.append(f"  flags set: {', '.join(outcome['flags'])}")
+        lines.append(f"  example: {' -> '.join(outcome['example']) or '(no choices)'}")
+    return "\n".join(lines)
+
+
+HISTOGRAM_BINS = 11  # 0-9, 10-19, ..., 90-99, 100
+SIMULATION_CHUNK = 5000  # Прохождений в одной задаче пула
+MAX_DECISIONS = 10000  # Защита от бесконечных циклов выборов
+
+
+class PlayerModel:
+    """
+    Модель игрока, выбирающая один из доступных шагов.
+
+    - "random": равновероятно;
+    - "greedy:СТАТ": шаг, после которого характеристика больше всего
+      (до следующего выбора), при равенстве - случайно;
+    - "weighted:СТАТ=ВЕС,СТАТ=ВЕС[@T]": вероятность пропорциональна
+      exp(сумма вес * изменение / T), T по умолчанию 10.
+    """
+
+    def __init__(self, spec: str, names: Mapping[str, int]):
+        self.spec = spec
+        kind, _, argument = spec.partition(":")
+        self.kind = kind
+        self.weights: List[Tuple[int, float]] = []
+        self.temperature = 10.0
+        if kind == "random":
+            return
+        if kind == "greedy":
+            if argument not in names:
+                raise ValueError(f"unknown stat {argument!r} in player model {spec!r}")
+            self.weights = [(names[argument], 1.0)]
+            return
+        if kind == "weighted":
+            argument, _, temperature = argument.partition("@")
+            if temperature:
+                self.temperature = float(temperature)
+            for part in filter(None, argument.split(",")):
+                stat, _, weight = part.partition("=")
+                if stat not in names:
+                    raise ValueError(f"unknown stat {stat!r} in player model {spec!r}")
+                self.weights.append((names[stat], float(weight or 1)))
+            return
+        raise ValueError(f"unknown player model {spec!r} (random, greedy:STAT, weighted:STAT=W,...[@T])")
+
+    def score(self, step: Step, stats: List[int]) -> float:
+        return sum(weight * (step.transfer.value(n, stats[n]) - stats[n]) for n, weight in self.weights)
+
+    def pick(self, steps: List[Step], stats: List[int], rng: random.Random) -> int:
+        """Номер выбранного шага в steps"""
+        if self.kind == "random" or len(steps) == 1:
+            return rng.randrange(len(steps))
+        scores = [self.score(step, stats) for step in steps]
+        if self.kind == "greedy":
+            best = max(scores)
+            return rng.choice([n for n, score in enumerate(scores) if score == best])
+        top = max(scores)
+        weights = [math.exp((score - top) / self.temperature) for score in scores]
+        return rng.choices(range(len(steps)), weights)[0]
+
+
+def _new_tally(scene_count: int, stat_count: int) -> Dict[str, Any]:
+    return {
+        "runs": 0,
+        "outcomes": {},  # "вид|где|текст" -> число
+        "questions": {},  # "сцена[i]" -> [посещения, [выбран 0, выбран 1, ...]]
+        "scenes": [None] * scene_count  # Для каждой сцены: [входы, [суммы], [[корзины]]]
+    }
+
+
+def _merge_tally(total: Dict[str, Any], part: Dict[str, Any]) -> None:
+    total["runs"] += part["runs"]
+    for key, count in part["outcomes"].items():
+        total["outcomes"][key] = total["outcomes"].get(key, 0) + count
+    for key, (visits, picks) in part["questions"].items():
+        entry = total["questions"].setdefault(key, [0, [0] * len(picks)])
+        entry[0] += visits
+        entry[1] = [a + b for a, b in zip(entry[1], picks)]
+    for scene, entry in enumerate(part["scenes"]):
+        if entry is None:
+            continue
+        current = total["scenes"][scene]
+        if current is None:
+            total["scenes"][scene] = [entry[0], entry[1][:], [row[:] for row in entry[2]]]
+            continue
+        current[0] += entry[0]
+        current[1] = [a + b for a, b in zip(current[1], entry[1])]
+        current[2] = [[a + b for a, b in zip(row, other)] for row, other in zip(current[2], entry[2])]
+
+
+class Simulator:
+    """
+    Случайные прохождения по правилам Explorer (те же свёрнутые шаги).
+
+    Шаги каждой точки выбора один раз переводятся в план из кортежей
+    (границы характеристик в условии, (add, low, high) для каждой
+    характеристики), чтобы внутренний цикл обходился без вызовов методов.
+    Условия на предметы, флаги и действия проверяются скомпилированным
+    предикатом; эти части состояния отслеживаются, только если такие
+    условия в сценарии есть.
+    Прохождения делятся на задачи по SIMULATION_CHUNK с сидом seed + номер
+    задачи, поэтому результат не зависит от числа процессов.
+    """
+
+    def __init__(self, story: StoryGraph, stats: Mapping[str, int] = DEFAULT_STATS):
+        self.explorer = Explorer(story, stats)
+        self.story = story
+        self._plans: Dict[Cursor, List[Tuple[Any, ...]]] = {}
+        self.tracks_world = any(stat_bounds(choice.condition) is None
+                                for node in story.nodes() for choice in node.choices)
+
+    def _plan(self, question: Node) -> List[Tuple[Any, ...]]:
+        """(номер выбора, условия, шаг, входы в сцены, исход, реплика) для каждого выбора"""
+        plan = self._plans.get(question.cursor)
+        if plan is not None:
+            return plan
+        plan = self._plans[question.cursor] = []
+        names = self.explorer.names
+        for number, step in enumerate(self.explorer.steps(question)):
+            bounds = stat_bounds(step.choice.condition)
+            if bounds is None:
+                condition = compile_predicate(step.choice.condition)
+            else:
+                condition = self._numbered(bounds, names)
+                if condition is None:
+                    continue
+            entries = tuple((scene, prefix.stats) for scene, prefix in step.entries)
+            plan.append((number, condition, step.transfer.stats, entries, step.outcome, step.node, step))
+        return plan
+
+    @staticmethod
+    def _numbered(bounds, names: Mapping[str, int]) -> Optional[Tuple[Tuple[int, float, float], ...]]:
+        """Границы характеристик по номерам; None, если выбор никогда не доступен"""
+        numbered = []
+        for stat, low, high in bounds:
+            low = -math.inf if low is None else low
+            high = math.inf if high is None else high
+            if stat in names:
+                numbered.append((names[stat], low, high))
+            elif not low <= 0 <= high:
+                return None  # Неизвестная характеристика равна 0
+        return tuple(numbered)
+
+    def _available(self, plan: List[Tuple[Any, ...]], stats: List[int], world: Tuple[Any, ...]) -> List[Tuple]:
+        """Доступные варианты плана, когда в условиях есть не только характеристики"""
+        available = []
+        view = None
+        for option in plan:
+            condition = option[1]
+            if type(condition) is tuple:
+                if all(low <= stats[n] <= high for n, low, high in condition):
+                    available.append(option)
+                continue
+            if view is None:
+                view = StateView(dict(zip(self.explorer.stat_names, stats)), *world)
+            if condition(view):
+                available.append(option)
+        return available
+
+    def run(self, model: PlayerModel, runs: int, seed: int, start: str = START_SCENE) -> Dict[str, Any]:
+        """Проигрывает runs прохождений одним генератором случайных чисел"""
+        story = self.story
+        cursor = story.locate(start)
+        if cursor is None:
+            raise ValueError(f"start scene {start!r} not found")
+        first = self.explorer.segment(story.node(cursor))
+        first_entries = tuple((scene, prefix.stats) for scene, prefix in first.entries)
+        tracks_world = self.tracks_world
+        count = len(self.explorer.stat_names)
+        initial = [low for low, _ in self.explorer.initial.stats]
+        tally = _new_tally(len(story), count)
+        outcomes, scenes = tally["outcomes"], tally["scenes"]
+        questions: Dict[Cursor, List[Any]] = {}
+        rng = random.Random(seed)
+        randrange = rng.randrange
+        uniform = model.kind == "random"
+
+        def enter(entries, stats: List[int]) -> None:
+            for scene, clamp in entries:
+                entry = scenes[scene]
+                if entry is None:
+                    entry = scenes[scene] = [0, [0] * count, [[0] * HISTOGRAM_BINS for _ in range(count)]]
+                entry[0] += 1
+                sums, bins = entry[1], entry[2]
+                for n, (add, low, high) in enumerate(clamp):
+                    value = max(low, min(high, stats[n] + add))
+                    sums[n] += value
+                    bins[n][value * (HISTOGRAM_BINS - 1) // STAT_MAX] += 1
+
+        for _ in range(runs):
+            stats = initial
+            if first_entries:
+                enter(first_entries, stats)
+            stats = [max(low, min(high, value + add)) for value, (add, low, high) in zip(stats, first.transfer.stats)]
+            if tracks_world:
+                items, flags, actions = set(first.transfer.added), dict(first.transfer.flags), set(first.transfer.actions)
+            kind, node = first.outcome, first.node
+            decisions = 0
+            while kind == Explorer.CHOICE:
+                decisions += 1
+                if decisions > MAX_DECISIONS:
+                    kind = Explorer.LOOP
+                    break
+                plan = self._plans.get(node.cursor) or self._plan(node)
+                if tracks_world:
+                    available = self._available(plan, stats, (items, flags, actions))
+                else:
+                    available = [option for option in plan
+                                 if all(low <= stats[n] <= high for n, low, high in option[1])]
+                if not available:
+                    kind = Explorer.NO_CHOICE
+                    break
+                if uniform:
+                    option = available[randrange(len(available))]
+                else:
+                    option = available[model.pick([option[6] for option in available], stats, rng)]
+                number, _, clamp, entries, kind, following, _ = option
+                entry = questions.get(node.cursor)
+                if entry is None:
+                    entry = questions[node.cursor] = [0, [0] * len(node.choices)]
+                entry[0] += 1
+                entry[1][number] += 1
+                if entries:
+                    enter(entries, stats)
+                stats = [max(low, min(high, value + add)) for value, (add, low, high) in zip(stats, clamp)]
+                if tracks_world:
+                    transfer = option[6].transfer
+                    items -= transfer.removed
+                    items |= transfer.added
+                    flags.update(transfer.flags)
+                    actions |= transfer.actions
+                node = following
+            text = story.text(node.ending) if kind == Explorer.ENDING else ""
+            key = f"{kind}|{story.scene_id(node.scene)}[{node.index}]|{text}"
+            outcomes[key] = outcomes.get(key, 0) + 1
+        tally["questions"] = {f"{story.scene_id(scene)}[{index}]": entry for (scene, index), entry in questions.items()}
+        tally["runs"] = runs
+        return tally
+
+
+_worker_simulators: Dict[Tuple[str, str, Tuple[Tuple[str, int], ...]], Simulator] = {}
+
+
+def _simulate_chunk(task: Tuple[str, str, Tuple[Tuple[str, int], ...], str, str, int, int]) -> Dict[str, Any]:
+    """Задача пула процессов: сценарий компилируется один раз на процесс"""
+    path, language, stats, start, spec, runs, seed = task
+    simulator = _worker_simulators.get((path, language, stats))
+    if simulator is None:
+        simulator = _worker_simulators[(path, language, stats)] = Simulator(StoryGraph.load(path, language),
+                                                                            dict(stats))
+    return simulator.run(PlayerModel(spec, simulator.explorer.names), runs, seed, start)
+
+
+def simulate(path: str, runs: int, model: str = "random", seed: int = 0, language: str = "ru",
+             start: str = START_SCENE, stats: Mapping[str, int] = DEFAULT_STATS,
+             workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Проигрывает runs прохождений на пуле процессов и сводит результаты.
+
+    :param workers: Число процессов (по умолчанию - по числу ядер; 1 - без пула)
+    """
+    story = StoryGraph.load(path, language)
+    PlayerModel(model, {name: n for n, name in enumerate(stats)})  # Проверка модели до запуска пула
+    frozen = tuple(stats.items())
+    tasks = [(str(path), language, frozen, start, model, min(SIMULATION_CHUNK, runs - offset), seed + number)
+             for number, offset in enumerate(range(0, runs, SIMULATION_CHUNK))]
+    workers = workers or os.cpu_count() or 1
+    total = _new_tally(len(story), len(stats))
+    if workers == 1 or len(tasks) == 1:
+        parts = map(_simulate_chunk, tasks)
+        for part in parts:
+            _merge_tally(total, part)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(_simulate_chunk, tasks):
+                _merge_tally(total, part)
+
+    stat_names = tuple(stats)
+    scenes = {}
+    for scene, entry in enumerate(total["scenes"]):
+        if entry is None:
+            continue
+        entries, sums, bins = entry
+        scenes[story.scene_id(scene)] = {
+            "entries": entries,
+            "stats": {name: {"mean": value / entries, "histogram": row}
+                      for name, value, row in zip(stat_names, sums, bins)}
+        }
+    questions = {}
+    for where, (visits, picks) in total["questions"].items():
+        scene_id, _, index = where.rstrip("]").partition("[")
+        node = story.node(story.locate(scene_id, int(index)))
+        questions[where] = {"question": story.text(node.text), "visits": visits,
+                            "choices": [{"text": story.text(choice.text), "picked": count, "rate": count / visits}
+                                        for choice, count in zip(node.choices, picks)]}
+    outcomes = []
+    for key, count in sorted(total["outcomes"].items(), key=lambda item: -item[1]):
+        kind, where, text = key.split("|", 2)
+        outcomes.append({"kind": kind, "where": where, "ending": text or None, "count": count,
+                         "rate": count / total["runs"]})
+    return {"runs": total["runs"], "model": model, "seed": seed, "workers": workers,
+            "outcomes": outcomes, "scenes": scenes, "questions": questions}
+
+
+def format_simulation(result: Dict[str, Any]) -> str:
+    """Текстовый отчёт симуляции для консоли"""
+    lines = [f"{result['runs']} playthroughs, model {result['model']}, seed {result['seed']}"]
+    lines.append("Outcomes:")
+    for outcome in result["outcomes"]:
+        title = f"{outcome['kind']} at {outcome['where']}"
+        if outcome["ending"]:
+            title += f": {outcome['ending']}"
+        lines.append(f"  {outcome['rate']:7.2%}  {title}")
+    lines.append("Choices:")
+    for where, question in result["questions"].items():
+        lines.append(f"  {where} ({question['visits']} visits) {question['question'][:50]}")
+        for choice in question["choices"]:
+            lines.append(f"    {choice['rate']:7.2%}  {choice['text']}")
+    lines.append("Stats on scene entry (mean, histogram by tens):")
+    for scene_id, scene in result["scenes"].items():
+        lines.append(f"  {scene_id} ({scene['entries']} entries)")
+        for name, stat in scene["stats"].items():
+            bins = " ".join(f"{count * 100 // scene['entries']:3d}" for count in stat["histogram"])
+            lines.append(f"    {name:>10} {stat['mean']:6.1f}  [{bins}]%")
+    return "\n".join(lines)
+
+
+def _initial_stats(overrides: List[str]) -> Dict[str, int]:
+    """DEFAULT_STATS с заменами вида ИМЯ=ЗНАЧЕНИЕ из командной строки"""
+    stats = dict(DEFAULT_STATS)
+    for override in overrides:
+        name, _, value = override.partition("=")
+        stats[name] = int(value)
+    return stats
+
+
+def _analyze_command(args: argparse.Namespace) -> int:
+    with open(args.story, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    report = analyze(data, args.language, args.start, Path(args.story).parent)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+    return 1 if report["dangling_targets"] else 0
+
+
+def _explore_command(args: argparse.Namespace) -> int:
+    story = StoryGraph.load(args.story, args.language)
+    result = Explorer(story, _initial_stats(args.stat)).explore(args.start, args.max_states)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(format_exploration(result))
+    return 0
+
+
+def _simulate_command(args: argparse.Namespace) -> int:
+    result = simulate(args.story, args.runs, args.model, args.seed, args.language, args.start,
+                      _initial_stats(args.stat), args.workers)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(format_simulation(result))
+    return 0
+
+
+def _convert_command(args: argparse.Namespace) -> int:
+    with open(args.story, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    problems = validate_story(data)
+    if problems:
+        raise StoryError(problems)
+    if is_document(data):
+        raise ValueError(f"{args.story} is already in format {data['format']}")
+    document, warnings = convert_story(data, args.base)
+
+    output = Path(args.output)
+    if not args.inline:
+        for language, table in document["strings"].items():
+            name = f"{output.stem}.{language}.json"
+            with open(output.parent / name, 'w', encoding='utf-8') as f:
+                json.dump(table, f, ensure_ascii=False, indent=2)
+            document["strings"][language] = name
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=2)
+
+    print(f"{output}: {len(document['scenes'])} scenes, languages: {', '.join(document['strings'])} "
+          f"(base: {document['base']})")
+    for warning in warnings:
+        print(f"  {warning}")
+    return 1 if warnings else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="story_tools", description="Story script tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("analyze", help="static checks of the story graph")
+    command.add_argument("story", nargs="?", default="story.json")
+    command.add_argument("--language", default="ru")
+    command.add_argument("--start", default=START_SCENE, help="scene the story starts from")
+    command.add_argument("--json", action="store_true", help="print the report as JSON")
+    command.set_defaults(handler=_analyze_command)
+
+    command = commands.add_parser("explore", help="enumerate every reachable ending with its stat ranges")
+    command.add_argument("story", nargs="?", default="story.json")
+    command.add_argument("--language", default="ru")
+    command.add_argument("--start", default=START_SCENE, help="scene the story starts from")
+    command.add_argument("--stat", action="append", default=[], metavar="NAME=VALUE",
+                         help="override an initial stat (repeatable)")
+    command.add_argument("--max-states", type=int, default=1_000_000,
+                         help="stop after this many distinct choice states")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+    command.set_defaults(handler=_explore_command)
+
+    command = commands.add_parser("simulate", help="Monte Carlo playthroughs for balancing")
+    command.add_argument("story", nargs="?", default="story.json")
+    command.add_argument("--language", default="ru")
+    command.add_argument("--start", default=START_SCENE, help="scene the story starts from")
+    command.add_argument("--stat", action="append", default=[], metavar="NAME=VALUE",
+                         help="override an initial stat (repeatable)")
+    command.add_argument("--runs", type=int, default=100_000)
+    command.add_argument("--model", default="random",
+                         help="random | greedy:STAT | weighted:STAT=W,STAT=W[@TEMPERATURE]")
+    command.add_argument("--seed", type=int, default=0)
+    command.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    command.add_argument("--json", action="store_true", help="print the result as JSON")
+    command.set_defaults(handler=_simulate_command)
+
+    command = commands.add_parser("convert", help="convert a per-language story to shared structure + string tables")
+    command.add_argument("story", nargs="?", default="story.json")
+    command.add_argument("-o", "--output", required=True, help="story file to write (format 2)")
+    command.add_argument("--base", default=None, help="language the structure is taken from (default: first)")
+    command.add_argument("--inline", action="store_true", help="keep string tables inside the story file")
+    command.set_defaults(handler=_convert_command)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
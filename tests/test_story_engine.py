@@ -0,0 +1,339 @@
+"""Регрессионные проверки StoryEngine на маленьком сценарии"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from story_engine import (DialogBacklog, EffectLog, ReadLines, Snapshot, SnapshotStore, StateChange, StoryEngine,
+                          StoryState, snapshot_changes)
+from story_graph import StoryGraph
+
+STORY = {
+    "start": {"ru": [
+        {"text": "Начало"},
+        {"text": "Куда?", "choices": [
+            {"text": "Туда", "next_scene": "there", "change_stats": {"Отвага": 10}},
+            {"text": "Сюда", "next_scene": "there"},
+        ]},
+    ]},
+    "there": {"ru": [
+        {"text": "Первая", "change_stats": {"ПТСР": 10}},
+        {"text": "Вторая", "change_stats": {"ПТСР": 5}},
+        {"text": "Третья"},
+    ]},
+}
+
+ROAD = {
+    "road": {"ru": [
+        *({"text": f"Шаг {i}", "change_stats": {"Отвага": 1}} for i in range(6)),
+        {"text": "Развилка", "choices": [
+            {"text": "Взять", "add_item": "Фляга", "set_flag": ["развилка", "взял"]},
+            {"text": "Пройти", "unlock_action": "Свист"},
+        ]},
+        *({"text": f"Дальше {i}", "change_stats": {"ПТСР": 1}} for i in range(6)),
+    ]},
+}
+
+
+def values(state):
+    """Снимок состояния без позиции (её журнал не ведёт)"""
+    snapshot = state.snapshot()
+    del snapshot["position"]
+    return snapshot
+
+
+def replayed(engine):
+    """Состояние, полученное повтором всего журнала на свежем состоянии"""
+    state = StoryState()
+    for change in engine.log.since(0):
+        EffectLog.perform(state, change)
+    return values(state)
+
+
+class ChooseTest(unittest.TestCase):
+    def setUp(self):
+        self.state = StoryState()
+        self.engine = StoryEngine(StoryGraph.compile(STORY), self.state)
+        self.engine.start("start")
+        self.engine.advance()
+
+    def test_question_is_recorded_once(self):
+        engine = self.engine
+        question = engine.node
+        self.assertTrue(engine.choose(engine.available_choices()[0]))
+        entries = [engine.backlog[i] for i in range(len(engine.backlog))]
+        self.assertEqual([kind for _, kind in entries],
+                         [DialogBacklog.LINE, DialogBacklog.LINE, DialogBacklog.CHOICE])
+        self.assertEqual(sum(1 for node, _ in entries if node is question), 1)
+
+    def test_choose_back_choose_advance(self):
+        engine, state = self.engine, self.state
+        engine.choose(engine.available_choices()[0])
+        stats = dict(state.stats)
+        seq = engine.log.seq
+
+        # Назад через сделанный выбор не ходят, выбрать второй раз нельзя
+        self.assertFalse(engine.can_go_back())
+        self.assertFalse(engine.back())
+        self.assertFalse(engine.waiting_for_choice)
+        self.assertEqual(state.stats, stats)
+        self.assertEqual(engine.log.seq, seq)
+
+        first = engine.node
+        self.assertTrue(engine.advance())
+        self.assertIsNot(engine.node, first)
+        self.assertEqual(state.stats["Отвага"], 70)
+        self.assertEqual(state.stats["ПТСР"], 45)
+        self.assertEqual(engine.line, 3)
+
+        # Шаг назад откатывает только эффекты второй реплики, повтор возвращает их
+        self.assertTrue(engine.back())
+        self.assertIs(engine.node, first)
+        self.assertEqual(state.stats["ПТСР"], 40)
+        self.assertTrue(engine.advance())
+        self.assertEqual(state.stats["ПТСР"], 45)
+        self.assertEqual(engine.line, 3)
+
+        # Журнал повторяется на свежем состоянии в то же, что получилось при игре
+        replayed = StoryState()
+        for change in engine.log.since(0):
+            EffectLog.perform(replayed, change)
+        self.assertEqual(replayed.stats, state.stats)
+
+
+class RebindTest(unittest.TestCase):
+    def test_cursor_follows_line_id(self):
+        state = StoryState()
+        engine = StoryEngine(StoryGraph.compile(STORY), state)
+        engine.start("there")
+        engine.advance()
+        current = engine.node
+
+        # Вставленная выше реплика не должна сдвинуть игрока на соседнюю
+        edited = {**STORY, "there": {"ru": [{"text": "Вставка"}, *STORY["there"]["ru"]]}}
+        self.assertTrue(engine.rebind(StoryGraph.compile(edited)))
+        self.assertEqual(engine.node.text, current.text)
+        self.assertEqual(engine.node.index, 2)
+        self.assertEqual(state.get_story_position(), ("there", 2))
+        self.assertEqual([engine.backlog[i][0].index for i in range(len(engine.backlog))], [1])
+
+    def test_edited_line_keeps_index(self):
+        state = StoryState()
+        engine = StoryEngine(StoryGraph.compile(STORY), state)
+        engine.start("there")
+        engine.advance()
+
+        # В старом формате правка текста меняет идентификатор строки
+        lines = [dict(line) for line in STORY["there"]["ru"]]
+        lines[0]["text"] = "Первая, исправленная"
+        lines[1]["text"] = "Вторая, исправленная"
+        edited = {**STORY, "there": {"ru": lines}}
+        self.assertTrue(engine.rebind(StoryGraph.compile(edited)))
+        self.assertEqual(engine.node.index, 1)
+        self.assertEqual(engine.story.text(engine.node.text), "Вторая, исправленная")
+        self.assertEqual(state.get_story_position(), ("there", 1))
+        self.assertEqual([engine.backlog[i][0].index for i in range(len(engine.backlog))], [0])
+
+
+class ReadLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.story = StoryGraph.compile(STORY)
+        self.read = ReadLines()
+        for scene_id, index in (("start", 0), ("there", 0), ("there", 2)):
+            self.read.add(scene_id, index)
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_save_load_round_trip(self):
+        self.read.save(self.path, self.story)
+        self.assertEqual(self.read.unsaved, 0)
+        loaded = ReadLines()
+        self.assertTrue(loaded.load(self.path, self.story))
+        self.assertEqual(len(loaded), 3)
+        self.assertIn(("there", 2), loaded)
+        self.assertNotIn(("there", 1), loaded)
+        self.assertEqual(loaded.unsaved, 0)
+
+    def test_edited_scene_is_not_loaded(self):
+        self.read.save(self.path, self.story)
+        edited = {**STORY, "there": {"ru": [{"text": "Вставка"}, *STORY["there"]["ru"]]}}
+        loaded = ReadLines()
+        self.assertTrue(loaded.load(self.path, StoryGraph.compile(edited)))
+        self.assertIn(("start", 0), loaded)
+        self.assertEqual(len(loaded), 1)
+
+    def test_remap_follows_line_ids(self):
+        edited = {**STORY, "there": {"ru": [{"text": "Вставка"}, *STORY["there"]["ru"][1:]]}}
+        self.read.remap(self.story, StoryGraph.compile(edited))
+        # "Первая" удалена, "Третья" сохранила идентификатор и номер, вставка не прочитана
+        self.assertEqual(len(self.read), 2)
+        self.assertIn(("start", 0), self.read)
+        self.assertIn(("there", 2), self.read)
+        self.assertNotIn(("there", 0), self.read)
+
+    def test_legacy_script_file_stays_small(self):
+        # Идентификаторы реплик старого формата - хеши, в файл они не пишутся
+        story = StoryGraph.compile({f"scene_{number}": {"ru": [{"text": f"Реплика {number}.{index}"}
+                                                               for index in range(100)]}
+                                    for number in range(1000)})
+        read = ReadLines()
+        for node in story.nodes():
+            read.add(story.scene_id(node.scene), node.index)
+        read.save(self.path, story)
+        self.assertLess(os.path.getsize(self.path), 64 * 1024)
+        loaded = ReadLines()
+        self.assertTrue(loaded.load(self.path, story))
+        self.assertEqual(len(loaded), 100000)
+
+
+class RewindTest(unittest.TestCase):
+    def setUp(self):
+        self.state = StoryState()
+        self.engine = StoryEngine(StoryGraph.compile(ROAD), self.state)
+        self.engine.snapshot_interval = 4
+        self.seen = {}
+        self.engine.start("road")
+        self.remember()
+        self.play(6)
+        self.engine.choose(self.engine.available_choices()[0])
+        self.remember()
+        self.play(3)
+
+    def remember(self):
+        self.seen[self.engine.line] = values(self.state)
+
+    def play(self, steps):
+        for _ in range(steps):
+            self.assertTrue(self.engine.advance())
+            self.remember()
+
+    def test_rewind_through_choice_uses_snapshot(self):
+        engine, state = self.engine, self.state
+        self.assertEqual(engine.line, 10)
+        # Выбор закрыл откат по журналу: состояние собирается из снимка реплики 0 и повтора до реплики 2
+        self.assertFalse(engine.log.can_rewind(engine._line_marks[2]))
+        self.assertTrue(engine.rewind_to(2))
+        self.assertEqual(engine.story.text(engine.node.text), "Шаг 2")
+        self.assertEqual(values(state), self.seen[2])
+        self.assertEqual(state.get_story_position(), ("road", 2))
+        self.assertTrue(all(engine.backlog.mark(i) < 2 for i in range(len(engine.backlog))))
+        self.assertEqual(replayed(engine), values(state))
+
+        # Дальше история идёт заново, с другим выбором
+        self.play(4)
+        engine.choose(engine.available_choices()[1])
+        self.assertNotIn("Фляга", state.get_inventory())
+        self.assertIsNone(state.get_story_flag("развилка"))
+        self.assertIn("Свист", state.get_available_actions())
+        self.assertEqual(replayed(engine), values(state))
+
+    def test_rewind_within_journal(self):
+        engine, state = self.engine, self.state
+        self.assertTrue(engine.rewind_to(8))
+        self.assertEqual(values(state), self.seen[8])
+        self.assertEqual(replayed(engine), values(state))
+        self.assertTrue(engine.advance())
+        self.assertEqual(values(state), self.seen[9])
+
+    def test_rewind_rejects_unknown_lines(self):
+        self.assertFalse(self.engine.rewind_to(10))
+        self.assertFalse(self.engine.rewind_to(-1))
+
+
+class SnapshotStoreTest(unittest.TestCase):
+    def test_thinning_keeps_first_and_recent(self):
+        store = SnapshotStore(capacity=4)
+        for line in range(10):
+            store.add(Snapshot(line, line, {}))
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.before(0).line, 0)
+        self.assertEqual(store.before(9).line, 9)
+        self.assertEqual(store.before(8).line, 8)
+        self.assertLessEqual(store.before(5).line, 5)
+
+    def test_add_replaces_later_lines(self):
+        store = SnapshotStore()
+        for line in (0, 3, 6):
+            store.add(Snapshot(line, line * 10, {}))
+        store.add(Snapshot(4, 40, {}))
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.before(10), Snapshot(4, 40, {}))
+        self.assertEqual(store.before(3).line, 3)
+        store.truncate(2)
+        self.assertEqual(store.before(10).line, 0)
+        self.assertIsNone(store.before(-1))
+
+
+class TransitionTest(unittest.TestCase):
+    def test_transition_reaches_target_and_is_journaled(self):
+        before = StoryState()
+        before.add_to_inventory("Лампа")
+        before.unlock_action("Щелчок")
+        before.set_story_flag("дверь", "открыта")
+        after = StoryState()
+        after.update_character_stat("Отвага", -20)
+        after.remove_from_inventory("Кинжал")
+        after.add_to_inventory("Кинжал", 0)
+        after.unlock_action("Свист")
+        after.set_story_flag("мост")
+
+        self.assertEqual(snapshot_changes(before.snapshot(), before.snapshot()), [])
+        state = StoryState()
+        state.restore(before.snapshot())
+        log = EffectLog()
+        log.transition(state, before.snapshot(), after.snapshot())
+        self.assertEqual(values(state), values(after))
+
+        # Журнал переводит прежнее состояние в новое, а откатить переход нельзя
+        again = StoryState()
+        again.restore(before.snapshot())
+        for change in log.since(0):
+            EffectLog.perform(again, change)
+        self.assertEqual(values(again), values(after))
+        self.assertEqual(log.rewind(state, log.mark), [])
+        self.assertEqual(values(state), values(after))
+
+
+class SaveTest(unittest.TestCase):
+    def test_incremental_save_round_trip(self):
+        story = StoryGraph.compile(ROAD)
+        state = StoryState()
+        engine = StoryEngine(story, state)
+        engine.start("road")
+        for _ in range(3):
+            engine.advance()
+        full = json.loads(json.dumps(engine.save()))
+        for _ in range(3):
+            engine.advance()
+        engine.choose(engine.available_choices()[0])
+        engine.advance()
+        changes = json.loads(json.dumps(engine.save_changes(full["seq"])))
+
+        self.assertEqual(changes["seq"], engine.log.seq)
+        self.assertEqual([StateChange(*change) for change in changes["changes"]], engine.log.since(full["seq"]))
+        restored = StoryState()
+        other = StoryEngine(story, restored)
+        self.assertTrue(other.load(full))
+        self.assertEqual(other.position(), ("road", 3))
+        self.assertTrue(other.load_changes(changes))
+        self.assertEqual(values(restored), values(state))
+        self.assertEqual(other.position(), engine.position())
+        self.assertEqual(restored.get_story_position(), state.get_story_position())
+        self.assertEqual(other.node, engine.node)
+
+
+class StateViewTest(unittest.TestCase):
+    def test_completed_actions_stay_visible(self):
+        state = StoryState()
+        state.unlock_action("Щелчок")
+        self.assertTrue(state.complete_action("Щелчок"))
+        self.assertEqual(state.get_available_actions(), [])
+        self.assertIn("Щелчок", state.state_view().actions)
+
+
+if __name__ == "__main__":
+    unittest.main()